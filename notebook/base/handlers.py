@@ -565,7 +565,7 @@ class APIHandler(IPythonHandler):
 
     def options(self, *args, **kwargs):
         self.set_header('Access-Control-Allow-Headers',
-                        'accept, content-type, authorization, x-xsrftoken')
+                        'accept, content-type, authorization, x-xsrftoken, if-match')
         self.set_header('Access-Control-Allow-Methods',
                         'GET, PUT, POST, PATCH, DELETE, OPTIONS')
 
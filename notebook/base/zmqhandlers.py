@@ -19,12 +19,25 @@ import tornado
 from tornado import gen, ioloop, web
 from tornado.websocket import WebSocketHandler
 
-from jupyter_client.session import Session
+from jupyter_client import protocol_version_info
+from jupyter_client.session import Session, json_unpacker
 from jupyter_client.jsonutil import date_default, extract_dates
 from ipython_genutils.py3compat import cast_unicode
 
+try:
+    from hmac import compare_digest
+except ImportError: # Python < 2.7.7
+    def compare_digest(a, b):
+        return a == b
+
 from .handlers import IPythonHandler
 
+# The 'min_size' compression option relies on tornado compressing
+# each websocket frame only when the private `_compressor` attribute
+# of the connection is set, as tornado 4.0 to 6.x do.
+# With other versions, it is ignored and all messages are compressed.
+_skip_compression_supported = (4, 0) <= tornado.version_info < (7, 0)
+
 def serialize_binary_message(msg):
     """serialize a message as a binary blob
 
@@ -75,15 +88,215 @@ def deserialize_binary_message(bmsg):
     nbufs = struct.unpack('!i', bmsg[:4])[0]
     offsets = list(struct.unpack('!' + 'I' * nbufs, bmsg[4:4*(nbufs+1)]))
     offsets.append(None)
+    # slice buffers without copying them
+    view = memoryview(bmsg)
     bufs = []
     for start, stop in zip(offsets[:-1], offsets[1:]):
-        bufs.append(bmsg[start:stop])
-    msg = json.loads(bufs[0].decode('utf8'))
+        bufs.append(view[start:stop])
+    msg = json.loads(bufs[0].tobytes().decode('utf8'))
     msg['header'] = extract_dates(msg['header'])
     msg['parent_header'] = extract_dates(msg['parent_header'])
     msg['buffers'] = bufs[1:]
     return msg
 
+
+# The websocket subprotocol of kernel messages in binary frames
+KERNEL_WS_PROTOCOL_V1 = 'v1.kernel.websocket.jupyter.org'
+
+
+def serialize_msg_to_ws_v1(msg_list, channel):
+    """Serialize a message in a binary frame, for the v1 kernel websocket protocol
+
+    Header:
+
+    8 bytes: number of offsets (n) as little-endian 64b int
+    8 * n bytes: offsets of the channel and each part, and the end,
+    as little-endian 64b ints
+
+    followed by the channel name, the JSON of the header, parent_header,
+    metadata and content, and the buffers.
+
+    Parameters
+    ----------
+    msg_list : list of bytes
+      The parts of the message, as received from the kernel:
+      [header, parent_header, metadata, content, buffer1, ...].
+    channel : str
+    """
+    channel = channel.encode('utf8')
+    offsets = [8 * (1 + 1 + len(msg_list) + 1)]
+    offsets.append(offsets[-1] + len(channel))
+    for part in msg_list:
+        offsets.append(offsets[-1] + len(part))
+    header = struct.pack('<%iQ' % (len(offsets) + 1), len(offsets), *offsets)
+    return b''.join([header, channel] + list(msg_list))
+
+
+def deserialize_msg_from_ws_v1(ws_msg):
+    """Deserialize a binary frame of the v1 kernel websocket protocol
+
+    The parts of the message are memoryviews of the frame, not copies.
+
+    Returns
+    -------
+    (channel, msg_list): the channel name, and the parts of the message,
+    [header, parent_header, metadata, content, buffer1, ...].
+    """
+    n = struct.unpack_from('<Q', ws_msg)[0]
+    offsets = struct.unpack_from('<%iQ' % n, ws_msg, 8)
+    view = memoryview(ws_msg)
+    channel = view[offsets[0]:offsets[1]].tobytes().decode('utf8')
+    msg_list = [view[start:stop] for start, stop in zip(offsets[1:-1], offsets[2:])]
+    return channel, msg_list
+
+
+class RawMessage(object):
+    """A message from a kernel, with only its header parsed
+
+    The other parts of the message are kept as the JSON sent by the kernel,
+    so that they can be sent to the websocket without being parsed
+    and serialized again, by `serialize_raw_message`.
+    They are only parsed when accessed, like the parts of a message dict.
+
+    Parameters
+    ----------
+    header : dict
+        The parsed header.
+    frames : list of bytes
+        The JSON of the header, parent_header, metadata and content,
+        followed by the buffers.
+    unpack : callable
+        Parses the JSON parts.
+    """
+
+    _parts = ('header', 'parent_header', 'metadata', 'content')
+
+    def __init__(self, header, frames, unpack=json_unpacker):
+        self.frames = frames
+        self._unpack = unpack
+        self._parsed = {'header': header}
+        # (channel, subprotocol): (payload, binary),
+        # shared by the handlers it is sent to
+        self._serialized = {}
+
+    def __getitem__(self, key):
+        if key in ('msg_id', 'msg_type'):
+            return self._parsed['header'][key]
+        elif key == 'buffers':
+            return self.frames[4:]
+        elif key not in self._parts:
+            raise KeyError(key)
+        if key not in self._parsed:
+            self._parsed[key] = self._unpack(self.frames[self._parts.index(key)])
+        return self._parsed[key]
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self['msg_type'])
+
+
+def deserialize_header(session, msg_list):
+    """Parse the header of a message from a kernel, checking its signature
+
+    Checks the signature like `Session.deserialize`, before parsing the header,
+    but only parses the header.
+
+    Returns a RawMessage, or None if the message must be deserialized
+    with `Session.deserialize` instead: if its parts aren't JSON,
+    or if it needs adapting to the current version of the protocol.
+    In that case, the signature is recorded by `Session.deserialize`.
+
+    Parameters
+    ----------
+    session : Session
+    msg_list : list of bytes
+        The parts of the message after the identities:
+        [HMAC, header, parent_header, metadata, content, buffer1, ...].
+    """
+    minlen = 5
+    if session.unpack is not json_unpacker or len(msg_list) < minlen:
+        return None
+    signature = None
+    if session.auth is not None:
+        signature = msg_list[0]
+        if not signature:
+            raise ValueError("Unsigned Message")
+        if signature in session.digest_history:
+            raise ValueError("Duplicate Signature: %r" % signature)
+        check = session.sign(msg_list[1:5])
+        if not compare_digest(signature, check):
+            raise ValueError("Invalid Signature: %r" % signature)
+    header = session.unpack(msg_list[1])
+    version = header.get('version', '')
+    if 'date' not in header or version.split('.')[0] != str(protocol_version_info[0]):
+        return None
+    if signature is not None:
+        session._add_digest(signature)
+    return RawMessage(header, msg_list[1:], session.unpack)
+
+
+def message_size(msg):
+    """The size of a message from a kernel, in bytes, including its buffers
+
+    The message can be a list of bytes, as received from the zmq socket,
+    a RawMessage, or a message dict, whose content is measured as JSON.
+    """
+    if isinstance(msg, list):
+        return sum(len(f) for f in msg)
+    elif isinstance(msg, RawMessage):
+        return sum(len(f) for f in msg.frames)
+    content = json.dumps(msg['content'], default=date_default).encode('utf8')
+    return len(content) + sum(len(b) for b in msg['buffers'])
+
+
+def serialize_raw_message(msg, channel=None, subprotocol=None):
+    """Serialize a RawMessage for the websocket, without parsing its parts
+
+    The JSON parts of the message are spliced into the JSON of the message,
+    as `json.dumps` of the message dict would write them,
+    or into a binary frame, with the v1 kernel websocket protocol.
+
+    Returns
+    -------
+    (payload, binary): the serialized message, as JSON bytes to be sent
+    as text, or as a binary message, formatted like `serialize_binary_message`,
+    if the message has buffers, or like `serialize_msg_to_ws_v1`.
+    The result is cached on the message, for each channel and subprotocol.
+    """
+    key = (channel, subprotocol)
+    if key not in msg._serialized:
+        if subprotocol == KERNEL_WS_PROTOCOL_V1:
+            msg._serialized[key] = serialize_msg_to_ws_v1(msg.frames, channel), True
+        else:
+            msg._serialized[key] = _serialize_raw_message(msg, channel)
+    return msg._serialized[key]
+
+
+def _serialize_raw_message(msg, channel):
+    header, parent_header, metadata, content = msg.frames[:4]
+    buffers = msg.frames[4:]
+    parts = [
+        b'{"header":', header,
+        b',"msg_id":', json.dumps(msg['msg_id']).encode('utf8'),
+        b',"msg_type":', json.dumps(msg['msg_type']).encode('utf8'),
+        b',"parent_header":', parent_header,
+        b',"metadata":', metadata,
+        b',"content":', content,
+    ]
+    if channel:
+        parts.extend([b',"channel":', json.dumps(channel).encode('utf8')])
+    if not buffers:
+        parts.append(b',"buffers":[]}')
+        return b''.join(parts), False
+    parts.append(b'}')
+    bmsg = b''.join(parts)
+    nbufs = len(buffers) + 1
+    offsets = [4 * (nbufs + 1), 4 * (nbufs + 1) + len(bmsg)]
+    for buf in buffers[:-1]:
+        offsets.append(offsets[-1] + len(buf))
+    offsets_buf = struct.pack('!' + 'I' * (nbufs + 1), nbufs, *offsets)
+    return b''.join([offsets_buf, bmsg] + list(buffers)), True
+
+
 # ping interval for keeping websockets alive (30 seconds)
 WS_PING_INTERVAL = 30000
 
@@ -194,6 +407,41 @@ class WebSocketMixin(object):
 
 
 class ZMQStreamHandler(WebSocketMixin, WebSocketHandler):
+
+    # The websocket subprotocols supported, most preferred first
+    subprotocols = [KERNEL_WS_PROTOCOL_V1]
+
+    # The subprotocol selected by the client, if any
+    subprotocol = None
+
+    # Messages smaller than this are not compressed, see get_compression_options
+    compression_min_size = 0
+    _warned_min_size = False
+
+    def select_subprotocol(self, subprotocols):
+        for subprotocol in self.subprotocols:
+            if subprotocol in subprotocols:
+                self.subprotocol = subprotocol
+                return subprotocol
+
+    def write_message(self, message, binary=False):
+        """Write a message, compressed only if it's large enough
+
+        Compressing small messages costs more than it saves.
+        permessage-deflate lets every message choose to be compressed,
+        but tornado has no API for it: the compressor of the connection
+        is unset while small messages are written.
+        """
+        connection = self.ws_connection
+        compressor = getattr(connection, '_compressor', None)
+        if (not _skip_compression_supported or compressor is None
+                or len(message) >= self.compression_min_size):
+            return super(ZMQStreamHandler, self).write_message(message, binary=binary)
+        connection._compressor = None
+        try:
+            return super(ZMQStreamHandler, self).write_message(message, binary=binary)
+        finally:
+            connection._compressor = compressor
     
     if tornado.version_info < (4,1):
         """Backport send_error from tornado 4.1 to 4.0"""
@@ -209,7 +457,8 @@ class ZMQStreamHandler(WebSocketMixin, WebSocketHandler):
 
     
     def _reserialize_reply(self, msg_or_list, channel=None):
-        """Reserialize a reply message using JSON.
+        """Reserialize a reply message using JSON,
+        or in a binary frame with the v1 kernel websocket protocol.
 
         msg_or_list can be an already-deserialized msg dict or the zmq buffer list.
         If it is the zmq list, it will be deserialized with self.session.
@@ -225,15 +474,34 @@ class ZMQStreamHandler(WebSocketMixin, WebSocketHandler):
         else:
             idents, msg_list = self.session.feed_identities(msg_or_list)
             msg = self.session.deserialize(msg_list)
+        if self.subprotocol == KERNEL_WS_PROTOCOL_V1:
+            msg_list = [json.dumps(msg[key], default=date_default).encode('utf8')
+                for key in RawMessage._parts]
+            buffers = list(msg.get('buffers', []))
+            if sys.version_info < (3, 4):
+                buffers = [x.tobytes() for x in buffers]
+            return serialize_msg_to_ws_v1(msg_list + buffers, channel)
         if channel:
             msg['channel'] = channel
-        if msg['buffers']:
+        if msg.get('buffers'):
             buf = serialize_binary_message(msg)
             return buf
         else:
             smsg = json.dumps(msg, default=date_default)
             return cast_unicode(smsg)
 
+    def _deserialize_reply(self, msg_list):
+        """Deserialize a message from the zmq socket, as little as possible
+
+        Returns a RawMessage, with only its header parsed, if the message
+        can be sent to the websocket as is, or the deserialized message dict.
+        """
+        idents, msg_list = self.session.feed_identities(msg_list)
+        msg = deserialize_header(self.session, msg_list)
+        if msg is None:
+            msg = self.session.deserialize(msg_list)
+        return msg
+
     def _on_zmq_reply(self, stream, msg_list):
         # Sometimes this gets triggered when the on_close method is scheduled in the
         # eventloop but hasn't been called.
@@ -243,11 +511,18 @@ class ZMQStreamHandler(WebSocketMixin, WebSocketHandler):
             return
         channel = getattr(stream, 'channel', None)
         try:
-            msg = self._reserialize_reply(msg_list, channel=channel)
+            if isinstance(msg_list, list):
+                msg_list = self._deserialize_reply(msg_list)
+            if isinstance(msg_list, RawMessage):
+                msg, binary = serialize_raw_message(msg_list, channel=channel,
+                    subprotocol=self.subprotocol)
+            else:
+                msg = self._reserialize_reply(msg_list, channel=channel)
+                binary = isinstance(msg, bytes)
         except Exception:
             self.log.critical("Malformed message: %r" % msg_list, exc_info=True)
         else:
-            self.write_message(msg, binary=isinstance(msg, bytes))
+            self.write_message(msg, binary=binary)
 
 
 class AuthenticatedZMQStreamHandler(ZMQStreamHandler, IPythonHandler):
@@ -288,4 +563,13 @@ class AuthenticatedZMQStreamHandler(ZMQStreamHandler, IPythonHandler):
         self.session = Session(config=self.config)
 
     def get_compression_options(self):
-        return self.settings.get('websocket_compression_options', None)
+        options = self.settings.get('websocket_compression_options', None)
+        if options is not None and 'min_size' in options:
+            # applied by write_message, not tornado
+            options = dict(options)
+            self.compression_min_size = options.pop('min_size')
+            if not _skip_compression_supported and not ZMQStreamHandler._warned_min_size:
+                ZMQStreamHandler._warned_min_size = True
+                self.log.warning("The min_size websocket compression option "
+                    "is not supported with tornado %s", tornado.version)
+        return options
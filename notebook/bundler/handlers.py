@@ -52,7 +52,7 @@ class BundlerHandler(IPythonHandler):
             Bundler ID to use (query parameter)
         """
         bundler_id = self.get_query_argument('bundler')
-        model = self.contents_manager.get(path=url2path(path))
+        model = yield gen.maybe_future(self.contents_manager.get(path=url2path(path)))
 
         try:
             bundler = self.get_bundler(bundler_id)
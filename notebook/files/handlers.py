@@ -12,7 +12,7 @@ except ImportError: #PY2
     from base64 import decodestring as decodebytes
 
 
-from tornado import web
+from tornado import gen, web
 
 from notebook.base.handlers import IPythonHandler
 
@@ -28,9 +28,10 @@ class FilesHandler(IPythonHandler):
 
     @web.authenticated
     def head(self, path):
-        self.get(path, include_body=False)
+        return self.get(path, include_body=False)
 
     @web.authenticated
+    @gen.coroutine
     def get(self, path, include_body=True):
         cm = self.contents_manager
 
@@ -44,7 +45,7 @@ class FilesHandler(IPythonHandler):
         else:
             name = path
         
-        model = cm.get(path, type='file', content=include_body)
+        model = yield gen.maybe_future(cm.get(path, type='file', content=include_body))
         
         if self.get_argument("download", False):
             self.set_attachment_header(name)
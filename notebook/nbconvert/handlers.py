@@ -7,7 +7,7 @@ import io
 import os
 import zipfile
 
-from tornado import web, escape
+from tornado import gen, web, escape
 from tornado.log import app_log
 
 from ..base.handlers import (
@@ -78,6 +78,7 @@ class NbconvertFileHandler(IPythonHandler):
     SUPPORTED_METHODS = ('GET',)
 
     @web.authenticated
+    @gen.coroutine
     def get(self, format, path):
 
         exporter = get_exporter(format, config=self.config, log=self.log)
@@ -91,11 +92,12 @@ class NbconvertFileHandler(IPythonHandler):
         else:
             ext_resources_dir = None
 
-        model = self.contents_manager.get(path=path)
+        model = yield gen.maybe_future(self.contents_manager.get(path=path))
         name = model['name']
         if model['type'] != 'notebook':
             # not a notebook, redirect to files
-            return FilesRedirectHandler.redirect_to_files(self, path)
+            FilesRedirectHandler.redirect_to_files(self, path)
+            return
 
         nb = model['content']
 
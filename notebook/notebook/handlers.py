@@ -4,7 +4,7 @@
 # Distributed under the terms of the Modified BSD License.
 
 import os
-from tornado import web
+from tornado import gen, web
 HTTPError = web.HTTPError
 
 from ..base.handlers import (
@@ -16,6 +16,7 @@ from ..utils import url_escape
 class NotebookHandler(IPythonHandler):
 
     @web.authenticated
+    @gen.coroutine
     def get(self, path):
         """get renders the notebook template if a name is given, or 
         redirects to the '/files/' handler if the name is not given."""
@@ -24,16 +25,18 @@ class NotebookHandler(IPythonHandler):
         
         # will raise 404 on not found
         try:
-            model = cm.get(path, content=False)
+            model = yield gen.maybe_future(cm.get(path, content=False))
         except web.HTTPError as e:
             if e.status_code == 404 and 'files' in path.split('/'):
                 # 404, but '/files/' in URL, let FilesRedirect take care of it
-                return FilesRedirectHandler.redirect_to_files(self, path)
+                FilesRedirectHandler.redirect_to_files(self, path)
+                return
             else:
                 raise
         if model['type'] != 'notebook':
             # not a notebook, redirect to files
-            return FilesRedirectHandler.redirect_to_files(self, path)
+            FilesRedirectHandler.redirect_to_files(self, path)
+            return
         name = path.rsplit('/', 1)[-1]
         self.write(self.render_template('notebook.html',
             notebook_path=path,
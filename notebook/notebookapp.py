@@ -56,6 +56,7 @@ except AttributeError:
 if version_info < (4,0):
     raise ImportError(_("The Jupyter Notebook requires tornado >= 4.0, but you have %s") % tornado.version)
 
+from tornado import gen
 from tornado import httpserver
 from tornado import web
 from tornado.httputil import url_concat
@@ -237,11 +238,14 @@ class NotebookWebApplication(web.Application):
             iopub_msg_rate_limit=jupyter_app.iopub_msg_rate_limit,
             iopub_data_rate_limit=jupyter_app.iopub_data_rate_limit,
             rate_limit_window=jupyter_app.rate_limit_window,
+            iopub_coalesce_window=jupyter_app.iopub_coalesce_window,
 
             # maximum request sizes - support saving larger notebooks
             # tornado defaults are 100 MiB, we increase it to 0.5 GiB
             max_body_size = 512 * 1024 * 1024,
             max_buffer_size = 512 * 1024 * 1024,
+            # files uploaded as raw bytes are streamed to disk
+            max_raw_upload_size=jupyter_app.max_raw_upload_size,
             
             # authentication
             cookie_secret=jupyter_app.cookie_secret,
@@ -858,6 +862,9 @@ class NotebookApp(JupyterApp):
         This value will be returned from :meth:`WebSocketHandler.get_compression_options`.
         None (default) will disable compression.
         A dict (even an empty one) will enable compression.
+        Its 'min_size' key sets the size, in bytes, of the smallest messages
+        of kernels to compress. Smaller ones are sent uncompressed
+        (with tornado 4.0 to 6.x only).
 
         See the tornado docs for WebSocketHandler.get_compression_options for details.
         """)
@@ -1169,6 +1176,20 @@ class NotebookApp(JupyterApp):
     rate_limit_window = Float(3, config=True, help=_("""(sec) Time window used to 
         check the message and data rate limits."""))
 
+    iopub_coalesce_window = Float(0.03, config=True, help=_("""(sec) Time window
+        over which stream and update_display_data messages sent on iopub at a high
+        rate are coalesced into fewer messages: consecutive stream messages
+        are merged, and only the latest update of a display is sent.
+        Coalesced messages count against iopub_data_rate_limit only.
+        Set to 0 to disable coalescing."""))
+
+    max_raw_upload_size = Integer(0, config=True,
+        help=_("""(bytes) Maximum size of a file uploaded to the contents API
+        as raw bytes (Content-Type: application/octet-stream).
+        Raw uploads are streamed to disk, so they are not subject to the
+        maximum size of other requests. Set to 0 for no limit.""")
+    )
+
     shutdown_no_activity_timeout = Integer(0, config=True,
         help=("Shut down the server after N seconds with no kernels or "
               "terminals running and no activity. "
@@ -1520,7 +1541,14 @@ class NotebookApp(JupyterApp):
         n_kernels = len(self.kernel_manager.list_kernel_ids())
         kernel_msg = trans.ngettext('Shutting down %d kernel', 'Shutting down %d kernels', n_kernels)
         self.log.info(kernel_msg % n_kernels)
-        self.kernel_manager.shutdown_all()
+        # the event loop has stopped: run it until the kernels are shut down
+        ioloop.IOLoop.current().run_sync(
+            lambda: gen.maybe_future(self.kernel_manager.shutdown_all())
+        )
+
+    def cleanup_contents(self):
+        """Shutdown the contents manager, e.g. to stop its I/O threads."""
+        self.contents_manager.shutdown()
 
     def notebook_info(self):
         "Return the current working directory and the server url information"
@@ -1627,6 +1655,8 @@ class NotebookApp(JupyterApp):
             ]))
 
         self.io_loop = ioloop.IOLoop.current()
+        if hasattr(self.kernel_manager, 'fill_kernel_pool'):
+            self.io_loop.add_callback(self.kernel_manager.fill_kernel_pool)
         if sys.platform.startswith('win'):
             # add no-op to wake every 5s
             # to handle signals that may be ignored by the inner loop
@@ -1639,6 +1669,7 @@ class NotebookApp(JupyterApp):
         finally:
             self.remove_server_info_file()
             self.cleanup_kernels()
+            self.cleanup_contents()
 
     def stop(self):
         def _stop():
@@ -44,6 +44,20 @@ class APIStatusHandler(APIHandler):
             'kernels': len(kernels),
             'connections': total_connections,
         }
+        km = self.kernel_manager
+        if hasattr(km, 'buffer_stats'):
+            model['kernel_buffers'] = km.buffer_stats()
+        if hasattr(km, 'kernel_operations_stats'):
+            model['kernel_operations'] = km.kernel_operations_stats()
+        if hasattr(km, 'kernel_pool_stats'):
+            model['kernel_pool'] = km.kernel_pool_stats()
+        cm = self.contents_manager
+        if hasattr(cm, 'notebook_cache_stats'):
+            model['notebook_cache'] = cm.notebook_cache_stats()
+        if hasattr(cm, 'file_copy_stats'):
+            model['file_copy'] = cm.file_copy_stats()
+        if hasattr(cm, 'checkpoint_queue_stats'):
+            model['checkpoint_queue'] = cm.checkpoint_queue_stats()
         self.finish(json.dumps(model, sort_keys=True))
 
 default_handlers = [
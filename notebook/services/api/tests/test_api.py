@@ -30,3 +30,8 @@ class KernelAPITest(NotebookTestBase):
         assert data['last_activity'].endswith('Z')
         assert data['started'].endswith('Z')
         assert data['started'] == isoformat(self.notebook.web_app.settings['started'])
+        assert data['notebook_cache']['hits'] == 0
+        assert data['file_copy']['buffered'] == {'files': 0, 'bytes': 0}
+        assert data['kernel_buffers']['buffering'] == 0
+        assert data['kernel_pool']['idle'] == 0
+        assert data['kernel_operations']['queued'] == 0
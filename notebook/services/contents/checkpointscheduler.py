@@ -0,0 +1,105 @@
+"""
+Create checkpoints in the background, coalescing requests for the same file.
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import sys
+
+from tornado import gen
+from tornado.concurrent import Future
+
+try:
+    from tornado.concurrent import future_set_exc_info
+except ImportError:
+    # tornado < 5
+    def future_set_exc_info(future, exc_info):
+        future.set_exc_info(exc_info)
+
+
+class CheckpointScheduler(object):
+    """Schedule the creation of checkpoints, one file at a time
+
+    At most one checkpoint of a file is created at a time.
+    Requests made while it is created are coalesced into a single
+    checkpoint, created once the current one is done,
+    so that it includes all the changes made before the requests.
+
+    Must be used from the thread of the event loop.
+
+    Parameters
+    ----------
+    create : callable
+      Called with the path of a file to create a checkpoint of it.
+      Returns a Future of the checkpoint model.
+    """
+
+    def __init__(self, create):
+        self._create = create
+        # path: Future of the checkpoint being created
+        self._running = {}
+        # path: Future of the checkpoint to create next
+        self._pending = {}
+        self._stats = {'created': 0, 'coalesced': 0, 'failed': 0}
+
+    def schedule(self, path):
+        """Schedule the creation of a checkpoint of a file
+
+        Returns a Future of the checkpoint model,
+        shared with the requests it is coalesced with.
+        """
+        future = self._pending.get(path)
+        if future is not None:
+            self._stats['coalesced'] += 1
+            return future
+        future = self._pending[path] = Future()
+        if path not in self._running:
+            self._run(path)
+        return future
+
+    @gen.coroutine
+    def _run(self, path):
+        try:
+            while path in self._pending:
+                future = self._running[path] = self._pending.pop(path)
+                try:
+                    checkpoint = yield gen.maybe_future(self._create(path))
+                except Exception:
+                    self._stats['failed'] += 1
+                    future_set_exc_info(future, sys.exc_info())
+                else:
+                    self._stats['created'] += 1
+                    future.set_result(checkpoint)
+        finally:
+            self._running.pop(path, None)
+
+    @gen.coroutine
+    def flush(self, path):
+        """Wait for the checkpoints requested so far to be created,
+        of a file, or of the files in a directory
+
+        Failures are left to the requests of these checkpoints.
+        """
+        prefix = path + '/' if path else ''
+        futures = [
+            future
+            for futures in (self._running, self._pending)
+            for p, future in list(futures.items())
+            if p == path or p.startswith(prefix)
+        ]
+        for future in futures:
+            try:
+                yield future
+            except Exception:
+                pass
+
+    def stats(self):
+        """The number of checkpoints 'queued' and 'running',
+        and the numbers of checkpoints 'created', requests 'coalesced'
+        into another, and creations that 'failed'.
+        """
+        stats = dict(self._stats)
+        stats['queued'] = len(self._pending)
+        stats['running'] = len(self._running)
+        return stats
@@ -0,0 +1,490 @@
+"""
+Content-addressed Checkpoints implementations.
+
+Checkpoints are kept in a single object store below the root directory.
+Notebooks are split into blobs for their metadata, each cell without its
+outputs, and each output, stored once by the sha256 of their JSON,
+so checkpoints of a notebook share every blob that hasn't changed.
+Other files are stored as a single blob.
+
+Each file has a manifest listing its checkpoints, oldest first,
+at ``<store>/manifests/<path>/manifest.json``.
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import errno
+from hashlib import sha256
+import io
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from tornado.web import HTTPError
+
+import nbformat
+
+from .checkpoints import (
+    Checkpoints,
+    GenericCheckpointsMixin,
+)
+from .fileio import FileManagerMixin, decodebytes, encodebytes
+
+from jupyter_core.utils import ensure_dir_exists
+from ipython_genutils.py3compat import getcwd
+from traitlets import Integer, Unicode
+
+from notebook import _tz as tz
+from notebook.utils import to_os_path
+
+
+def dumps_blob(obj):
+    """Serialize a part of a notebook to canonical JSON bytes"""
+    return json.dumps(
+        obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False,
+    ).encode('utf-8')
+
+
+def loads_blob(data):
+    return json.loads(data.decode('utf-8'))
+
+
+class ContentCheckpoints(FileManagerMixin, Checkpoints):
+    """
+    A Checkpoints that keeps many checkpoints per file,
+    deduplicated in a content-addressed object store.
+
+    Only works with FileContentsManager.  Use GenericContentCheckpoints if
+    you want content-addressed checkpoints with another ContentsManager.
+    """
+
+    store_dir = Unicode(
+        '.ipynb_checkpoint_store',
+        config=True,
+        help="""The directory in which to keep the checkpoint store
+
+        This is a path relative to root_dir.
+        """,
+    )
+
+    max_checkpoints = Integer(
+        10,
+        config=True,
+        help="""The maximum number of checkpoints to keep for a file
+
+        Creating a checkpoint removes the oldest ones beyond this number.
+        0 means no limit.
+        """,
+    )
+
+    root_dir = Unicode(config=True)
+
+    def _root_dir_default(self):
+        try:
+            return self.parent.root_dir
+        except AttributeError:
+            return getcwd()
+
+    def __init__(self, **kwargs):
+        super(ContentCheckpoints, self).__init__(**kwargs)
+        # guards blobs between being found in the store and being referenced
+        # by a manifest, against garbage collection
+        self._lock = threading.RLock()
+        # key: number of references from the manifests, counted on first use
+        self._refcounts = None
+
+    # ContentsManager-dependent checkpoint API
+    def create_checkpoint(self, contents_mgr, path):
+        """Create a checkpoint."""
+        path = path.strip('/')
+        src_path = contents_mgr._get_os_path(path)
+        if not os.path.isfile(src_path):
+            raise HTTPError(404, u'No such file: %s' % path)
+        with self.open(src_path, 'rb') as f:
+            data = f.read()
+        nb = None
+        if path.endswith('.ipynb'):
+            try:
+                nb = self._parse_notebook(data.decode('utf-8'), as_version=nbformat.NO_CONVERT)
+            except Exception as e:
+                self.log.debug("Checkpointing unreadable notebook %s whole: %s", path, e)
+        with self._lock:
+            if nb is not None and 'cells' in nb:
+                return self._create(path, self._notebook_entry(nb))
+            return self._create(path, self._file_entry(data))
+
+    def restore_checkpoint(self, contents_mgr, checkpoint_id, path):
+        """Restore a checkpoint."""
+        path = path.strip('/')
+        entry = self._get_entry(checkpoint_id, path)
+        dest_path = contents_mgr._get_os_path(path)
+        if entry['type'] == 'notebook':
+            self._save_notebook(dest_path, self._rebuild_notebook(entry))
+        else:
+            with self.atomic_writing(dest_path, text=False) as f:
+                f.write(self._read_blob(entry['blob']))
+
+    # ContentsManager-independent checkpoint API
+    def rename_checkpoint(self, checkpoint_id, old_path, new_path):
+        """Rename a checkpoint from old_path to new_path."""
+        old_path = old_path.strip('/')
+        new_path = new_path.strip('/')
+        with self._lock:
+            old_entries = self._read_manifest(old_path)
+            moved = [e for e in old_entries if e['id'] == checkpoint_id]
+            if not moved:
+                return
+            self.log.debug(
+                "Renaming checkpoint %s of %s -> %s",
+                checkpoint_id, old_path, new_path,
+            )
+            replaced_entries = self._read_manifest(new_path)
+            new_entries = [e for e in replaced_entries if e['id'] != checkpoint_id]
+            new_entries.extend(moved)
+            new_entries.sort(key=lambda e: e['created'])
+            self._write_manifest(new_path, new_entries, replaced_entries)
+            self._write_manifest(
+                old_path, [e for e in old_entries if e['id'] != checkpoint_id], old_entries)
+
+    def rename_all_checkpoints(self, old_path, new_path):
+        """Rename all checkpoints for old_path to new_path.
+
+        Moves the manifests of a directory's files along with it.
+        """
+        old_dir = self._manifest_dir(old_path.strip('/'))
+        new_dir = self._manifest_dir(new_path.strip('/'))
+        with self._lock:
+            if not os.path.isdir(old_dir):
+                return
+            # checkpoints left behind by a file that is gone
+            self._remove_manifests(new_dir)
+            self.log.debug("Renaming checkpoints %s -> %s", old_dir, new_dir)
+            with self.perm_to_403():
+                ensure_dir_exists(os.path.dirname(new_dir))
+                shutil.move(old_dir, new_dir)
+
+    def delete_checkpoint(self, checkpoint_id, path):
+        """delete a file's checkpoint"""
+        path = path.strip('/')
+        with self._lock:
+            entries = self._read_manifest(path)
+            if not any(e['id'] == checkpoint_id for e in entries):
+                self.no_such_checkpoint(path, checkpoint_id)
+            self._write_manifest(
+                path, [e for e in entries if e['id'] != checkpoint_id], entries)
+
+    def delete_all_checkpoints(self, path):
+        """Delete all checkpoints for the given path.
+
+        Also deletes the checkpoints of a directory's files.
+        """
+        with self._lock:
+            self._remove_manifests(self._manifest_dir(path.strip('/')))
+
+    def list_checkpoints(self, path):
+        """list the checkpoints for a given file, oldest first"""
+        path = path.strip('/')
+        return [self.checkpoint_model(e) for e in self._read_manifest(path)]
+
+    # Checkpoint-related utilities
+    def checkpoint_model(self, entry):
+        """construct the info dict for a manifest entry"""
+        return dict(
+            id=entry['id'],
+            last_modified=tz.utcfromtimestamp(entry['created']),
+        )
+
+    def _store_path(self, *parts):
+        root = os.path.join(self.root_dir, self.store_dir)
+        return os.path.join(root, *parts)
+
+    def _manifest_dir(self, path):
+        return to_os_path(path, self._store_path('manifests'))
+
+    def _manifest_path(self, path):
+        return os.path.join(self._manifest_dir(path), 'manifest.json')
+
+    def _blob_path(self, key):
+        return self._store_path('objects', key[:2], key[2:])
+
+    def _read_manifest(self, path):
+        """The checkpoint entries of a file, oldest first"""
+        manifest_path = self._manifest_path(path)
+        try:
+            with self.open(manifest_path, 'rb') as f:
+                return loads_blob(f.read())['checkpoints']
+        except (IOError, OSError) as e:
+            if e.errno == errno.ENOENT:
+                return []
+            raise
+
+    def _write_manifest(self, path, entries, old_entries):
+        """Replace the entries of a file's manifest
+
+        Deletes the blobs that only old_entries referenced.
+        """
+        # counted before the manifest changes
+        self._count_refs()
+        manifest_path = self._manifest_path(path)
+        if not entries:
+            with self.perm_to_403():
+                if os.path.exists(manifest_path):
+                    os.unlink(manifest_path)
+        else:
+            with self.perm_to_403():
+                ensure_dir_exists(os.path.dirname(manifest_path))
+            with self.atomic_writing(manifest_path, text=False) as f:
+                f.write(dumps_blob({'checkpoints': entries}))
+        self._update_refs(entries, old_entries)
+
+    def _walk_manifests(self, top):
+        """Yield the entries of every manifest below a directory"""
+        for dirpath, dirnames, filenames in os.walk(top):
+            if 'manifest.json' in filenames:
+                with self.open(os.path.join(dirpath, 'manifest.json'), 'rb') as f:
+                    for entry in loads_blob(f.read())['checkpoints']:
+                        yield entry
+
+    def _remove_manifests(self, manifest_dir):
+        """Remove the manifests below a directory, and their unused blobs"""
+        if not os.path.isdir(manifest_dir):
+            return
+        self._count_refs()
+        removed = list(self._walk_manifests(manifest_dir))
+        self.log.debug("Removing checkpoints %s", manifest_dir)
+        with self.perm_to_403():
+            shutil.rmtree(manifest_dir)
+        self._update_refs([], removed)
+
+    # Blobs
+    def _write_blob(self, data, written):
+        """Store a blob, unless it is already in the store
+
+        A blob never changes, so it is created in place rather than
+        through a temporary file, and isn't synced here: its path is
+        appended to `written`, for the new blobs to be synced together
+        before a manifest refers to them.
+
+        Returns the key of the blob.
+        """
+        key = sha256(data).hexdigest()
+        blob_path = self._blob_path(key)
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+        with self.perm_to_403():
+            try:
+                fd = os.open(blob_path, flags, 0o666)
+            except OSError as e:
+                if e.errno == errno.EEXIST:
+                    if os.path.getsize(blob_path) == len(data):
+                        return key
+                    # cut short by a crash, before a manifest referred to it
+                    os.unlink(blob_path)
+                elif e.errno == errno.ENOENT:
+                    ensure_dir_exists(os.path.dirname(blob_path))
+                else:
+                    raise
+                fd = os.open(blob_path, flags, 0o666)
+            try:
+                with io.open(fd, 'wb') as f:
+                    f.write(data)
+            except:
+                os.unlink(blob_path)
+                raise
+        written.append(blob_path)
+        return key
+
+    def _sync_blobs(self, written):
+        """Sync the new blobs of a checkpoint, and their directories, at once"""
+        if not written:
+            return
+        self.file_syncer.sync_written(written)
+        # a blob of each directory
+        for blob_path in dict((os.path.dirname(p), p) for p in written).values():
+            self.file_syncer.sync_directory(blob_path)
+
+    def _read_blob(self, key):
+        with self.open(self._blob_path(key), 'rb') as f:
+            return f.read()
+
+    def _entry_keys(self, entry):
+        """The keys of the blobs referenced by a manifest entry"""
+        if entry['type'] != 'notebook':
+            return [entry['blob']]
+        keys = [entry['notebook']]
+        for cell_key, output_keys in entry['cells']:
+            keys.append(cell_key)
+            keys.extend(output_keys or [])
+        return keys
+
+    def _count_refs(self):
+        """The number of references to each blob from the manifests
+
+        They are counted from all the manifests once, then kept up to date
+        as manifests change, so that removing a checkpoint doesn't read
+        the manifests of every other one.
+        """
+        if self._refcounts is None:
+            refcounts = {}
+            for entry in self._walk_manifests(self._store_path('manifests')):
+                for key in self._entry_keys(entry):
+                    refcounts[key] = refcounts.get(key, 0) + 1
+            self._refcounts = refcounts
+        return self._refcounts
+
+    def _update_refs(self, added_entries, removed_entries):
+        """Count the references of manifest entries added and removed,
+        and delete the blobs that nothing references anymore
+        """
+        refcounts = self._count_refs()
+        for entry in added_entries:
+            for key in self._entry_keys(entry):
+                refcounts[key] = refcounts.get(key, 0) + 1
+        unused = set()
+        for entry in removed_entries:
+            for key in self._entry_keys(entry):
+                count = refcounts.get(key, 0) - 1
+                if count > 0:
+                    refcounts[key] = count
+                else:
+                    refcounts.pop(key, None)
+                    unused.add(key)
+        if unused:
+            self.log.debug("Deleting %i unused checkpoint blobs", len(unused))
+            for key in unused:
+                with self.perm_to_403():
+                    try:
+                        os.unlink(self._blob_path(key))
+                    except OSError as e:
+                        if e.errno != errno.ENOENT:
+                            raise
+
+    # Splitting and rebuilding notebooks
+    def _notebook_entry(self, nb):
+        """Store the blobs of a notebook, returning its manifest entry"""
+        skeleton = dict((key, value) for key, value in nb.items() if key != 'cells')
+        cells = []
+        written = []
+        for cell in nb['cells']:
+            outputs = cell.get('outputs')
+            output_keys = None
+            if outputs is not None:
+                output_keys = [self._write_blob(dumps_blob(o), written) for o in outputs]
+                cell = dict((key, value) for key, value in cell.items() if key != 'outputs')
+            cells.append([self._write_blob(dumps_blob(cell), written), output_keys])
+        entry = {
+            'type': 'notebook',
+            'notebook': self._write_blob(dumps_blob(skeleton), written),
+            'cells': cells,
+        }
+        self._sync_blobs(written)
+        return entry
+
+    def _file_entry(self, data):
+        """Store a file as one blob, returning its manifest entry"""
+        written = []
+        entry = {'type': 'file', 'blob': self._write_blob(data, written)}
+        self._sync_blobs(written)
+        return entry
+
+    def _rebuild_notebook(self, entry):
+        """Rebuild a notebook from the blobs of a manifest entry"""
+        nb = loads_blob(self._read_blob(entry['notebook']))
+        cells = []
+        for cell_key, output_keys in entry['cells']:
+            cell = loads_blob(self._read_blob(cell_key))
+            if output_keys is not None:
+                cell['outputs'] = [loads_blob(self._read_blob(key)) for key in output_keys]
+            cells.append(cell)
+        nb['cells'] = cells
+        return nbformat.from_dict(nb)
+
+    def _create(self, path, entry):
+        """Add a manifest entry for a new checkpoint of a file
+
+        A checkpoint identical to the latest one replaces it,
+        rather than adding to the history.
+        """
+        with self._lock:
+            old_entries = self._read_manifest(path)
+            entries = list(old_entries)
+            if entries and self._entry_keys(entries[-1]) == self._entry_keys(entry) \
+                    and entries[-1]['type'] == entry['type']:
+                entry['id'] = entries.pop()['id']
+            else:
+                entry['id'] = uuid.uuid4().hex[:16]
+            entry['created'] = time.time()
+            entries.append(entry)
+            if self.max_checkpoints > 0 and len(entries) > self.max_checkpoints:
+                entries = entries[-self.max_checkpoints:]
+            self.log.debug("creating checkpoint %s for %s", entry['id'], path)
+            self._write_manifest(path, entries, old_entries)
+        return self.checkpoint_model(entry)
+
+    def _get_entry(self, checkpoint_id, path):
+        for entry in self._read_manifest(path):
+            if entry['id'] == checkpoint_id:
+                return entry
+        self.no_such_checkpoint(path, checkpoint_id)
+
+    # Error Handling
+    def no_such_checkpoint(self, path, checkpoint_id):
+        raise HTTPError(
+            404,
+            u'Checkpoint does not exist: %s@%s' % (path, checkpoint_id)
+        )
+
+
+class GenericContentCheckpoints(GenericCheckpointsMixin, ContentCheckpoints):
+    """
+    Content-addressed Checkpoints that works with any conforming
+    ContentsManager.
+    """
+    def create_file_checkpoint(self, content, format, path):
+        """Create a checkpoint from the current content of a file."""
+        path = path.strip('/')
+        if format == 'text':
+            data = content.encode('utf8')
+        else:
+            data = decodebytes(content.encode('ascii'))
+        with self._lock:
+            return self._create(path, self._file_entry(data))
+
+    def create_notebook_checkpoint(self, nb, path):
+        """Create a checkpoint from the current content of a notebook."""
+        path = path.strip('/')
+        with self._lock:
+            return self._create(path, self._notebook_entry(nb))
+
+    def get_notebook_checkpoint(self, checkpoint_id, path):
+        """Get a checkpoint for a notebook."""
+        path = path.strip('/')
+        self.log.info("restoring %s from checkpoint %s", path, checkpoint_id)
+        entry = self._get_entry(checkpoint_id, path)
+        if entry['type'] != 'notebook':
+            raise HTTPError(400, u'Checkpoint %s@%s is not a notebook' % (path, checkpoint_id))
+        return {
+            'type': 'notebook',
+            'content': nbformat.convert(self._rebuild_notebook(entry), 4),
+        }
+
+    def get_file_checkpoint(self, checkpoint_id, path):
+        """Get a checkpoint for a file."""
+        path = path.strip('/')
+        self.log.info("restoring %s from checkpoint %s", path, checkpoint_id)
+        entry = self._get_entry(checkpoint_id, path)
+        if entry['type'] == 'notebook':
+            data = self._serialize_notebook(self._rebuild_notebook(entry)).encode('utf8')
+        else:
+            data = self._read_blob(entry['blob'])
+        try:
+            return {'type': 'file', 'content': data.decode('utf8'), 'format': 'text'}
+        except UnicodeError:
+            return {
+                'type': 'file',
+                'content': encodebytes(data).decode('ascii'),
+                'format': 'base64',
+            }
@@ -10,6 +10,16 @@ import errno
 import io
 import os
 import shutil
+import stat
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
 
 from tornado.web import HTTPError
 
@@ -18,11 +28,14 @@ from notebook.utils import (
     to_os_path,
 )
 import nbformat
+from nbformat.reader import get_version
 
 from ipython_genutils.py3compat import str_to_unicode
 
 from traitlets.config import Configurable
-from traitlets import Bool
+from traitlets import Any, Bool, Enum, Float, List, Unicode, default
+
+from .jsoncodec import get_codec
 
 try: #PY3
     from base64 import encodebytes, decodebytes
@@ -43,12 +56,95 @@ def replace_file(src, dst):
             os.remove(dst)
         os.rename(src, dst)
 
-def copy2_safe(src, dst, log=None):
+def replace_file_keeping_mode(src, dst):
+    """ replace dst with src, keeping the permissions of dst if it exists
+
+    For replacing a file with a new temporary file,
+    which may have been created with different permissions.
+    """
+    try:
+        mode = stat.S_IMODE(os.stat(dst).st_mode)
+    except OSError:
+        # new file, keep the default permissions
+        pass
+    else:
+        os.chmod(src, mode)
+    replace_file(src, dst)
+
+def fsync_directory(path):
+    """Sync a directory to disk, so that the files renamed in it stay renamed
+
+    Directories can't be synced on Windows, where this does nothing.
+    """
+    if os.name != 'nt':
+        _fsync_path(path or '.')
+
+def _fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _sync_replaced(path, syncer=None):
+    """Sync the directory of a file replaced by a temporary file"""
+    if syncer is None:
+        fsync_directory(os.path.dirname(path))
+    else:
+        syncer.sync_directory(path)
+
+def copy_file(src, dst, copier=None, atomic=False, syncer=None):
+    """copy the contents of src to dst, like shutil.copyfile
+
+    Parameters
+    ----------
+    copier : FileCopier, optional
+      Copies the contents of the file with the fastest method the filesystems
+      support. By default, the contents are copied with shutil.copyfile.
+
+    atomic : bool, optional
+      Whether to copy to a temporary file, which replaces dst once complete,
+      synced to disk by `syncer`, or right away if there is no syncer.
+      Requires a copier.
+    """
+    if copier is None:
+        shutil.copyfile(src, dst)
+        return
+    # like atomic_writing, resolve the file itself being a symlink
+    if os.path.islink(dst):
+        dst = os.path.join(os.path.dirname(dst), os.readlink(dst))
+    if atomic:
+        fd, tmp_path = _open_temporary(dst)
+    else:
+        tmp_path = None
+        fd = os.open(dst, _O_BINARY | os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        with io.open(fd, 'wb') as fileobj:
+            with io.open(src, 'rb') as srcobj:
+                copier.copyfile(srcobj.fileno(), fileobj.fileno())
+            if atomic:
+                if syncer is None:
+                    os.fsync(fileobj.fileno())
+                else:
+                    syncer.sync(fileobj, dst)
+                tmp_path = _link_temporary(fileobj.fileno(), tmp_path, dst)
+        if atomic:
+            replace_file_keeping_mode(tmp_path, dst)
+            _sync_replaced(dst, syncer)
+    except:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def copy2_safe(src, dst, log=None, **kwargs):
     """copy src to dst
 
     like shutil.copy2, but log errors in copystat instead of raising
+
+    Keyword arguments are passed to `copy_file`.
     """
-    shutil.copyfile(src, dst)
+    copy_file(src, dst, **kwargs)
     try:
         shutil.copystat(src, dst)
     except OSError:
@@ -56,7 +152,7 @@ def copy2_safe(src, dst, log=None):
             log.debug("copystat on %s failed", dst, exc_info=True)
 
 def path_to_intermediate(path):
-    '''Name of the intermediate file used in atomic writes.
+    '''Name of the intermediate file used in atomic writes by older versions.
 
     The .~ prefix will make Dropbox ignore the temporary file.'''
     dirname, basename = os.path.split(path)
@@ -67,14 +163,329 @@ def path_to_invalid(path):
     dirname, basename = os.path.split(path)
     return os.path.join(dirname, basename+'.invalid')
 
+def path_to_temporary(path):
+    """Name of a new temporary file, to replace path with in atomic writes
+
+    Unique, so that concurrent writes to the same file don't mix.
+    The .~ prefix will make Dropbox ignore the temporary file.
+    """
+    dirname, basename = os.path.split(path)
+    return os.path.join(dirname, '.~%s.%s' % (basename, uuid.uuid4().hex[:8]))
+
+
+# without it, writes to files opened with os.open translate newlines on Windows
+_O_BINARY = getattr(os, 'O_BINARY', 0)
+
+
+def _open_temporary(path):
+    """Open a new temporary file, to replace path with
+
+    Where supported (Linux), the file is anonymous (O_TMPFILE),
+    so that nothing is left behind if the server dies before replacing path.
+
+    Returns ``(fd, tmp_path)``, where tmp_path is None for anonymous files,
+    which `_link_temporary` gives a name to.
+    """
+    # linking an anonymous file needs linkat, through os.link with a dir_fd (Python 3)
+    if (hasattr(os, 'O_TMPFILE') and os.link in os.supports_dir_fd
+            and os.path.isdir('/proc/self/fd')):
+        try:
+            fd = os.open(os.path.dirname(path) or '.', os.O_RDWR | os.O_TMPFILE, 0o666)
+        except OSError as e:
+            # not supported by this filesystem
+            if e.errno not in {errno.EISDIR, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOENT}:
+                raise
+        else:
+            return fd, None
+    tmp_path = path_to_temporary(path)
+    fd = os.open(tmp_path, _O_BINARY | os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    return fd, tmp_path
+
+
+def _link_temporary(fd, tmp_path, path):
+    """Give a name to a temporary file opened by `_open_temporary`, if it has none
+
+    Returns the name of the temporary file.
+    """
+    if tmp_path is not None:
+        return tmp_path
+    tmp_path = path_to_temporary(path)
+    dirname, basename = os.path.split(tmp_path)
+    dir_fd = os.open(dirname or '.', os.O_RDONLY)
+    try:
+        # a dir_fd makes os.link call linkat, following the /proc symlink
+        os.link('/proc/self/fd/%d' % fd, basename, dst_dir_fd=dir_fd)
+    except OSError:
+        # linking anonymous files can be forbidden: copy the file instead
+        with io.open(os.open(tmp_path, _O_BINARY | os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), 'wb') as f:
+            os.lseek(fd, 0, os.SEEK_SET)
+            for chunk in iter(lambda: os.read(fd, 1024 * 1024), b''):
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        os.close(dir_fd)
+    return tmp_path
+
+
+class FileSyncer(object):
+    """Sync written files to disk, following a durability policy
+
+    Parameters
+    ----------
+    policy : str
+      'always' to sync each file as soon as it is written (the default),
+      'group' to sync the files written concurrently together, on a thread,
+      at most every `interval` seconds, each write waiting for its sync,
+      or 'shutdown' to only sync files when the syncer is closed.
+      Each write waiting, 'group' is for writes made off the event loop.
+
+    interval : float, optional
+      The time between group syncs, in seconds.
+    """
+
+    policies = ('always', 'group', 'shutdown')
+
+    def __init__(self, policy='always', interval=0.01):
+        if policy not in self.policies:
+            raise ValueError("Unknown fsync policy: %r" % policy)
+        self.policy = policy
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = []
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        self._unsynced = set()
+        self._closed = False
+
+    def sync(self, fileobj, path):
+        """Sync a file being written to path, before it replaces path"""
+        fileobj.flush()
+        if self.policy == 'always' or self._closed:
+            os.fsync(fileobj.fileno())
+        elif self.policy == 'shutdown':
+            with self._lock:
+                self._unsynced.add(path)
+        else:
+            self._group_sync(fileobj.fileno())
+
+    def sync_written(self, paths):
+        """Sync files which were written and closed, creating new paths
+
+        Their data is synced together, before anything refers to them.
+        """
+        if self.policy == 'shutdown' and not self._closed:
+            with self._lock:
+                self._unsynced.update(paths)
+            return
+        for path in paths:
+            _fsync_path(path)
+
+    def sync_directory(self, path):
+        """Sync the directory of a file which was just replaced,
+        so that the new file stays in place
+        """
+        dirname = os.path.dirname(path)
+        if os.name == 'nt':
+            return
+        if self.policy == 'always' or self._closed:
+            fsync_directory(dirname)
+        elif self.policy == 'shutdown':
+            with self._lock:
+                self._unsynced.add(dirname or '.')
+        else:
+            fd = os.open(dirname or '.', os.O_RDONLY)
+            try:
+                self._group_sync(fd)
+            finally:
+                os.close(fd)
+
+    def _group_sync(self, fd):
+        # [fd, done, error]
+        request = [fd, threading.Event(), None]
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._pending.append(request)
+        if closed:
+            os.fsync(fd)
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='FileSyncer')
+                self._thread.daemon = True
+                self._thread.start()
+            self._wakeup.notify()
+        request[1].wait()
+        if request[2] is not None:
+            raise request[2]
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._wakeup.wait()
+                if self._closed and not self._pending:
+                    return
+            # let concurrent writes join the group
+            time.sleep(self.interval)
+            with self._lock:
+                batch, self._pending = self._pending, []
+            for request in batch:
+                try:
+                    os.fsync(request[0])
+                except Exception as e:
+                    request[2] = e
+                request[1].set()
+
+    def close(self):
+        """Sync the files not synced yet, and stop syncing in groups"""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+            thread = self._thread
+            unsynced, self._unsynced = self._unsynced, set()
+        if thread is not None:
+            thread.join()
+        for path in unsynced:
+            try:
+                _fsync_path(path)
+            except OSError as e:
+                # removed since
+                if e.errno != errno.ENOENT:
+                    raise
+
+
+# ioctl cloning a file into another, sharing its extents (linux/fs.h)
+FICLONE = 0x40049409
+
+# errors of copy methods that the filesystems or the kernel don't support
+_unsupported_copy_errors = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOSYS, errno.ENOTTY}
+
+
+class ShortCopyError(Exception):
+    """A copy method copied less than the size of the file
+
+    Some filesystems report files as empty to them (e.g. /proc),
+    so the next method is tried.
+    """
+
+
+class FileCopier(object):
+    """Copy the contents of files with the fastest method available
+
+    The methods are tried in order, the first time files are copied
+    between two filesystems, and the first that works is used for all
+    the following copies between them.
+
+    Parameters
+    ----------
+    methods : list of str, optional
+      The copy methods to try, among:
+      'reflink', to clone the file on copy-on-write filesystems (Linux),
+      'copy_file_range' (Python 3.8 and Linux),
+      'sendfile' (Python 3 and Linux),
+      and 'buffered', to read and write the file in chunks.
+      Unavailable methods are skipped, and 'buffered' is always available.
+    """
+
+    methods = ('reflink', 'copy_file_range', 'sendfile', 'buffered')
+
+    chunk_size = 1024 * 1024
+
+    def __init__(self, methods=methods):
+        for method in methods:
+            if method not in self.methods:
+                raise ValueError("Unknown copy method: %r" % method)
+        self.methods = [m for m in methods if self._available(m)]
+        if 'buffered' not in self.methods:
+            self.methods.append('buffered')
+        self._lock = threading.Lock()
+        # (src device, dst device): the methods left to try
+        self._probed = {}
+        self._stats = dict((m, {'files': 0, 'bytes': 0}) for m in self.methods)
+
+    @staticmethod
+    def _available(method):
+        linux = sys.platform.startswith('linux')
+        if method == 'reflink':
+            return linux and fcntl is not None
+        elif method == 'copy_file_range':
+            return linux and hasattr(os, 'copy_file_range')
+        elif method == 'sendfile':
+            return linux and hasattr(os, 'sendfile')
+        return True
+
+    def copyfile(self, src_fd, dst_fd):
+        """Copy the contents of an open file to another, from their start
+
+        Returns the name of the method used.
+        """
+        src_st = os.fstat(src_fd)
+        key = (src_st.st_dev, os.fstat(dst_fd).st_dev)
+        with self._lock:
+            methods = self._probed.get(key, self.methods)
+        for i, method in enumerate(methods):
+            try:
+                getattr(self, '_copy_' + method)(src_fd, dst_fd, src_st.st_size)
+            except (IOError, OSError, ShortCopyError) as e:
+                if method == 'buffered' or (not isinstance(e, ShortCopyError)
+                        and e.errno not in _unsupported_copy_errors):
+                    raise
+                # start over with the next method
+                os.lseek(src_fd, 0, os.SEEK_SET)
+                os.lseek(dst_fd, 0, os.SEEK_SET)
+                os.ftruncate(dst_fd, 0)
+                continue
+            with self._lock:
+                self._probed[key] = methods[i:]
+                self._stats[method]['files'] += 1
+                self._stats[method]['bytes'] += src_st.st_size
+            return method
+
+    def _copy_reflink(self, src_fd, dst_fd, size):
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+    def _copy_copy_file_range(self, src_fd, dst_fd, size):
+        copied = 0
+        while True:
+            n = os.copy_file_range(src_fd, dst_fd, self.chunk_size * 64)
+            if not n:
+                break
+            copied += n
+        if copied < size:
+            raise ShortCopyError("copy_file_range copied %i/%i bytes" % (copied, size))
+
+    def _copy_sendfile(self, src_fd, dst_fd, size):
+        offset = 0
+        while True:
+            n = os.sendfile(dst_fd, src_fd, offset, self.chunk_size * 64)
+            if not n:
+                break
+            offset += n
+        if offset < size:
+            raise ShortCopyError("sendfile copied %i/%i bytes" % (offset, size))
+
+    def _copy_buffered(self, src_fd, dst_fd, size):
+        for chunk in iter(lambda: os.read(src_fd, self.chunk_size), b''):
+            while chunk:
+                n = os.write(dst_fd, chunk)
+                chunk = chunk[n:]
+
+    def stats(self):
+        """The numbers of files and bytes copied with each method"""
+        with self._lock:
+            return dict((m, dict(counts)) for m, counts in self._stats.items())
+
+
 @contextmanager
-def atomic_writing(path, text=True, encoding='utf-8', log=None, **kwargs):
+def atomic_writing(path, text=True, encoding='utf-8', log=None, syncer=None, **kwargs):
     """Context manager to write to a file only if the entire write is successful.
 
-    This works by copying the previous file contents to a temporary file in the
-    same directory, and renaming that file back to the target if the context
-    exits with an error. If the context is successful, the new data is synced to
-    disk and the temporary file is removed.
+    This works by writing to a new temporary file in the same directory,
+    which replaces the target file, keeping its permissions, only if the
+    context is successful. The previous file contents are never copied,
+    and are left untouched if the context exits with an error.
 
     Parameters
     ----------
@@ -88,6 +499,10 @@ def atomic_writing(path, text=True, encoding='utf-8', log=None, **kwargs):
     encoding : str, optional
       The encoding to use for files opened in text mode. Default is UTF-8.
 
+    syncer : FileSyncer, optional
+      Syncs the new data to disk before it replaces the target file.
+      By default, the data is synced right away.
+
     **kwargs
       Passed to :func:`io.open`.
     """
@@ -97,36 +512,39 @@ def atomic_writing(path, text=True, encoding='utf-8', log=None, **kwargs):
     if os.path.islink(path):
         path = os.path.join(os.path.dirname(path), os.readlink(path))
 
-    tmp_path = path_to_intermediate(path)
-
-    if os.path.isfile(path):
-        copy2_safe(path, tmp_path, log=log)
-
-    if text:
-        # Make sure that text files have Unix linefeeds by default
-        kwargs.setdefault('newline', '\n')
-        fileobj = io.open(path, 'w', encoding=encoding, **kwargs)
-    else:
-        fileobj = io.open(path, 'wb', **kwargs)
+    fd, tmp_path = _open_temporary(path)
+    try:
+        if text:
+            # Make sure that text files have Unix linefeeds by default
+            kwargs.setdefault('newline', '\n')
+            fileobj = io.open(fd, 'w', encoding=encoding, **kwargs)
+        else:
+            fileobj = io.open(fd, 'wb', **kwargs)
+    except:
+        os.close(fd)
+        if tmp_path is not None:
+            os.remove(tmp_path)
+        raise
 
     try:
         yield fileobj
+        # Flush to disk
+        if syncer is None:
+            fileobj.flush()
+            os.fsync(fileobj.fileno())
+        else:
+            syncer.sync(fileobj, path)
+        tmp_path = _link_temporary(fileobj.fileno(), tmp_path, path)
+        fileobj.close()
+        replace_file_keeping_mode(tmp_path, path)
+        _sync_replaced(path, syncer)
     except:
-        # Failed! Move the backup file back to the real path to avoid corruption
+        # Failed! The target file was never touched
         fileobj.close()
-        replace_file(tmp_path, path)
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
         raise
 
-    # Flush to disk
-    fileobj.flush()
-    os.fsync(fileobj.fileno())
-    fileobj.close()
-
-    # Written successfully, now remove the backup copy
-    if os.path.isfile(tmp_path):
-        os.remove(tmp_path)
-
-
 
 @contextmanager
 def _simple_writing(path, text=True, encoding='utf-8', log=None, **kwargs):
@@ -172,6 +590,71 @@ def _simple_writing(path, text=True, encoding='utf-8', log=None, **kwargs):
 
 
 
+class RawFileWriter(object):
+    """Write a file from chunks of bytes
+
+    If atomic, chunks are written to a temporary file in the same directory,
+    which replaces the target file only once the write is committed,
+    so that an interrupted upload never leaves a truncated file behind.
+    Otherwise, chunks are written directly to the target file.
+
+    Parameters
+    ----------
+    path : str
+      The target file to write to.
+
+    atomic : bool, optional
+      Whether to write to a temporary file first. Default is True.
+
+    syncer : FileSyncer, optional
+      Syncs the written bytes to disk on commit.
+      By default, they are synced right away.
+    """
+
+    def __init__(self, path, atomic=True, syncer=None):
+        # resolve the file itself being a symlink, like atomic_writing
+        if os.path.islink(path):
+            path = os.path.join(os.path.dirname(path), os.readlink(path))
+        self.path = path
+        self.atomic = atomic
+        self.syncer = syncer
+        if atomic:
+            fd, self.tmp_path = _open_temporary(path)
+            self.fileobj = io.open(fd, 'wb')
+        else:
+            self.tmp_path = None
+            self.fileobj = io.open(path, 'wb')
+        self.size = 0
+
+    def write(self, chunk):
+        """Write a chunk of bytes"""
+        self.fileobj.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        """Sync the written bytes to disk, and replace the target file"""
+        if self.syncer is None:
+            self.fileobj.flush()
+            os.fsync(self.fileobj.fileno())
+        else:
+            self.syncer.sync(self.fileobj, self.path)
+        if self.atomic:
+            self.tmp_path = _link_temporary(self.fileobj.fileno(), self.tmp_path, self.path)
+        self.fileobj.close()
+        if self.atomic:
+            replace_file_keeping_mode(self.tmp_path, self.path)
+            _sync_replaced(self.path, self.syncer)
+
+    def abort(self):
+        """Discard the written bytes
+
+        The target file is left untouched if the write is atomic.
+        """
+        self.fileobj.close()
+        if self.tmp_path is not None and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
 class FileManagerMixin(Configurable):
     """
     Mixin for ContentsAPI classes that interact with the filesystem.
@@ -196,6 +679,85 @@ class FileManagerMixin(Configurable):
       This procedure, namely 'atomic_writing', causes some bugs on file system whitout operation order enforcement (like some networked fs).
       If set to False, the new notebook is written directly on the old one which could fail (eg: full filesystem or quota )""")
 
+    fsync_policy = Enum(FileSyncer.policies, 'always', config=True,
+        help="""When files written atomically are synced to disk.
+
+        'always' (default): each file is synced before it replaces
+        the previous version of the file.
+        'group': files written concurrently are synced together, on a thread,
+        every fsync_interval seconds. Each write still waits for its sync,
+        so it requires AsyncFileContentsManager, which writes files off
+        the event loop: otherwise 'always' is used.
+        'shutdown': files are only synced when the server shuts down.
+        Saves are fastest, but files saved shortly before
+        a crash of the machine may be lost or empty.
+        """
+    )
+
+    fsync_interval = Float(0.01, config=True,
+        help="""The time between syncs of the files written concurrently,
+        in seconds, with fsync_policy 'group'."""
+    )
+
+    file_syncer = Any(help="The FileSyncer syncing the files written atomically")
+
+    # whether files are written off the event loop, see AsyncFileContentsManager
+    _io_on_executor = False
+
+    @default('file_syncer')
+    def _default_file_syncer(self):
+        policy = self.fsync_policy
+        # the checkpoints of a contents manager write files on its executor
+        on_executor = self._io_on_executor or getattr(self.parent, '_io_on_executor', False)
+        if policy == 'group' and not on_executor:
+            self.log.warning("fsync_policy 'group' requires AsyncFileContentsManager, "
+                "using 'always' instead")
+            policy = 'always'
+        return FileSyncer(policy, interval=self.fsync_interval)
+
+    file_copy_methods = List(Unicode(), list(FileCopier.methods), config=True,
+        help="""The methods used to copy files, such as checkpoints,
+        tried in order the first time files are copied between two filesystems.
+
+        'reflink' clones files on copy-on-write filesystems (e.g. btrfs, or XFS),
+        'copy_file_range' and 'sendfile' copy files within the kernel (Linux),
+        and 'buffered' reads and writes files in chunks.
+        """
+    )
+
+    file_copier = Any(help="The FileCopier copying files")
+
+    @default('file_copier')
+    def _default_file_copier(self):
+        # share the copier of the contents manager, and its statistics
+        copier = getattr(self.parent, 'file_copier', None)
+        if isinstance(copier, FileCopier):
+            return copier
+        return FileCopier(self.file_copy_methods)
+
+    def file_copy_stats(self):
+        """Get the numbers of files and bytes copied with each copy method"""
+        return self.file_copier.stats()
+
+    json_library = Unicode('', config=True,
+        help="""The JSON library used to parse notebooks.
+
+        'json' for the standard library, or the import name of
+        a library with compatible `loads` and `dumps` functions,
+        such as 'orjson', 'rapidjson' or 'ujson'.
+        By default, the fastest of these that is installed is used.
+
+        Notebooks are always written by nbformat with the standard library,
+        so that files stay identical to nbformat's output.
+        """
+    )
+
+    json_codec = Any(help="The JSONCodec of json_library")
+
+    @default('json_codec')
+    def _default_json_codec(self):
+        return get_codec(self.json_library)
+
     @contextmanager
     def open(self, os_path, *args, **kwargs):
         """wrapper around io.open that turns permission errors into 403"""
@@ -210,6 +772,7 @@ class FileManagerMixin(Configurable):
         simply writes the file (whatever an old exists or not)"""
         with self.perm_to_403(os_path):
             if self.use_atomic_writing:
+                kwargs.setdefault('syncer', self.file_syncer)
                 with atomic_writing(os_path, *args, log=self.log, **kwargs) as f:
                     yield f
             else:
@@ -233,12 +796,31 @@ class FileManagerMixin(Configurable):
             else:
                 raise
 
+    def _raw_writer(self, os_path):
+        """Open a RawFileWriter on an os path, turning permission errors to 403"""
+        with self.perm_to_403(os_path):
+            return RawFileWriter(os_path, atomic=self.use_atomic_writing,
+                                 syncer=self.file_syncer)
+
     def _copy(self, src, dest):
         """copy src to dest
 
-        like shutil.copy2, but log errors in copystat
+        like shutil.copy2, but log errors in copystat,
+        and copy with the fastest method the filesystems support.
+        With use_atomic_writing, dest is replaced once the copy is complete.
+        """
+        copy2_safe(src, dest, log=self.log, copier=self.file_copier,
+                   atomic=self.use_atomic_writing, syncer=self.file_syncer)
+
+    def _copy_file(self, src, dest):
+        """copy the contents of src to dest, like shutil.copyfile
+
+        Returns the stat result of dest.
         """
-        copy2_safe(src, dest, log=self.log)
+        with self.perm_to_403(dest):
+            copy_file(src, dest, copier=self.file_copier,
+                      atomic=self.use_atomic_writing, syncer=self.file_syncer)
+            return os.stat(dest)
 
     def _get_os_path(self, path):
         """Given an API path, return its file system path.
@@ -263,25 +845,39 @@ class FileManagerMixin(Configurable):
             raise HTTPError(404, "%s is outside root contents directory" % path)
         return os_path
 
+    def _parse_notebook(self, s, as_version=4):
+        """Parse a notebook from its JSON, with the configured JSON library
+
+        Like nbformat.reads, without validating the notebook:
+        callers validate the notebooks they read, if needed.
+        """
+        nb_dict = self.json_codec.loads(s)
+        if not isinstance(nb_dict, dict):
+            raise nbformat.reader.NotJSONError("Notebook is not a JSON object")
+        (major, minor) = get_version(nb_dict)
+        if major not in nbformat.versions:
+            raise nbformat.NBFormatError('Unsupported nbformat version %s' % major)
+        nb = nbformat.versions[major].to_notebook_json(nb_dict, minor=minor)
+        if as_version is not nbformat.NO_CONVERT:
+            nb = nbformat.convert(nb, as_version)
+        return nb
+
     def _read_notebook(self, os_path, as_version=4):
         """Read a notebook from an os path."""
         with self.open(os_path, 'r', encoding='utf-8') as f:
             try:
-                return nbformat.read(f, as_version=as_version)
+                return self._parse_notebook(f.read(), as_version=as_version)
             except Exception as e:
                 e_orig = e
 
-            # If use_atomic_writing is enabled, we'll guess that it was also
-            # enabled when this notebook was written and look for a valid
-            # atomic intermediate.
+            # Atomic writes only ever replace notebooks with complete files,
+            # but older versions wrote notebooks in place,
+            # after copying them to an intermediate file:
+            # look for the intermediate left by an interrupted write.
             tmp_path = path_to_intermediate(os_path)
 
-            if not self.use_atomic_writing or not os.path.exists(tmp_path):
-                error_details = ""
-                if not self.use_atomic_writing:
-                    error_details += "no use atomic writing\n"
-                if not os.path.exists(tmp_path):
-                    error_details += "Path does not exist: {}".format(tmp_path)
+            if not os.path.exists(tmp_path):
+                error_details = "Path does not exist: {}".format(tmp_path)
 
                 raise HTTPError(
                     400,
@@ -294,10 +890,28 @@ class FileManagerMixin(Configurable):
             replace_file(tmp_path, os_path)
             return self._read_notebook(os_path, as_version)
 
+    def _serialize_notebook(self, nb):
+        """Serialize a notebook to JSON in its own nbformat version
+
+        Like nbformat.writes, without validating the notebook:
+        callers validate the notebooks they save, if needed.
+        """
+        major = get_version(nb)[0]
+        s = nbformat.versions[major].writes_json(nb)
+        if not s.endswith(u'\n'):
+            s += u'\n'
+        return s
+
     def _save_notebook(self, os_path, nb):
-        """Save a notebook to an os_path."""
+        """Save a notebook to an os_path.
+
+        Returns the stat result of the written file.
+        """
+        s = self._serialize_notebook(nb)
         with self.atomic_writing(os_path, encoding='utf-8') as f:
-            nbformat.write(nb, f, version=nbformat.NO_CONVERT)
+            f.write(s)
+        # after replacing the file, which changes its ctime
+        return os.stat(os_path)
 
     def _read_file(self, os_path, format):
         """Read a non-notebook file.
@@ -329,7 +943,10 @@ class FileManagerMixin(Configurable):
         return encodebytes(bcontent).decode('ascii'), 'base64'
 
     def _save_file(self, os_path, content, format):
-        """Save content of a generic file."""
+        """Save content of a generic file.
+
+        Returns the stat result of the written file.
+        """
         if format not in {'text', 'base64'}:
             raise HTTPError(
                 400,
@@ -348,3 +965,4 @@ class FileManagerMixin(Configurable):
 
         with self.atomic_writing(os_path, text=False) as f:
             f.write(bcontent)
+        return os.stat(os_path)
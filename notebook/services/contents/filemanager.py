@@ -3,27 +3,41 @@
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
 
+from collections import OrderedDict
+import copy
+import heapq
 from datetime import datetime
 import errno
 import io
+import itertools
 import os
 import shutil
 import stat
 import sys
+import threading
 import warnings
 import mimetypes
 import nbformat
 
 from send2trash import send2trash
-from tornado import web
+from tornado import gen, web
+from tornado.ioloop import IOLoop
 
+from .checkpoints import GenericCheckpointsMixin
+from .checkpointscheduler import CheckpointScheduler
 from .filecheckpoints import FileCheckpoints
 from .fileio import FileManagerMixin
-from .manager import ContentsManager
+from .manager import (
+    ContentsManager, parse_sort_key, check_page, directory_sort_key,
+    page_info,
+)
+from .notebookpatch import apply_patch, validate_patched
 from ...utils import exists
 
 from ipython_genutils.importstring import import_item
-from traitlets import Any, Unicode, Bool, TraitError, observe, default, validate
+from traitlets import (
+    Any, Unicode, Bool, Integer, TraitError, observe, default, validate,
+)
 from ipython_genutils.py3compat import getcwd, string_types
 
 from notebook import _tz as tz
@@ -39,9 +53,54 @@ except ImportError:
     # windows + py2
     from notebook.utils import samefile_simple as samefile
 
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # py2 backport
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+def _call_now(func, *args, **kwargs):
+    """The I/O runner of FileContentsManager, calling func right away"""
+    return func(*args, **kwargs)
+
+
+def _run_steps(steps):
+    """Run the steps of an operation synchronously, returning its result
+
+    Operations shared by FileContentsManager and AsyncFileContentsManager
+    are written as generators, like the body of a tornado coroutine,
+    taking the function running their I/O. They yield its results,
+    and the results of methods that return Futures in
+    AsyncFileContentsManager, where gen.coroutine runs them.
+    FileContentsManager runs them here, where every result is a plain
+    value, sent back to the generator.
+    """
+    value = None
+    try:
+        while True:
+            value = steps.send(value)
+    except gen.Return as e:
+        return e.value
+    except StopIteration:
+        return None
+
+
 _script_exporter = None
 
 
+def stat_revision(st):
+    """Get the revision of a file from its stat result
+
+    Changes whenever the file is modified or replaced.
+    """
+    mtime = getattr(st, 'st_mtime_ns', None) or int(st.st_mtime * 1e9)
+    return '%x-%x-%x' % (mtime, st.st_size, st.st_ino)
+
+
 def _post_save_script(model, os_path, contents_manager, **kwargs):
     """convert notebooks to Python script after save with nbconvert
 
@@ -156,6 +215,76 @@ class FileContentsManager(FileManagerMixin, ContentsManager):
         platform's trash/recycle bin, where they can be recovered. If False,
         deleting files really deletes them.""")
 
+    dir_listing_cache_size = Integer(0, config=True,
+        help="""The number of directory listings to keep in memory.
+
+        A cached listing is reused for as long as the modification time of
+        the directory itself is unchanged, which avoids stat-ing every entry
+        again when large directories are listed repeatedly.
+        Changes made through this contents manager invalidate the cache, but
+        metadata of files modified in place by other processes may be stale
+        until the directory itself changes.
+
+        Set to 0 (default) to disable the cache.
+        """
+    )
+
+    notebook_cache_size = Integer(0, config=True,
+        help="""The total size, in bytes, of the notebook files to keep parsed in memory.
+
+        Reading a notebook again while it is unchanged on disk
+        (same modification time, size and inode) then reuses
+        the parsed and validated notebook, instead of parsing and
+        validating the file again. The least recently read notebooks
+        are evicted first. Notebooks take several times their file size
+        in memory.
+
+        Set to 0 (default) to disable the cache.
+        """
+    )
+
+    _notebook_cache = Any()
+    @default('_notebook_cache')
+    def _default_notebook_cache(self):
+        return OrderedDict()
+
+    _notebook_cache_lock = Any()
+    @default('_notebook_cache_lock')
+    def _default_notebook_cache_lock(self):
+        return threading.Lock()
+
+    _notebook_cache_stats = Any()
+    @default('_notebook_cache_stats')
+    def _default_notebook_cache_stats(self):
+        return {'hits': 0, 'misses': 0, 'evictions': 0, 'size': 0}
+
+    notebook_patch_cache_size = Integer(8, config=True,
+        help="""The number of patched notebooks to keep in memory.
+
+        Keeping the last notebooks saved with JSON-patch deltas avoids
+        reading and parsing them again for the next delta.
+        A kept notebook is only reused if the file is unchanged on disk.
+
+        Set to 0 to disable.
+        """
+    )
+
+    _patch_cache = Any()
+    @default('_patch_cache')
+    def _default_patch_cache(self):
+        return OrderedDict()
+
+    _dir_listing_cache = Any()
+    @default('_dir_listing_cache')
+    def _default_dir_listing_cache(self):
+        return OrderedDict()
+
+    # listings can be built on the threads of AsyncFileContentsManager
+    _dir_listing_lock = Any()
+    @default('_dir_listing_lock')
+    def _default_dir_listing_lock(self):
+        return threading.Lock()
+
     @default('files_handler_class')
     def _files_handler_class_default(self):
         return AuthenticatedFileHandler
@@ -244,6 +373,10 @@ class FileContentsManager(FileManagerMixin, ContentsManager):
         """Build the common base of a contents model"""
         os_path = self._get_os_path(path)
         info = os.lstat(os_path)
+        return self._stat_model(path, os_path, info)
+
+    def _stat_model(self, path, os_path, info):
+        """Build the common base of a contents model from a stat result"""
         try:
             last_modified = tz.utcfromtimestamp(info.st_mtime)
         except (ValueError, OSError):
@@ -276,28 +409,16 @@ class FileContentsManager(FileManagerMixin, ContentsManager):
             model['writable'] = False
         return model
 
-    def _dir_model(self, path, content=True):
-        """Build a model for a directory
+    def _scan_dir(self, os_dir):
+        """Iterate over the entries of a directory
 
-        if content is requested, will include a listing of the directory
+        Yields ``(name, os_path, st, is_dir)`` tuples, where ``st`` is the
+        result of lstat-ing the entry. Uses scandir where available,
+        so that each entry is stat-ed at most once.
+        Entries that can't be stat-ed (e.g. removed during the listing)
+        are logged and skipped.
         """
-        os_path = self._get_os_path(path)
-
-        four_o_four = u'directory does not exist: %r' % path
-
-        if not os.path.isdir(os_path):
-            raise web.HTTPError(404, four_o_four)
-        elif is_hidden(os_path, self.root_dir) and not self.allow_hidden:
-            self.log.info("Refusing to serve hidden directory %r, via 404 Error",
-                os_path
-            )
-            raise web.HTTPError(404, four_o_four)
-
-        model = self._base_model(path)
-        model['type'] = 'directory'
-        if content:
-            model['content'] = contents = []
-            os_dir = self._get_os_path(path)
+        if scandir is None:
             for name in os.listdir(os_dir):
                 try:
                     os_path = os.path.join(os_dir, name)
@@ -305,29 +426,273 @@ class FileContentsManager(FileManagerMixin, ContentsManager):
                     self.log.warning(
                         "failed to decode filename '%s': %s", name, e)
                     continue
-
                 try:
                     st = os.lstat(os_path)
                 except OSError as e:
-                    # skip over broken symlinks in listing
-                    if e.errno == errno.ENOENT:
-                        self.log.warning("%s doesn't exist", os_path)
-                    else:
-                        self.log.warning("Error stat-ing %s: %s", os_path, e)
+                    self._log_stat_error(os_path, e)
                     continue
+                if stat.S_ISLNK(st.st_mode):
+                    is_dir = os.path.isdir(os_path)
+                else:
+                    is_dir = stat.S_ISDIR(st.st_mode)
+                yield name, os_path, st, is_dir
+            return
 
-                if (not stat.S_ISLNK(st.st_mode)
-                        and not stat.S_ISREG(st.st_mode)
-                        and not stat.S_ISDIR(st.st_mode)):
-                    self.log.debug("%s not a regular file", os_path)
+        entries = scandir(os_dir)
+        try:
+            for entry in entries:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    is_dir = entry.is_dir()
+                except OSError as e:
+                    self._log_stat_error(entry.path, e)
                     continue
+                yield entry.name, entry.path, st, is_dir
+        finally:
+            if hasattr(entries, 'close'):
+                entries.close()
+
+    def _log_stat_error(self, os_path, e):
+        """Log an error stat-ing a directory entry"""
+        # skip over broken symlinks in listing
+        if e.errno == errno.ENOENT:
+            self.log.warning("%s doesn't exist", os_path)
+        else:
+            self.log.warning("Error stat-ing %s: %s", os_path, e)
+
+    def _dir_entry_model(self, path, os_path, st, is_dir):
+        """Build the model (without content) of an entry in a directory listing
+
+        Equivalent to ``self.get(path, content=False)``,
+        but built from the stat result of the listing.
+        """
+        model = self._stat_model(path, os_path, st)
+        if is_dir:
+            model['type'] = 'directory'
+        elif path.endswith('.ipynb'):
+            model['type'] = 'notebook'
+        else:
+            model['type'] = 'file'
+            model['mimetype'] = mimetypes.guess_type(os_path)[0]
+        return model
+
+    def _saved_model(self, path, os_path, st):
+        """Build the model (without content) of a file just saved
+
+        Equivalent to ``self.get(path, content=False)``,
+        but built from the stat result of the written file, when available.
+        May return a Future in subclasses where get does.
+        """
+        if st is None or os.path.islink(os_path):
+            # models of symlinks have the times of the link itself
+            return self.get(path, content=False)
+        return self._dir_entry_model(path, os_path, st, False)
+
+    def _visible_entries(self, path, os_dir):
+        """Iterate over the entries of a directory that should be listed
+
+        Yields ``(path, os_path, st, is_dir)`` tuples,
+        which can be passed to `_dir_entry_model`.
+        """
+        for name, os_path, st, is_dir in self._scan_dir(os_dir):
+            if (not stat.S_ISLNK(st.st_mode)
+                    and not stat.S_ISREG(st.st_mode)
+                    and not stat.S_ISDIR(st.st_mode)):
+                self.log.debug("%s not a regular file", os_path)
+                continue
+
+            if self.should_list(name) and not is_file_hidden(os_path, stat_res=st):
+                entry_path = ('%s/%s' % (path, name)).strip('/')
+                yield entry_path, os_path, st, is_dir
+
+    def _list_dir(self, path, os_dir):
+        """Build the models of the visible entries of a directory"""
+        return [
+            self._dir_entry_model(*entry)
+            for entry in self._visible_entries(path, os_dir)
+        ]
+
+    def _cached_listing(self, path, os_dir):
+        """Get the cached listing of a directory, listing it if needed
+
+        Returns a dict with the 'models' of the entries of the directory,
+        and the lists of these models 'sorted' by sort key,
+        which are filled in by `get_directory_page`.
+        The cached models must not be modified.
+        """
+        st = os.stat(os_dir)
+        stamp = (getattr(st, 'st_mtime_ns', st.st_mtime), st.st_ino, st.st_size)
+        cache = self._dir_listing_cache
+        with self._dir_listing_lock:
+            cached = cache.pop(os_dir, None)
+        if cached is not None and cached[0] == stamp:
+            listing = cached[1]
+        else:
+            listing = {'models': self._list_dir(path, os_dir), 'sorted': {}}
+        with self._dir_listing_lock:
+            cache[os_dir] = (stamp, listing)
+            while len(cache) > self.dir_listing_cache_size:
+                cache.popitem(last=False)
+        return listing
 
-                if self.should_list(name) and not is_file_hidden(os_path, stat_res=st):
-                    contents.append(self.get(
-                        path='%s/%s' % (path, name),
-                        content=False)
-                    )
+    def _cached_list_dir(self, path, os_dir):
+        """Return the models of the entries of a directory
 
+        Uses the directory listing cache, if enabled.
+        """
+        if self.dir_listing_cache_size <= 0:
+            return self._list_dir(path, os_dir)
+        contents = self._cached_listing(path, os_dir)['models']
+        # hand out copies, so that callers can't modify the cached models
+        return [dict(model) for model in contents]
+
+    def _invalidate_dir_listing(self, os_path):
+        """Forget the cached listing of the directory containing os_path"""
+        with self._dir_listing_lock:
+            self._dir_listing_cache.pop(os.path.dirname(os_path), None)
+
+    def _forget_dir_listings(self, os_dir):
+        """Forget the cached listings of a directory and its subdirectories
+
+        Used when the directory itself is removed or moved.
+        """
+        prefix = os.path.join(os_dir, '')
+        with self._dir_listing_lock:
+            cache = self._dir_listing_cache
+            for key in [k for k in cache if k == os_dir or k.startswith(prefix)]:
+                del cache[key]
+
+    def _read_validated_notebook(self, os_path):
+        """Read and validate a notebook
+
+        Uses the parsed notebook cache, if enabled.
+
+        Returns the notebook, and its validation message or None.
+        The notebook may be the cached one, which must not be modified:
+        see `_trusted_notebook` and `_copy_cells`.
+        """
+        if self.notebook_cache_size <= 0:
+            return self._validate_read_notebook(os_path)
+
+        st = os.stat(os_path)
+        revision = stat_revision(st)
+        stats = self._notebook_cache_stats
+        with self._notebook_cache_lock:
+            cached = self._notebook_cache.pop(os_path, None)
+            if cached is not None and cached[0] == revision:
+                # move to the end, as the most recently used
+                self._notebook_cache[os_path] = cached
+                stats['hits'] += 1
+            else:
+                if cached is not None:
+                    stats['size'] -= cached[3]
+                cached = None
+                stats['misses'] += 1
+        if cached is not None:
+            return cached[1], cached[2]
+
+        nb, message = self._validate_read_notebook(os_path)
+        if st.st_size <= self.notebook_cache_size:
+            self._cache_notebook(os_path, revision, nb, message, st.st_size)
+        return nb, message
+
+    def _copy_cells(self, nb):
+        """Copy a notebook read by `_read_validated_notebook`, for signing
+
+        Only the notebook, its metadata, and its cells and their metadata,
+        which marking trusted cells and signing modify, are copied.
+        Sources and outputs are shared with the cached notebook.
+        """
+        nb = nbformat.NotebookNode(nb)
+        nb.metadata = nbformat.NotebookNode(nb.metadata)
+        cells = []
+        for cell in nb.cells:
+            cell = nbformat.NotebookNode(cell)
+            cell.metadata = nbformat.NotebookNode(cell.metadata)
+            cells.append(cell)
+        nb.cells = cells
+        return nb
+
+    def _trusted_notebook(self, nb, path):
+        """Copy a notebook read by `_read_validated_notebook`,
+        marking its trusted cells
+        """
+        nb = self._copy_cells(nb)
+        self.mark_trusted_cells(nb, path)
+        return nb
+
+    def _validate_read_notebook(self, os_path):
+        nb = self._read_notebook(os_path, as_version=4)
+        model = self.validate_notebook_model({'content': nb})
+        return nb, model.get('message')
+
+    def _cache_notebook(self, os_path, revision, nb, message, size):
+        """Add a parsed notebook to the cache, evicting the least recently used"""
+        stats = self._notebook_cache_stats
+        cache = self._notebook_cache
+        with self._notebook_cache_lock:
+            cached = cache.pop(os_path, None)
+            if cached is not None:
+                stats['size'] -= cached[3]
+            cache[os_path] = (revision, nb, message, size)
+            stats['size'] += size
+            while stats['size'] > self.notebook_cache_size:
+                evicted = cache.popitem(last=False)[1]
+                stats['size'] -= evicted[3]
+                stats['evictions'] += 1
+
+    def _forget_notebooks(self, os_path):
+        """Forget the cached notebooks at os_path, or in the directory at os_path"""
+        if not self._notebook_cache:
+            return
+        prefix = os.path.join(os_path, '')
+        stats = self._notebook_cache_stats
+        with self._notebook_cache_lock:
+            cache = self._notebook_cache
+            for key in [k for k in cache if k == os_path or k.startswith(prefix)]:
+                stats['size'] -= cache.pop(key)[3]
+
+    def notebook_cache_stats(self):
+        """Get the statistics of the parsed notebook cache, to size it
+
+        Returns a dict with the numbers of cache 'hits', 'misses' and
+        'evictions', the number of cached 'notebooks', and their total
+        'size' out of 'max_size'.
+        """
+        with self._notebook_cache_lock:
+            stats = dict(self._notebook_cache_stats)
+            stats['notebooks'] = len(self._notebook_cache)
+        stats['max_size'] = self.notebook_cache_size
+        return stats
+
+    def _get_dir_os_path(self, path):
+        """Get the OS path of a directory
+
+        Raises 404 if the directory doesn't exist or is hidden.
+        """
+        os_path = self._get_os_path(path)
+
+        four_o_four = u'directory does not exist: %r' % path
+
+        if not os.path.isdir(os_path):
+            raise web.HTTPError(404, four_o_four)
+        elif is_hidden(os_path, self.root_dir) and not self.allow_hidden:
+            self.log.info("Refusing to serve hidden directory %r, via 404 Error",
+                os_path
+            )
+            raise web.HTTPError(404, four_o_four)
+        return os_path
+
+    def _dir_model(self, path, content=True):
+        """Build a model for a directory
+
+        if content is requested, will include a listing of the directory
+        """
+        os_path = self._get_dir_os_path(path)
+        model = self._base_model(path)
+        model['type'] = 'directory'
+        if content:
+            model['content'] = self._cached_list_dir(path, os_path)
             model['format'] = 'json'
 
         return model
@@ -374,11 +739,12 @@ class FileContentsManager(FileManagerMixin, ContentsManager):
         model['type'] = 'notebook'
         if content:
             os_path = self._get_os_path(path)
-            nb = self._read_notebook(os_path, as_version=4)
-            self.mark_trusted_cells(nb, path)
+            nb, validation_message = self._read_validated_notebook(os_path)
+            nb = self._trusted_notebook(nb, path)
             model['content'] = nb
             model['format'] = 'json'
-            self.validate_notebook_model(model)
+            if validation_message:
+                model['message'] = validation_message
         return model
 
     def get(self, path, content=True, type=None, format=None):
@@ -403,26 +769,157 @@ class FileContentsManager(FileManagerMixin, ContentsManager):
             the contents model. If content=True, returns the contents
             of the file or directory as well.
         """
-        path = path.strip('/')
+        return _run_steps(self._get_steps(path, content, type, format, _call_now))
 
+    def _lookup(self, path, os_path):
+        """Check that a path exists, returning whether it is a directory"""
         if not self.exists(path):
             raise web.HTTPError(404, u'No such file or directory: %s' % path)
+        return os.path.isdir(os_path)
 
+    def _get_steps(self, path, content, type, format, run_io):
+        """The steps of `get`, see `_run_steps`"""
+        path = path.strip('/')
         os_path = self._get_os_path(path)
-        if os.path.isdir(os_path):
+        is_dir = yield run_io(self._lookup, path, os_path)
+        if is_dir:
             if type not in (None, 'directory'):
                 raise web.HTTPError(400,
                                 u'%s is a directory, not a %s' % (path, type), reason='bad type')
-            model = self._dir_model(path, content=content)
+            model = yield run_io(self._dir_model, path, content=content)
         elif type == 'notebook' or (type is None and path.endswith('.ipynb')):
-            model = self._notebook_model(path, content=content)
+            model = yield self._notebook_model(path, content=content)
         else:
             if type == 'directory':
                 raise web.HTTPError(400,
                                 u'%s is not a directory' % path, reason='bad type')
-            model = self._file_model(path, content=content, format=format)
+            model = yield run_io(self._file_model, path, content=content, format=format)
+        raise gen.Return(model)
+
+    def iter_directory(self, path):
+        """Iterate over the models of the entries of a directory
+
+        Entries are stat-ed and yielded one at a time,
+        so that the listing is never held in memory as a whole.
+        """
+        path = path.strip('/')
+        os_dir = self._get_dir_os_path(path)
+        return (
+            self._dir_entry_model(*entry)
+            for entry in self._visible_entries(path, os_dir)
+        )
+
+    def get_directory_page(self, path, offset=0, limit=None, sort='name'):
+        """Get a directory model containing one page of its listing
+
+        If the directory listing cache is enabled, the sorted listing is
+        cached as well, so that each following page is a slice of it.
+        Otherwise, entries are sorted by their stat results,
+        only keeping the first offset + limit of them in memory,
+        and models are only built for the entries in the page.
+        """
+        path = path.strip('/')
+        key, reverse = parse_sort_key(sort)
+        check_page(offset, limit)
+        model = self._dir_model(path, content=False)
+        os_dir = self._get_os_path(path)
+        stop = None if limit is None else offset + limit
+
+        if self.dir_listing_cache_size > 0:
+            listing = self._cached_listing(path, os_dir)
+            ordered = listing['sorted'].get(sort)
+            if ordered is None:
+                ordered = sorted(listing['models'],
+                    key=directory_sort_key(key), reverse=reverse)
+                listing['sorted'][sort] = ordered
+            total = len(ordered)
+            model['content'] = [dict(m) for m in ordered[offset:stop]]
+        else:
+            if key == 'name':
+                sort_key = lambda entry: entry[0]
+            else:
+                # break ties by name, for a stable order across pages
+                sort_key = lambda entry: (entry[2].st_mtime, entry[0])
+            entries = self._visible_entries(path, os_dir)
+            if stop is None:
+                entries = sorted(entries, key=sort_key, reverse=reverse)
+                total = len(entries)
+            else:
+                counter = itertools.count()
+                def counted(entries):
+                    for entry in entries:
+                        next(counter)
+                        yield entry
+                select = heapq.nlargest if reverse else heapq.nsmallest
+                entries = select(stop, counted(entries), key=sort_key)
+                total = next(counter)
+            model['content'] = [
+                self._dir_entry_model(*entry) for entry in entries[offset:stop]
+            ]
+        model['format'] = 'json'
+        model['pagination'] = page_info(offset, limit, total, sort)
         return model
 
+    def open_raw(self, path):
+        """Open a file, to read its raw bytes in chunks"""
+        path = path.strip('/')
+        os_path = self._get_os_path(path)
+        if not os.path.isfile(os_path):
+            raise web.HTTPError(400, u'Cannot read non-file %s' % path)
+        with self.perm_to_403(os_path):
+            return io.open(os_path, 'rb')
+
+    def open_raw_writer(self, path):
+        """Start saving a file from its raw bytes
+
+        The bytes are written to disk as they are received.
+        The pre-save hook is called with a model whose content is None,
+        since the content is never held in memory.
+        """
+        path = path.strip('/')
+        os_path = self._check_raw_writer(path)
+        return self._raw_writer(os_path)
+
+    def _check_raw_writer(self, path):
+        """Check that a file can be saved from its raw bytes
+
+        Runs the pre-save hook, and returns the OS path of the file.
+        """
+        if path.endswith('.ipynb'):
+            raise web.HTTPError(400, u'Notebooks must be saved as JSON models')
+        os_path = self._get_os_path(path)
+        if os.path.isdir(os_path):
+            raise web.HTTPError(400, u'%s is a directory' % path)
+        if is_hidden(os.path.dirname(os_path), self.root_dir) and not self.allow_hidden:
+            raise web.HTTPError(400, u'Cannot save to hidden directory %r' % path)
+        self.log.debug("Saving %s from raw bytes", os_path)
+        self.run_pre_save_hook(
+            model={'type': 'file', 'format': None, 'content': None}, path=path)
+        return os_path
+
+    def _commit_raw_writer(self, writer):
+        """Replace the target file of a raw writer"""
+        try:
+            with self.perm_to_403(writer.path):
+                writer.commit()
+        except Exception:
+            writer.abort()
+            raise
+        finally:
+            self._invalidate_dir_listing(writer.path)
+
+    def close_raw_writer(self, writer, path):
+        """Save a file written from its raw bytes"""
+        path = path.strip('/')
+        self._commit_raw_writer(writer)
+        model = self.get(path, content=False)
+        self.run_post_save_hook(model=model, os_path=self._get_os_path(path))
+        return model
+
+    def abort_raw_writer(self, writer):
+        """Discard a file written from its raw bytes"""
+        writer.abort()
+
     def _save_directory(self, os_path, model, path=''):
         """create a directory"""
         if is_hidden(os_path, self.root_dir) and not self.allow_hidden:
@@ -435,8 +932,20 @@ class FileContentsManager(FileManagerMixin, ContentsManager):
         else:
             self.log.debug("Directory %r already exists", os_path)
 
+    def _ensure_checkpoint(self, path):
+        """Create the first checkpoint of a notebook, if it has none
+
+        One checkpoint should always exist for notebooks.
+        """
+        if not self.checkpoints.list_checkpoints(path):
+            self.create_checkpoint(path)
+
     def save(self, model, path=''):
         """Save the file model and return the model with no content."""
+        return _run_steps(self._save_steps(model, path, _call_now))
+
+    def _save_steps(self, model, path, run_io):
+        """The steps of `save`, see `_run_steps`"""
         path = path.strip('/')
 
         if 'type' not in model:
@@ -449,19 +958,22 @@ class FileContentsManager(FileManagerMixin, ContentsManager):
 
         self.run_pre_save_hook(model=model, path=path)
 
+        validation_message = None
         try:
             if model['type'] == 'notebook':
                 nb = nbformat.from_dict(model['content'])
                 self.check_and_sign(nb, path)
-                self._save_notebook(os_path, nb)
-                # One checkpoint should always exist for notebooks.
-                if not self.checkpoints.list_checkpoints(path):
-                    self.create_checkpoint(path)
+                # validate once, nbformat doesn't validate again when writing
+                validated = yield run_io(self.validate_notebook_model, {'content': nb})
+                validation_message = validated.get('message')
+                st = yield run_io(self._save_notebook, os_path, nb)
+                yield self._ensure_checkpoint(path)
             elif model['type'] == 'file':
                 # Missing format will be handled internally by _save_file.
-                self._save_file(os_path, model['content'], model.get('format'))
+                st = yield run_io(
+                    self._save_file, os_path, model['content'], model.get('format'))
             elif model['type'] == 'directory':
-                self._save_directory(os_path, model, path)
+                yield run_io(self._save_directory, os_path, model, path)
             else:
                 raise web.HTTPError(400, "Unhandled contents type: %s" % model['type'])
         except web.HTTPError:
@@ -469,19 +981,124 @@ class FileContentsManager(FileManagerMixin, ContentsManager):
         except Exception as e:
             self.log.error(u'Error while saving file: %s %s', path, e, exc_info=True)
             raise web.HTTPError(500, u'Unexpected error while saving file: %s %s' % (path, e))
+        finally:
+            self._invalidate_dir_listing(os_path)
+            self._forget_notebooks(os_path)
 
-        validation_message = None
-        if model['type'] == 'notebook':
-            self.validate_notebook_model(model)
-            validation_message = model.get('message', None)
+        if model['type'] == 'directory':
+            model = yield self.get(path, content=False)
+        else:
+            model = yield self._saved_model(path, os_path, st)
+        if validation_message:
+            model['message'] = validation_message
 
-        model = self.get(path, content=False)
+        self.run_post_save_hook(model=model, os_path=os_path)
+
+        raise gen.Return(model)
+
+    def get_revision(self, path):
+        """Get the revision of a file, from its modification time, size and inode"""
+        os_path = self._get_os_path(path.strip('/'))
+        try:
+            st = os.stat(os_path)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                raise web.HTTPError(404, u'No such file or directory: %s' % path)
+            raise
+        return stat_revision(st)
+
+    def _check_revision(self, path, current, revision):
+        if revision is not None and revision != current:
+            raise web.HTTPError(412, u'Notebook %s has changed' % path)
+
+    def _pop_patch_base(self, os_path, revision):
+        """Take a notebook kept by `_keep_patch_base` out of the cache
+
+        Returns None if it isn't cached at this revision.
+        The notebook is removed from the cache while it is patched,
+        so that a failed patch doesn't leave a half-patched notebook behind.
+        """
+        entry = self._patch_cache.pop(os_path, None)
+        if entry is not None and entry[0] == revision:
+            return entry[1]
+
+    def _keep_patch_base(self, os_path, revision, nb):
+        """Keep a notebook just saved, to patch it again without reading it"""
+        if self.notebook_patch_cache_size <= 0:
+            return
+        # mark cells like reading the notebook again would
+        self.notary.mark_cells(nb, self.notary.check_cells(nb))
+        self._patch_cache[os_path] = (revision, nb)
+        while len(self._patch_cache) > self.notebook_patch_cache_size:
+            self._patch_cache.popitem(last=False)
+
+    def _apply_patch(self, nb, operations, path):
+        """Apply a patch and the pre-save hook to a notebook
+
+        Returns the patched notebook and its validation message.
+        """
+        touched_cells, metadata_touched = apply_patch(nb, operations)
+        validation_message = validate_patched(nb, touched_cells, metadata_touched)
+        model = {'type': 'notebook', 'content': nb}
+        self.run_pre_save_hook(model=model, path=path)
+        return model['content'], validation_message
+
+    def patch_notebook(self, path, operations, revision=None):
+        """Save a notebook by applying JSON-patch operations to it
+
+        See ContentsManager.patch_notebook.
+
+        The notebooks last patched are kept in memory,
+        so that successive patches don't read and parse them again,
+        and only the cells and metadata modified by a patch are validated.
+        The file itself is still rewritten whole.
+        """
+        return _run_steps(self._patch_notebook_steps(path, operations, revision, _call_now))
+
+    def _patch_notebook_steps(self, path, operations, revision, run_io):
+        """The steps of `patch_notebook`, see `_run_steps`"""
+        path = path.strip('/')
+        os_path = self._get_os_path(path)
+        is_dir = yield run_io(os.path.isdir, os_path)
+        if is_dir:
+            raise web.HTTPError(400, u'%s is a directory, not a notebook' % path)
+        current = yield run_io(self.get_revision, path)
+        self._check_revision(path, current, revision)
+
+        nb = self._pop_patch_base(os_path, current)
+        if nb is None:
+            nb, _ = yield run_io(self._read_validated_notebook, os_path)
+            # patches can modify any part of the notebook
+            nb = copy.deepcopy(nb)
+            self.mark_trusted_cells(nb, path)
+        nb, validation_message = self._apply_patch(nb, operations, path)
+
+        self.log.debug("Saving patched %s", os_path)
+        try:
+            self.check_and_sign(nb, path)
+            st = yield run_io(self._save_notebook, os_path, nb)
+            yield self._ensure_checkpoint(path)
+        except web.HTTPError:
+            raise
+        except Exception as e:
+            self.log.error(u'Error while saving file: %s %s', path, e, exc_info=True)
+            raise web.HTTPError(500, u'Unexpected error while saving file: %s %s' % (path, e))
+        finally:
+            self._invalidate_dir_listing(os_path)
+            self._forget_notebooks(os_path)
+
+        model = yield self._saved_model(path, os_path, st)
         if validation_message:
             model['message'] = validation_message
+        if st is not None:
+            revision = stat_revision(st)
+        else:
+            revision = yield run_io(self.get_revision, path)
+        self._keep_patch_base(os_path, revision, nb)
 
         self.run_post_save_hook(model=model, os_path=os_path)
 
-        return model
+        raise gen.Return(model)
 
     def delete_file(self, path):
         """Delete file at path."""
@@ -491,6 +1108,9 @@ class FileContentsManager(FileManagerMixin, ContentsManager):
         if not os.path.exists(os_path):
             raise web.HTTPError(404, u'File or directory does not exist: %s' % os_path)
 
+        self._invalidate_dir_listing(os_path)
+        self._forget_dir_listings(os_path)
+        self._forget_notebooks(os_path)
         if self.delete_to_trash:
             self.log.debug("Sending %s to trash", os_path)
             # Looking at the code in send2trash, I don't think the errors it
@@ -530,6 +1150,12 @@ class FileContentsManager(FileManagerMixin, ContentsManager):
         if os.path.exists(new_os_path) and not samefile(old_os_path, new_os_path):
             raise web.HTTPError(409, u'File already exists: %s' % new_path)
 
+        self._invalidate_dir_listing(old_os_path)
+        self._invalidate_dir_listing(new_os_path)
+        self._forget_dir_listings(old_os_path)
+        self._forget_notebooks(old_os_path)
+        self._forget_notebooks(new_os_path)
+
         # Move the file
         try:
             with self.perm_to_403():
@@ -539,6 +1165,118 @@ class FileContentsManager(FileManagerMixin, ContentsManager):
         except Exception as e:
             raise web.HTTPError(500, u'Unknown error renaming file: %s %s' % (old_path, e))
 
+    def _copies_model(self, nb):
+        """Whether a notebook must be copied by saving its model
+
+        When a pre-save hook may modify the notebook,
+        or when it needs converting to the current nbformat.
+        """
+        return bool(self.pre_save_hook) or 'orig_nbformat' in nb.metadata
+
+    def _sign_copy(self, nb, path):
+        """Sign the copy of a notebook, like saving it would
+
+        The copy has the same signature as the notebook,
+        so it only needs signing if the notebook isn't signed.
+        """
+        if self.notary.check_signature(nb):
+            return
+        nb = self._copy_cells(nb)
+        self.notary.mark_cells(nb, False)
+        self.check_and_sign(nb, path)
+
+    def _copy_error(self, path, e):
+        self.log.error(u'Error while copying file: %s %s', path, e, exc_info=True)
+        return web.HTTPError(500, u'Unexpected error while copying file: %s %s' % (path, e))
+
+    def copy(self, from_path, to_path=None):
+        """Copy an existing file on the filesystem, and return its new model.
+
+        Unlike ContentsManager.copy, the file is not read into a model and saved,
+        except for notebooks with a pre-save hook, or an older nbformat.
+
+        See ContentsManager.copy
+        """
+        return _run_steps(self._copy_steps(from_path, to_path, _call_now))
+
+    def _copy_steps(self, from_path, to_path, run_io):
+        """The steps of `copy`, see `_run_steps`"""
+        path = from_path.strip('/')
+        model = yield self.get(path, content=False)
+        if model['type'] == 'directory':
+            raise web.HTTPError(400, "Can't copy directories")
+        to_path = yield run_io(self._copy_path, path, to_path)
+        os_path = self._get_os_path(path)
+        to_os_path = self._get_os_path(to_path)
+
+        validation_message = None
+        if model['type'] == 'notebook':
+            nb, validation_message = yield run_io(self._read_validated_notebook, os_path)
+            if self._copies_model(nb):
+                # like ContentsManager.copy
+                model = yield self.get(path)
+                model.pop('path', None)
+                model.pop('name', None)
+                model = yield self.save(model, to_path)
+                raise gen.Return(model)
+            self._sign_copy(nb, to_path)
+        else:
+            self.run_pre_save_hook(
+                model={'type': 'file', 'format': None, 'content': None}, path=to_path)
+
+        self.log.debug("Copying %s to %s", os_path, to_os_path)
+        try:
+            st = yield run_io(self._copy_file, os_path, to_os_path)
+            if model['type'] == 'notebook':
+                yield self._ensure_checkpoint(to_path)
+        except web.HTTPError:
+            raise
+        except Exception as e:
+            raise self._copy_error(to_path, e)
+        finally:
+            self._invalidate_dir_listing(to_os_path)
+            self._forget_notebooks(to_os_path)
+
+        model = yield self._saved_model(to_path, to_os_path, st)
+        if validation_message:
+            model['message'] = validation_message
+        self.run_post_save_hook(model=model, os_path=to_os_path)
+        raise gen.Return(model)
+
+    def update(self, model, path):
+        """Update the file's path
+
+        See ContentsManager.update
+        """
+        return _run_steps(self._update_steps(model, path))
+
+    def _update_steps(self, model, path):
+        """The steps of `update`, see `_run_steps`"""
+        path = path.strip('/')
+        new_path = model.get('path', path).strip('/')
+        if path != new_path:
+            yield self.rename(path, new_path)
+        model = yield self.get(new_path, content=False)
+        raise gen.Return(model)
+
+    def restore_checkpoint(self, checkpoint_id, path):
+        """Restore a checkpoint."""
+        try:
+            super(FileContentsManager, self).restore_checkpoint(checkpoint_id, path)
+        finally:
+            # checkpoints are restored in place, keeping the checkpoint's mtime,
+            # which doesn't change the mtime of the directory
+            os_path = self._get_os_path(path.strip('/'))
+            self._invalidate_dir_listing(os_path)
+            self._forget_notebooks(os_path)
+
+    def shutdown(self):
+        """Sync the files not synced to disk yet"""
+        self.file_syncer.close()
+        syncer = getattr(self.checkpoints, 'file_syncer', None)
+        if syncer is not None:
+            syncer.close()
+
     def info_string(self):
         return _("Serving notebooks from local directory: %s") % self.root_dir
 
@@ -551,3 +1289,317 @@ class FileContentsManager(FileManagerMixin, ContentsManager):
         else:
             parent_dir = ''
         return parent_dir
+
+
+class AsyncFileContentsManager(FileContentsManager):
+    """A FileContentsManager that does its filesystem I/O on a thread pool
+
+    Reading, writing and listing files, as well as copying checkpoints,
+    run on a bounded pool of threads, so that large files or slow
+    filesystems don't block the notebook server's event loop.
+    Methods that do I/O return Futures.
+
+    Notebook signing and hooks still run on the event loop's thread.
+    """
+
+    max_io_workers = Integer(4, config=True,
+        help="""The maximum number of threads used for filesystem I/O.
+
+        Requires the `futures` package on Python 2.
+        """
+    )
+
+    executor = Any(help="The concurrent.futures Executor running the filesystem I/O")
+
+    _io_on_executor = True
+
+    @default('executor')
+    def _default_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+        return ThreadPoolExecutor(max_workers=self.max_io_workers)
+
+    checkpoint_scheduler = Any(
+        help="The CheckpointScheduler creating checkpoints in the background")
+
+    @default('checkpoint_scheduler')
+    def _default_checkpoint_scheduler(self):
+        return CheckpointScheduler(self._create_checkpoint)
+
+    def checkpoint_queue_stats(self):
+        """Get the statistics of the checkpoints created in the background
+
+        Returns a dict with the numbers of checkpoints 'queued' and 'running',
+        and the numbers of checkpoints 'created', of requests 'coalesced'
+        with another, and of creations that 'failed'.
+        """
+        return self.checkpoint_scheduler.stats()
+
+    def shutdown(self):
+        """Wait for pending I/O and stop the thread pool"""
+        self.executor.shutdown(wait=True)
+        super(AsyncFileContentsManager, self).shutdown()
+
+    def run_in_executor(self, func, *args, **kwargs):
+        """Call func(*args, **kwargs) on the I/O thread pool
+
+        Returns a Future of the result.
+        """
+        return self.executor.submit(func, *args, **kwargs)
+
+    @gen.coroutine
+    def _notebook_model(self, path, content=True):
+        """Build a notebook model, reading the notebook on the thread pool"""
+        model = yield self.run_in_executor(self._base_model, path)
+        model['type'] = 'notebook'
+        if content:
+            os_path = self._get_os_path(path)
+            nb, validation_message = yield self.run_in_executor(
+                self._read_validated_notebook, os_path)
+            nb = self._trusted_notebook(nb, path)
+            model['content'] = nb
+            model['format'] = 'json'
+            if validation_message:
+                model['message'] = validation_message
+        raise gen.Return(model)
+
+    @gen.coroutine
+    def get(self, path, content=True, type=None, format=None):
+        """Takes a path for an entity and returns its model
+
+        See FileContentsManager.get
+        """
+        # gen.coroutine runs the generator of the steps
+        return self._get_steps(path, content, type, format, self.run_in_executor)
+
+    def iter_directory(self, path):
+        """Start iterating over a directory, on the thread pool
+
+        Returns a Future of the iterator,
+        which should be consumed with `read_directory_batch`.
+        """
+        return self.run_in_executor(
+            super(AsyncFileContentsManager, self).iter_directory, path)
+
+    def read_directory_batch(self, entries, size):
+        """Get the next models of a directory listing, on the thread pool"""
+        return self.run_in_executor(
+            super(AsyncFileContentsManager, self).read_directory_batch,
+            entries, size,
+        )
+
+    def get_directory_page(self, path, offset=0, limit=None, sort='name'):
+        """Get one page of a directory listing, on the thread pool"""
+        return self.run_in_executor(
+            super(AsyncFileContentsManager, self).get_directory_page,
+            path, offset=offset, limit=limit, sort=sort,
+        )
+
+    def open_raw(self, path):
+        """Open a file, to read its raw bytes in chunks, on the thread pool"""
+        return self.run_in_executor(
+            super(AsyncFileContentsManager, self).open_raw, path)
+
+    def read_raw_chunk(self, f, size):
+        """Read a chunk of a file opened with `open_raw`, on the thread pool"""
+        return self.run_in_executor(f.read, size)
+
+    @gen.coroutine
+    def open_raw_writer(self, path):
+        """Start saving a file from its raw bytes, on the thread pool"""
+        path = path.strip('/')
+        os_path = self._check_raw_writer(path)
+        writer = yield self.run_in_executor(self._raw_writer, os_path)
+        raise gen.Return(writer)
+
+    def write_raw_chunk(self, writer, chunk):
+        """Write a chunk of bytes to a raw writer, on the thread pool"""
+        return self.run_in_executor(writer.write, chunk)
+
+    @gen.coroutine
+    def close_raw_writer(self, writer, path):
+        """Save a file written from its raw bytes, on the thread pool"""
+        path = path.strip('/')
+        yield self.run_in_executor(self._commit_raw_writer, writer)
+        model = yield self.get(path, content=False)
+        self.run_post_save_hook(model=model, os_path=self._get_os_path(path))
+        raise gen.Return(model)
+
+    def abort_raw_writer(self, writer):
+        """Discard a file written from its raw bytes, on the thread pool"""
+        return self.run_in_executor(writer.abort)
+
+    @gen.coroutine
+    def _saved_model(self, path, os_path, st):
+        """Build the model of a file just saved, on the thread pool
+
+        See FileContentsManager._saved_model
+        """
+        is_link = yield self.run_in_executor(os.path.islink, os_path)
+        if st is None or is_link:
+            model = yield self.get(path, content=False)
+        else:
+            model = self._dir_entry_model(path, os_path, st, False)
+        raise gen.Return(model)
+
+    @gen.coroutine
+    def _ensure_checkpoint(self, path):
+        """Create the first checkpoint of a notebook in the background,
+        if listing its checkpoints on the thread pool finds none
+        """
+        checkpoints = yield self.run_in_executor(self.checkpoints.list_checkpoints, path)
+        if not checkpoints:
+            self._checkpoint_in_background(path)
+
+    @gen.coroutine
+    def save(self, model, path=''):
+        """Save the file model, on the thread pool,
+        and return the model with no content.
+        """
+        return self._save_steps(model, path, self.run_in_executor)
+
+    @gen.coroutine
+    def patch_notebook(self, path, operations, revision=None):
+        """Save a notebook by applying JSON-patch operations to it,
+        reading and writing it on the thread pool
+
+        See FileContentsManager.patch_notebook.
+        """
+        return self._patch_notebook_steps(path, operations, revision, self.run_in_executor)
+
+    def delete_file(self, path):
+        """Delete file at path, on the thread pool."""
+        return self.run_in_executor(
+            super(AsyncFileContentsManager, self).delete_file, path)
+
+    def rename_file(self, old_path, new_path):
+        """Rename a file, on the thread pool."""
+        return self.run_in_executor(
+            super(AsyncFileContentsManager, self).rename_file, old_path, new_path)
+
+    @gen.coroutine
+    def delete(self, path):
+        """Delete a file/directory and any associated checkpoints."""
+        path = path.strip('/')
+        if not path:
+            raise web.HTTPError(400, "Can't delete root")
+        yield self.checkpoint_scheduler.flush(path)
+        yield self.delete_file(path)
+        yield self.run_in_executor(self.checkpoints.delete_all_checkpoints, path)
+
+    @gen.coroutine
+    def rename(self, old_path, new_path):
+        """Rename a file and any checkpoints associated with that file."""
+        yield self.checkpoint_scheduler.flush(old_path.strip('/'))
+        yield self.rename_file(old_path, new_path)
+        yield self.run_in_executor(
+            self.checkpoints.rename_all_checkpoints, old_path, new_path)
+
+    @gen.coroutine
+    def update(self, model, path):
+        """Update the file's path
+
+        See ContentsManager.update
+        """
+        return self._update_steps(model, path)
+
+    @gen.coroutine
+    def copy(self, from_path, to_path=None):
+        """Copy an existing file on the filesystem, on the thread pool,
+        and return its new model.
+
+        See FileContentsManager.copy
+        """
+        return self._copy_steps(from_path, to_path, self.run_in_executor)
+
+    @gen.coroutine
+    def trust_notebook(self, path):
+        """Explicitly trust a notebook
+
+        See ContentsManager.trust_notebook
+        """
+        model = yield self.get(path)
+        nb = model['content']
+        self.log.warning("Trusting notebook %s", path)
+        self.notary.mark_cells(nb, True)
+        self.check_and_sign(nb, path)
+
+    def create_checkpoint(self, path):
+        """Create a checkpoint in the background
+
+        Requests made while a checkpoint of the file is created
+        are coalesced into the next checkpoint.
+        Returns a Future of the checkpoint model.
+        """
+        return self.checkpoint_scheduler.schedule(path.strip('/'))
+
+    def _checkpoint_in_background(self, path):
+        """Create a checkpoint in the background, only logging failures"""
+        def log_failure(future):
+            try:
+                future.result()
+            except Exception:
+                self.log.error(u'Error while creating checkpoint: %s', path, exc_info=True)
+        IOLoop.current().add_future(self.create_checkpoint(path), log_failure)
+
+    @gen.coroutine
+    def _create_checkpoint(self, path):
+        """Create a checkpoint, on the thread pool."""
+        cp = self.checkpoints
+        if not isinstance(cp, GenericCheckpointsMixin):
+            checkpoint = yield self.run_in_executor(cp.create_checkpoint, self, path)
+            raise gen.Return(checkpoint)
+
+        # generic checkpoints get the model from us, which is asynchronous
+        model = yield self.get(path, content=True)
+        if model['type'] == 'notebook':
+            checkpoint = yield self.run_in_executor(
+                cp.create_notebook_checkpoint, model['content'], path)
+        elif model['type'] == 'file':
+            checkpoint = yield self.run_in_executor(
+                cp.create_file_checkpoint, model['content'], model['format'], path)
+        else:
+            raise web.HTTPError(500, u'Unexpected type %s' % model['type'])
+        raise gen.Return(checkpoint)
+
+    @gen.coroutine
+    def restore_checkpoint(self, checkpoint_id, path):
+        """Restore a checkpoint, on the thread pool.
+
+        Waits for the checkpoints of the file requested so far.
+        """
+        yield self.checkpoint_scheduler.flush(path.strip('/'))
+        cp = self.checkpoints
+        if not isinstance(cp, GenericCheckpointsMixin):
+            try:
+                yield self.run_in_executor(cp.restore_checkpoint, self, checkpoint_id, path)
+            finally:
+                os_path = self._get_os_path(path.strip('/'))
+                self._invalidate_dir_listing(os_path)
+                self._forget_notebooks(os_path)
+            return
+
+        model = yield self.get(path, content=False)
+        if model['type'] == 'notebook':
+            model = yield self.run_in_executor(
+                cp.get_notebook_checkpoint, checkpoint_id, path)
+        elif model['type'] == 'file':
+            model = yield self.run_in_executor(
+                cp.get_file_checkpoint, checkpoint_id, path)
+        else:
+            raise web.HTTPError(500, u'Unexpected type %s' % model['type'])
+        yield self.save(model, path)
+
+    @gen.coroutine
+    def list_checkpoints(self, path):
+        """List the checkpoints of a file,
+        including those requested so far, on the thread pool."""
+        yield self.checkpoint_scheduler.flush(path.strip('/'))
+        checkpoints = yield self.run_in_executor(self.checkpoints.list_checkpoints, path)
+        raise gen.Return(checkpoints)
+
+    @gen.coroutine
+    def delete_checkpoint(self, checkpoint_id, path):
+        """Delete a checkpoint, on the thread pool."""
+        yield self.checkpoint_scheduler.flush(path.strip('/'))
+        yield self.run_in_executor(
+            self.checkpoints.delete_checkpoint, checkpoint_id, path)
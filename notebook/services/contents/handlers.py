@@ -6,11 +6,14 @@ Preliminary documentation at https://github.com/ipython/ipython/wiki/IPEP-27%3A-
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
 
+from datetime import datetime
 import json
+import sys
 
 from tornado import gen, web
 
 from notebook.utils import url_path_join, url_escape
+from .jsoncodec import default_codec, stdlib_codec
 from jupyter_client.jsonutil import date_default
 
 from notebook.base.handlers import (
@@ -64,7 +67,138 @@ def validate_model(model, expect_content):
             )
 
 
+def _format_dates(model):
+    """Format the dates of a model, and of the models it lists, like date_default"""
+    model = dict(model)
+    for key in ('created', 'last_modified'):
+        if isinstance(model.get(key), datetime):
+            model[key] = date_default(model[key])
+    if model['type'] == 'directory' and isinstance(model.get('content'), list):
+        model['content'] = [_format_dates(entry) for entry in model['content']]
+    return model
+
+
+def dumps_model(model):
+    """Serialize a contents model to JSON
+
+    Equivalent to ``json.dumps(model, default=date_default)``,
+    with the fastest installed JSON library.
+    """
+    codec = default_codec()
+    if codec is stdlib_codec:
+        return json.dumps(model, default=date_default)
+    return codec.dumps(_format_dates(model))
+
+
+def is_raw_media_type(header):
+    """Is the media type of a Content-Type header raw bytes?"""
+    return header.split(';')[0].strip().lower() == 'application/octet-stream'
+
+
+def is_json_patch_media_type(header):
+    """Is the media type of a Content-Type header a JSON patch?"""
+    return header.split(';')[0].strip().lower() == 'application/json-patch+json'
+
+
+@web.stream_request_body
 class ContentsHandler(APIHandler):
+    """Handler for /api/contents
+
+    Request bodies are streamed, so that files uploaded as raw bytes
+    (Content-Type: application/octet-stream) are written to disk
+    as they are received. Other request bodies are buffered as usual.
+    """
+
+    # number of entries of a streamed directory listing per flush
+    stream_batch_size = 1000
+
+    # size of the chunks in which raw files are read and sent
+    raw_chunk_size = 1024 * 1024
+
+    @gen.coroutine
+    def prepare(self):
+        self._body_chunks = []
+        self._raw_writer = None
+        self._raw_error = None
+        super(ContentsHandler, self).prepare()
+        content_type = self.request.headers.get('Content-Type', '')
+        if self.request.method == 'PUT' and is_raw_media_type(content_type):
+            # the body is written before put is called, so authenticate now
+            if not self.current_user:
+                raise web.HTTPError(403)
+            yield self._open_raw_writer(self.path_kwargs.get('path') or '')
+
+    @gen.coroutine
+    def _open_raw_writer(self, path):
+        """Start writing the raw bytes of the request body to a file"""
+        cm = self.contents_manager
+        max_size = self.settings.get('max_raw_upload_size', 0)
+        self.request.connection.set_max_body_size(max_size or sys.maxsize)
+        self._raw_exists = yield gen.maybe_future(cm.file_exists(path))
+        self._raw_writer = yield gen.maybe_future(cm.open_raw_writer(path))
+
+    @gen.coroutine
+    def data_received(self, chunk):
+        if self._finished:
+            return
+        if self._raw_writer is None:
+            self._body_chunks.append(chunk)
+            return
+        if self._raw_error is not None:
+            # drop the rest of a failed upload
+            return
+        try:
+            yield gen.maybe_future(
+                self.contents_manager.write_raw_chunk(self._raw_writer, chunk))
+        except Exception as e:
+            self.log.error("Error while writing the upload to %s",
+                self.path_kwargs.get('path'), exc_info=True)
+            self._raw_error = e
+
+    def get_json_body(self):
+        """Return the body of the request as JSON data."""
+        if self._body_chunks:
+            self.request.body = b''.join(self._body_chunks)
+            self._body_chunks = []
+        return super(ContentsHandler, self).get_json_body()
+
+    def _abort_raw_writer(self):
+        """Discard the file of an unfinished raw upload"""
+        writer, self._raw_writer = self._raw_writer, None
+        if writer is not None:
+            self.log.warning("Discarding unfinished upload to %s",
+                self.path_kwargs.get('path'))
+            return gen.maybe_future(self.contents_manager.abort_raw_writer(writer))
+
+    def on_connection_close(self):
+        super(ContentsHandler, self).on_connection_close()
+        self._abort_raw_writer()
+
+    def on_finish(self):
+        super(ContentsHandler, self).on_finish()
+        # e.g. an error occurred before put was called
+        self._abort_raw_writer()
+
+    def _accepts_raw(self):
+        """Does the request ask for the raw bytes of a file?
+
+        True if the Accept header includes application/octet-stream,
+        but not application/json.
+        """
+        accept = self.request.headers.get('Accept', '')
+        media_types = [t.split(';')[0].strip().lower() for t in accept.split(',')]
+        return ('application/octet-stream' in media_types
+                and 'application/json' not in media_types)
+
+    def _abort_stream(self, path):
+        """Abort a streamed response after an error
+
+        The 200 status has already been sent, so the response is aborted
+        without terminating its chunked body: clients see an incomplete
+        response rather than a truncated one.
+        """
+        self.log.error("Error while streaming %r", path, exc_info=True)
+        self.request.connection.close()
 
     def location_url(self, path):
         """Return the full URL location of a file.
@@ -78,6 +212,28 @@ class ContentsHandler(APIHandler):
             self.base_url, 'api', 'contents', url_escape(path)
         )
 
+    @gen.coroutine
+    def _set_revision_header(self, model):
+        """Set the ETag of a notebook to its revision, to patch it with"""
+        if model['type'] != 'notebook':
+            return
+        revision = yield gen.maybe_future(
+            self.contents_manager.get_revision(model['path']))
+        self.set_header('ETag', '"%s"' % revision)
+
+    def _get_if_match(self):
+        """Get the revision a request applies to, from its If-Match header"""
+        header = self.request.headers.get('If-Match')
+        if header is None:
+            raise web.HTTPError(428, u'If-Match header required',
+                                reason='Precondition Required')
+        header = header.strip()
+        if header == '*':
+            return None
+        if header.startswith('W/'):
+            header = header[2:]
+        return header.strip('"')
+
     def _finish_model(self, model, location=True):
         """Finish a JSON request with a model, setting relevant headers, etc."""
         if location:
@@ -85,7 +241,7 @@ class ContentsHandler(APIHandler):
             self.set_header('Location', location)
         self.set_header('Last-Modified', model['last_modified'])
         self.set_header('Content-Type', 'application/json')
-        self.finish(json.dumps(model, default=date_default))
+        self.finish(dumps_model(model))
 
     @web.authenticated
     @gen.coroutine
@@ -96,6 +252,10 @@ class ContentsHandler(APIHandler):
         of the files and directories it contains.
         """
         path = path or ''
+        if self._accepts_raw():
+            yield self._get_raw(path)
+            return
+
         type = self.get_query_argument('type', default=None)
         if type not in {None, 'directory', 'file', 'notebook'}:
             raise web.HTTPError(400, u'Type %r is invalid' % type)
@@ -107,18 +267,157 @@ class ContentsHandler(APIHandler):
         if content not in {'0', '1'}:
             raise web.HTTPError(400, u'Content %r is invalid' % content)
         content = int(content)
-        
-        model = yield gen.maybe_future(self.contents_manager.get(
-            path=path, type=type, format=format, content=content,
-        ))
+
+        cm = self.contents_manager
+        page = self._get_page_arguments()
+        stream = self.get_query_argument('stream', default='0')
+        if stream not in {'0', '1'}:
+            raise web.HTTPError(400, u'Stream %r is invalid' % stream)
+        stream = int(stream)
+        if (page or stream) and content and type in {None, 'directory'}:
+            is_dir = yield gen.maybe_future(cm.dir_exists(path))
+        else:
+            is_dir = False
+
+        if is_dir and stream:
+            if page:
+                raise web.HTTPError(400, u'Cannot paginate a streamed listing')
+            yield self._stream_directory(path)
+            return
+        elif is_dir and page:
+            model = yield gen.maybe_future(cm.get_directory_page(path, **page))
+        else:
+            model = yield gen.maybe_future(cm.get(
+                path=path, type=type, format=format, content=content,
+            ))
         validate_model(model, expect_content=content)
+        yield self._set_revision_header(model)
         self._finish_model(model, location=False)
 
+    def _get_page_arguments(self):
+        """Get the pagination arguments of a directory listing request
+
+        Returns a dict of the given arguments, for `get_directory_page`,
+        which is empty if the listing isn't paginated.
+        """
+        page = {}
+        # the smallest valid offset and limit
+        minimum = {'offset': 0, 'limit': 1}
+        for name in ('offset', 'limit'):
+            arg = self.get_query_argument(name, default=None)
+            if arg is None:
+                continue
+            try:
+                value = int(arg)
+            except ValueError:
+                value = None
+            if value is None or value < minimum[name]:
+                raise web.HTTPError(400, u'%s %r is invalid' % (name.title(), arg))
+            page[name] = value
+        sort = self.get_query_argument('sort', default=None)
+        if sort is not None:
+            page['sort'] = sort
+        return page
+
+    @gen.coroutine
+    def _stream_directory(self, path):
+        """Stream a directory model, flushing its listing in batches
+
+        The response is the same JSON model as a regular GET,
+        but entries are sent as they are listed, in a chunked response.
+        """
+        cm = self.contents_manager
+        model = yield gen.maybe_future(cm.get(path, content=False, type='directory'))
+        entries = yield gen.maybe_future(cm.iter_directory(path))
+        model.pop('content')
+        model['format'] = 'json'
+        self.set_header('Last-Modified', model['last_modified'])
+        self.set_header('Content-Type', 'application/json')
+        # open the model, leaving the content list to be filled in
+        self.write(json.dumps(model, default=date_default)[:-1] + ', "content": [')
+        first = True
+        flushed = False
+        while True:
+            try:
+                batch = yield gen.maybe_future(
+                    cm.read_directory_batch(entries, self.stream_batch_size))
+            except Exception:
+                if not flushed:
+                    # nothing has been sent yet, reply with a regular error
+                    self.clear()
+                    raise
+                self._abort_stream(path)
+                return
+            if not batch:
+                break
+            for entry in batch:
+                if not first:
+                    self.write(', ')
+                first = False
+                self.write(json.dumps(entry, default=date_default))
+            yield self.flush()
+            flushed = True
+        self.finish(']}')
+
+    @gen.coroutine
+    def _get_raw(self, path):
+        """Send the raw bytes of a file, read and sent in chunks"""
+        cm = self.contents_manager
+        model = yield gen.maybe_future(cm.get(path, content=False))
+        if model['type'] == 'directory':
+            raise web.HTTPError(400, u'Cannot read directory %s as raw bytes' % path)
+        f = yield gen.maybe_future(cm.open_raw(path))
+        try:
+            self.set_header('Content-Type', 'application/octet-stream')
+            self.set_header('Last-Modified', model['last_modified'])
+            flushed = False
+            while True:
+                try:
+                    chunk = yield gen.maybe_future(
+                        cm.read_raw_chunk(f, self.raw_chunk_size))
+                except Exception:
+                    if not flushed:
+                        self.clear()
+                        raise
+                    self._abort_stream(path)
+                    return
+                self.write(chunk)
+                yield self.flush()
+                flushed = True
+                if not chunk:
+                    break
+        finally:
+            f.close()
+        self.finish()
+
+    @gen.coroutine
+    def _save_raw(self, path):
+        """Save a file uploaded as raw bytes"""
+        cm = self.contents_manager
+        writer, self._raw_writer = self._raw_writer, None
+        if self._raw_error is not None:
+            yield gen.maybe_future(cm.abort_raw_writer(writer))
+            raise self._raw_error
+        self.log.info(u"Saving file at %s from raw bytes", path)
+        model = yield gen.maybe_future(cm.close_raw_writer(writer, path))
+        if not self._raw_exists:
+            self.set_status(201)
+        validate_model(model, expect_content=False)
+        self._finish_model(model)
+
     @web.authenticated
     @gen.coroutine
     def patch(self, path=''):
-        """PATCH renames a file or directory without re-uploading content."""
+        """PATCH renames a file or directory without re-uploading content.
+
+        With Content-Type: application/json-patch+json,
+        PATCH saves a notebook from the JSON-patch operations in the body,
+        applied to the revision of the notebook given by the If-Match header.
+        """
         cm = self.contents_manager
+        if is_json_patch_media_type(self.request.headers.get('Content-Type', '')):
+            yield self._patch_notebook(path)
+            return
         model = self.get_json_body()
         if model is None:
             raise web.HTTPError(400, u'JSON body missing')
@@ -126,6 +425,20 @@ class ContentsHandler(APIHandler):
         validate_model(model, expect_content=False)
         self._finish_model(model)
     
+    @gen.coroutine
+    def _patch_notebook(self, path):
+        """Save a notebook from JSON-patch operations"""
+        revision = self._get_if_match()
+        operations = self.get_json_body()
+        if operations is None:
+            raise web.HTTPError(400, u'JSON body missing')
+        self.log.info(u"Patching notebook at %s", path)
+        model = yield gen.maybe_future(
+            self.contents_manager.patch_notebook(path, operations, revision=revision))
+        validate_model(model, expect_content=False)
+        yield self._set_revision_header(model)
+        self._finish_model(model)
+
     @gen.coroutine
     def _copy(self, copy_from, copy_to=None):
         """Copy a file, optionally specifying a target directory."""
@@ -164,6 +477,7 @@ class ContentsHandler(APIHandler):
             self.log.info(u"Saving file at %s", path)  
         model = yield gen.maybe_future(self.contents_manager.save(model, path))
         validate_model(model, expect_content=False)
+        yield self._set_revision_header(model)
         self._finish_model(model)
 
     @web.authenticated
@@ -213,7 +527,13 @@ class ContentsHandler(APIHandler):
           Save notebook at ``path/Name.ipynb``. Notebook structure is specified
           in `content` key of JSON request body. If content is not specified,
           create a new empty notebook.
+        PUT /api/contents/path/Name.dat
+          with Content-Type: application/octet-stream
+          Save the raw bytes of the body to ``path/Name.dat``.
         """
+        if self._raw_writer is not None:
+            yield self._save_raw(path)
+            return
         model = self.get_json_body()
         if model:
             if model.get('copy_from'):
@@ -283,6 +603,89 @@ class ModifyCheckpointsHandler(APIHandler):
         self.finish()
 
 
+class UploadsHandler(APIHandler):
+    """Start resumable uploads, for contents managers supporting them"""
+
+    def get_upload_manager(self):
+        cm = self.contents_manager
+        if not hasattr(cm, 'create_upload'):
+            raise web.HTTPError(400,
+                u'Resumable uploads are not supported by %s' % type(cm).__name__)
+        return cm
+
+    @web.authenticated
+    @gen.coroutine
+    def post(self, path=''):
+        """post starts an upload of a file
+
+        The body is {"size": <bytes>}, optionally with
+        the "sha256" hex digest of the whole file.
+        """
+        cm = self.get_upload_manager()
+        model = self.get_json_body()
+        if model is None or 'size' not in model:
+            raise web.HTTPError(400, u'Upload size missing')
+        upload = yield gen.maybe_future(
+            cm.create_upload(path, model['size'], sha256=model.get('sha256')))
+        location = url_path_join(self.base_url, 'api/contents',
+            url_escape(path), 'uploads', upload['id'])
+        self.set_header('Location', location)
+        self.set_status(201)
+        self.finish(json.dumps(upload))
+
+
+class ModifyUploadHandler(UploadsHandler):
+    """Write, resume, complete or abort a resumable upload"""
+
+    @web.authenticated
+    @gen.coroutine
+    def get(self, path, upload_id):
+        """get returns an upload, with the byte ranges received so far"""
+        cm = self.get_upload_manager()
+        upload = yield gen.maybe_future(cm.get_upload(path, upload_id))
+        self.finish(json.dumps(upload))
+
+    @web.authenticated
+    @gen.coroutine
+    def put(self, path, upload_id):
+        """put writes the raw bytes of the body at the `offset` argument
+
+        If given, the `sha256` argument is checked against the body.
+        """
+        cm = self.get_upload_manager()
+        offset = self.get_query_argument('offset', None)
+        try:
+            offset = int(offset)
+        except (TypeError, ValueError):
+            raise web.HTTPError(400, u'Offset %r is invalid' % offset)
+        sha256 = self.get_query_argument('sha256', None)
+        upload = yield gen.maybe_future(cm.save_upload_chunk(
+            path, upload_id, offset, self.request.body, sha256=sha256))
+        self.finish(json.dumps(upload))
+
+    @web.authenticated
+    @gen.coroutine
+    def post(self, path, upload_id):
+        """post completes an upload, saving the file"""
+        cm = self.get_upload_manager()
+        self.log.info(u"Completing upload of %s", path)
+        model = yield gen.maybe_future(cm.finish_upload(path, upload_id))
+        validate_model(model, expect_content=False)
+        location = url_path_join(self.base_url, 'api/contents', url_escape(path))
+        self.set_header('Location', location)
+        self.set_header('Last-Modified', model['last_modified'])
+        self.finish(json.dumps(model, default=date_default))
+
+    @web.authenticated
+    @gen.coroutine
+    def delete(self, path, upload_id):
+        """delete aborts an upload"""
+        cm = self.get_upload_manager()
+        yield gen.maybe_future(cm.delete_upload(path, upload_id))
+        self.set_status(204)
+        self.finish()
+
+
 class NotebooksRedirectHandler(IPythonHandler):
     """Redirect /api/notebooks to /api/contents"""
     SUPPORTED_METHODS = ('GET', 'PUT', 'PATCH', 'POST', 'DELETE')
@@ -314,12 +717,16 @@ class TrustNotebooksHandler(IPythonHandler):
 
 
 _checkpoint_id_regex = r"(?P<checkpoint_id>[\w-]+)"
+_upload_id_regex = r"(?P<upload_id>[\w-]+)"
 
 default_handlers = [
     (r"/api/contents%s/checkpoints" % path_regex, CheckpointsHandler),
     (r"/api/contents%s/checkpoints/%s" % (path_regex, _checkpoint_id_regex),
         ModifyCheckpointsHandler),
     (r"/api/contents%s/trust" % path_regex, TrustNotebooksHandler),
+    (r"/api/contents%s/uploads" % path_regex, UploadsHandler),
+    (r"/api/contents%s/uploads/%s" % (path_regex, _upload_id_regex),
+        ModifyUploadHandler),
     (r"/api/contents%s" % path_regex, ContentsHandler),
     (r"/api/notebooks/?(.*)", NotebooksRedirectHandler),
 ]
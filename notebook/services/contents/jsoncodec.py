@@ -0,0 +1,103 @@
+"""Pluggable JSON libraries for reading notebooks and sending models.
+
+The standard library's json module is always available.
+Faster libraries are used when they are installed,
+falling back on the standard library for anything they can't handle
+(e.g. NaN, or integers larger than 64 bits).
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from collections import namedtuple
+import json
+import re
+
+from ipython_genutils.importstring import import_item
+
+JSONCodec = namedtuple('JSONCodec', ['name', 'loads', 'dumps'])
+JSONCodec.__doc__ = """The loads and dumps functions of a JSON library
+
+dumps returns compact JSON, as text or as UTF-8 bytes.
+"""
+
+stdlib_codec = JSONCodec('json', json.loads, json.dumps)
+
+# the libraries tried by default, fastest first
+fast_json_libraries = ['orjson', 'rapidjson', 'ujson']
+
+
+def _with_fallback(func, fallback):
+    """Call fallback with the same arguments when func fails"""
+    def call(obj):
+        try:
+            return func(obj)
+        except Exception:
+            return fallback(obj)
+    return call
+
+
+# digits of numbers that may not fit in 64 bits, which orjson parses as floats
+_long_number_pat = re.compile(r'\d{19}')
+
+
+def _orjson_loads(loads):
+    def orjson_loads(s):
+        if _long_number_pat.search(s):
+            return json.loads(s)
+        return loads(s)
+    return orjson_loads
+
+
+def _import_codec(name):
+    """Import the codec of a JSON library, by name
+
+    Any module with `loads` and `dumps` functions like json's can be used.
+    """
+    if name == 'json':
+        return stdlib_codec
+    module = import_item(name)
+    loads = module.loads
+    dumps = module.dumps
+    if name == 'orjson':
+        loads = _orjson_loads(loads)
+    if name == 'ujson':
+        def dumps(obj):
+            return module.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+    return JSONCodec(
+        name,
+        _with_fallback(loads, json.loads),
+        _with_fallback(dumps, json.dumps),
+    )
+
+
+def get_codec(name=''):
+    """Get the codec of a JSON library
+
+    Parameters
+    ----------
+    name : str, optional
+        The import name of the library.
+        By default, the fastest installed library is used,
+        or the standard library if none of them are installed.
+    """
+    if name:
+        return _import_codec(name)
+    for library in fast_json_libraries:
+        try:
+            return _import_codec(library)
+        except ImportError:
+            pass
+    return stdlib_codec
+
+
+# the codec used by default, found on first use
+_default_codec = None
+
+
+def default_codec():
+    """Get the codec of the fastest installed JSON library"""
+    global _default_codec
+    if _default_codec is None:
+        _default_codec = get_codec()
+    return _default_codec
@@ -1,9 +1,53 @@
 from notebook.services.contents.filemanager import FileContentsManager
+from notebook.services.contents.fileio import replace_file, replace_file_keeping_mode
 from contextlib import contextmanager
 from tornado import web
+from traitlets import Any, Integer, default
 import nbformat
 import base64
+import hashlib
+import json
+import numbers
 import os, io
+import re
+import threading
+import uuid
+
+
+def merge_ranges(ranges, start, end):
+    """Add the byte range [start, end) to a sorted list of disjoint ranges
+
+    Overlapping and adjacent ranges are merged.
+    """
+    merged = []
+    for r_start, r_end in ranges:
+        if r_end < start or r_start > end:
+            merged.append([r_start, r_end])
+        else:
+            start = min(start, r_start)
+            end = max(end, r_end)
+    merged.append([start, end])
+    merged.sort()
+    return merged
+
+
+def _pwrite(fd, data, offset):
+    """Write data at offset in a file descriptor"""
+    if hasattr(os, 'pwrite'):
+        while data:
+            written = os.pwrite(fd, data, offset)
+            data = data[written:]
+            offset += written
+    else:
+        # no pwrite on Python 2 or Windows,
+        # but each chunk is written through its own file descriptor
+        os.lseek(fd, offset, os.SEEK_SET)
+        while data:
+            written = os.write(fd, data)
+            data = data[written:]
+
+
+_upload_id_pat = re.compile(r'^[0-9a-f]{32}$')
 
 class LargeFileManager(FileContentsManager):
     """Handle large file upload."""
@@ -35,6 +79,8 @@ class LargeFileManager(FileContentsManager):
             except Exception as e:
                 self.log.error(u'Error while saving file: %s %s', path, e, exc_info=True)
                 raise web.HTTPError(500, u'Unexpected error while saving file: %s %s' % (path, e))
+            finally:
+                self._invalidate_dir_listing(os_path)
 
             model = self.get(path, content=False)
 
@@ -68,3 +114,254 @@ class LargeFileManager(FileContentsManager):
                 os_path = os.path.join(os.path.dirname(os_path), os.readlink(os_path))
             with io.open(os_path, 'ab') as f:
                 f.write(bcontent)
+
+    # Resumable upload sessions
+    #
+    # An upload session is created with the size (and optionally the sha256)
+    # of a file. Its chunks can then be written at any offset, in any order
+    # and in parallel, to a temporary file in the target's directory. The
+    # ranges received so far are recorded next to the temporary file, so that
+    # an interrupted upload can be resumed, even after a restart. Once every
+    # byte has been received, the temporary file replaces the target.
+    #
+    # The sha256 of the file is computed as its chunks arrive, and chunks are
+    # synced as they are written, so that finishing an upload doesn't read or
+    # sync the whole file at once.
+
+    upload_hash_block_size = Integer(1024 * 1024, config=True,
+        help="Size of the blocks in which uploaded files are read to check their sha256"
+    )
+
+    _uploads = Any()
+    @default('_uploads')
+    def _default_uploads(self):
+        return {}
+
+    _uploads_lock = Any()
+    @default('_uploads_lock')
+    def _default_uploads_lock(self):
+        return threading.Lock()
+
+    def _upload_os_path(self, path, upload_id):
+        """Get the OS path of the temporary file of an upload"""
+        if not _upload_id_pat.match(upload_id):
+            raise web.HTTPError(404, u'No such upload: %s' % upload_id)
+        os_path = self._get_os_path(path)
+        dirname, basename = os.path.split(os_path)
+        return os.path.join(dirname, '.~%s.%s.upload' % (basename, upload_id))
+
+    def _upload_model(self, session):
+        """Build the model of an upload session"""
+        return {
+            'id': session['id'],
+            'path': session['path'],
+            'size': session['size'],
+            'sha256': session['sha256'],
+            'received': [list(r) for r in session['received']],
+        }
+
+    def _write_upload_state(self, session):
+        """Record the state of an upload session next to its temporary file"""
+        state_path = session['os_path'] + '.json'
+        tmp_path = state_path + '.tmp'
+        with io.open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self._upload_model(session)))
+        replace_file(tmp_path, state_path)
+
+    def _get_upload(self, path, upload_id):
+        """Get an upload session, loading its recorded state if needed"""
+        path = path.strip('/')
+        with self._uploads_lock:
+            session = self._uploads.get(upload_id)
+            if session is not None:
+                if session['path'] != path:
+                    raise web.HTTPError(404, u'No such upload: %s' % upload_id)
+                return session
+            os_path = self._upload_os_path(path, upload_id)
+            try:
+                with io.open(os_path + '.json', encoding='utf-8') as f:
+                    session = json.load(f)
+            except (IOError, OSError, ValueError):
+                raise web.HTTPError(404, u'No such upload: %s' % upload_id)
+            if not os.path.isfile(os_path):
+                raise web.HTTPError(404, u'No such upload: %s' % upload_id)
+            session['os_path'] = os_path
+            session['lock'] = threading.Lock()
+            self._start_hash(session)
+            self._uploads[upload_id] = session
+            return session
+
+    def create_upload(self, path, size, sha256=None):
+        """Start a resumable upload of a file of `size` bytes
+
+        Parameters
+        ----------
+        path : str
+            The API path of the file to upload.
+        size : int
+            The size of the file, in bytes.
+        sha256 : str, optional
+            The hex sha256 digest of the whole file,
+            checked once every chunk has been received.
+
+        Returns
+        -------
+        model : dict
+            The model of the upload session, with its 'id'.
+        """
+        path = path.strip('/')
+        if not isinstance(size, numbers.Integral) or isinstance(size, bool) or size < 0:
+            raise web.HTTPError(400, u'Invalid upload size: %r' % (size,))
+        os_path = self._check_raw_writer(path)
+        upload_id = uuid.uuid4().hex
+        tmp_path = self._upload_os_path(path, upload_id)
+        with self.perm_to_403(os_path):
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            try:
+                # preallocate, so that a full disk fails now rather than midway
+                if size and hasattr(os, 'posix_fallocate'):
+                    try:
+                        os.posix_fallocate(fd, 0, size)
+                    except OSError:
+                        # not supported by every filesystem
+                        os.ftruncate(fd, size)
+                else:
+                    os.ftruncate(fd, size)
+            finally:
+                os.close(fd)
+        session = {
+            'id': upload_id,
+            'path': path,
+            'size': size,
+            'sha256': sha256,
+            'received': [],
+            'os_path': tmp_path,
+            'lock': threading.Lock(),
+        }
+        self._start_hash(session)
+        self._write_upload_state(session)
+        with self._uploads_lock:
+            self._uploads[upload_id] = session
+        self.log.debug("Started upload %s to %s", upload_id, os_path)
+        return self._upload_model(session)
+
+    def get_upload(self, path, upload_id):
+        """Get the model of an upload session, with the byte ranges received"""
+        return self._upload_model(self._get_upload(path, upload_id))
+
+    def save_upload_chunk(self, path, upload_id, offset, data, sha256=None):
+        """Write a chunk of an upload at a byte offset
+
+        If `sha256` is given, the chunk is only written
+        if its hex sha256 digest matches.
+        Chunks can be written in any order, and concurrently.
+        """
+        session = self._get_upload(path, upload_id)
+        if offset < 0 or offset + len(data) > session['size']:
+            raise web.HTTPError(400, u'Chunk at offset %i of %i bytes is out of bounds' % (
+                offset, len(data)))
+        if sha256 is not None and hashlib.sha256(data).hexdigest() != sha256.lower():
+            raise web.HTTPError(400, u'Checksum mismatch for chunk at offset %i' % offset)
+        with self.perm_to_403(session['os_path']):
+            with io.open(session['os_path'], 'r+b') as f:
+                _pwrite(f.fileno(), data, offset)
+                self.file_syncer.sync(f, session['os_path'])
+        if data:
+            with session['lock']:
+                session['received'] = merge_ranges(
+                    session['received'], offset, offset + len(data))
+                self._write_upload_state(session)
+                self._update_hash(session, offset, data)
+        return self._upload_model(session)
+
+    def _start_hash(self, session):
+        """Start hashing the bytes of an upload, from the start of the file
+
+        The hash of a session loaded from its recorded state starts over.
+        """
+        session['hash'] = hashlib.sha256()
+        session['hashed'] = 0
+
+    def _update_hash(self, session, offset, data):
+        """Hash the bytes received from the start of the file without gaps
+
+        Called with each chunk received, under the session's lock.
+        The bytes of a chunk following the ones already hashed are hashed
+        from memory, and those received before it, after a gap it fills,
+        are read back from the file.
+        """
+        if not session['sha256']:
+            return
+        hashed = session['hashed']
+        if offset <= hashed < offset + len(data):
+            session['hash'].update(data[hashed - offset:])
+            hashed = offset + len(data)
+        received = session['received']
+        if received and received[0][0] == 0 and received[0][1] > hashed:
+            self._hash_range(session['hash'], session['os_path'], hashed, received[0][1])
+            hashed = received[0][1]
+        session['hashed'] = hashed
+
+    def _hash_range(self, h, os_path, start, end):
+        """Hash the bytes [start, end) of a file"""
+        with io.open(os_path, 'rb') as f:
+            f.seek(start)
+            while start < end:
+                block = f.read(min(self.upload_hash_block_size, end - start))
+                if not block:
+                    break
+                h.update(block)
+                start += len(block)
+
+    def finish_upload(self, path, upload_id):
+        """Complete an upload, replacing the file with the uploaded one
+
+        Fails with 400 if some bytes are missing,
+        or if the sha256 of the uploaded file doesn't match.
+
+        Returns the model of the saved file, without content.
+        """
+        path = path.strip('/')
+        session = self._get_upload(path, upload_id)
+        size = session['size']
+        with session['lock']:
+            if size and session['received'] != [[0, size]]:
+                raise web.HTTPError(400, u'Upload %s is incomplete' % upload_id)
+            tmp_path = session['os_path']
+            if session['sha256']:
+                # only the bytes received before a restart are left to hash
+                if session['hashed'] < size:
+                    self._hash_range(session['hash'], tmp_path, session['hashed'], size)
+                    session['hashed'] = size
+                if session['hash'].hexdigest() != session['sha256'].lower():
+                    raise web.HTTPError(400, u'Checksum mismatch for upload %s' % upload_id)
+        os_path = self._get_os_path(path)
+        if os.path.islink(os_path):
+            os_path = os.path.join(os.path.dirname(os_path), os.readlink(os_path))
+        try:
+            with self.perm_to_403(os_path):
+                # the chunks were synced as they were written
+                replace_file_keeping_mode(tmp_path, os_path)
+                self.file_syncer.sync_directory(os_path)
+        finally:
+            self._invalidate_dir_listing(os_path)
+            self._forget_notebooks(os_path)
+        self._forget_upload(session)
+        model = self.get(path, content=False)
+        self.run_post_save_hook(model=model, os_path=os_path)
+        return model
+
+    def delete_upload(self, path, upload_id):
+        """Abort an upload, removing its temporary file"""
+        session = self._get_upload(path, upload_id)
+        if os.path.exists(session['os_path']):
+            os.remove(session['os_path'])
+        self._forget_upload(session)
+
+    def _forget_upload(self, session):
+        """Forget an upload session that was completed or aborted"""
+        with self._uploads_lock:
+            self._uploads.pop(session['id'], None)
+        state_path = session['os_path'] + '.json'
+        if os.path.exists(state_path):
+            os.remove(state_path)
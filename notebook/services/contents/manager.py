@@ -4,15 +4,18 @@
 # Distributed under the terms of the Modified BSD License.
 
 from fnmatch import fnmatch
+import io
 import itertools
 import json
 import os
 import re
 
+from tornado import gen
 from tornado.web import HTTPError, RequestHandler
 
 from ...files.handlers import FilesHandler
 from .checkpoints import Checkpoints
+from .notebookpatch import apply_patch
 from traitlets.config.configurable import LoggingConfigurable
 from nbformat import sign, validate as validate_nb, ValidationError
 from nbformat.v4 import new_notebook
@@ -33,8 +36,70 @@ from ipython_genutils.py3compat import string_types
 from notebook.base.handlers import IPythonHandler
 
 
+try: #PY3
+    from base64 import encodebytes, decodebytes
+except ImportError: #PY2
+    from base64 import encodestring as encodebytes, decodestring as decodebytes
+
 copy_pat = re.compile(r'\-Copy\d*\.')
 
+# keys by which a directory listing can be sorted when paginating
+directory_sort_keys = ('name', 'last_modified')
+
+
+def parse_sort_key(sort):
+    """Parse a directory sort key
+
+    A leading '-' sorts in descending order, e.g. '-last_modified'.
+
+    Returns
+    -------
+    key : str
+        One of `directory_sort_keys`
+    reverse : bool
+        Whether to sort in descending order
+    """
+    reverse = sort.startswith('-')
+    key = sort[1:] if reverse else sort
+    if key not in directory_sort_keys:
+        raise HTTPError(400, u'Invalid sort key: %r' % sort)
+    return key, reverse
+
+
+def check_page(offset, limit):
+    """Check the offset and limit of a page of a directory listing
+
+    Raises 400 if the offset is negative, or the limit is less than one.
+    """
+    if offset < 0:
+        raise HTTPError(400, u'Invalid offset: %r' % offset)
+    if limit is not None and limit < 1:
+        raise HTTPError(400, u'Invalid limit: %r' % limit)
+
+
+def directory_sort_key(key):
+    """Get the function sorting directory entry models by `key`
+
+    Entries with the same modification time are sorted by name,
+    so that the order, and thus every page of a listing, is stable.
+    """
+    if key == 'name':
+        return lambda model: model['name']
+    return lambda model: (model[key], model['name'])
+
+
+def page_info(offset, limit, total, sort):
+    """Build the 'pagination' entry of a paginated directory model"""
+    end = total if limit is None else min(offset + limit, total)
+    return {
+        'offset': offset,
+        'limit': limit,
+        'total': total,
+        'sort': sort,
+        # offset of the next page, None on the last page
+        'next_offset': end if end < total else None,
+    }
+
 
 class ContentsManager(LoggingConfigurable):
     """Base class for serving files and directories.
@@ -296,6 +361,173 @@ class ContentsManager(LoggingConfigurable):
         model = self.get(new_path, content=False)
         return model
 
+    @gen.coroutine
+    def iter_directory(self, path):
+        """Iterate over the models of the entries of a directory
+
+        Yields the same models (without content) as the content of
+        ``self.get(path, type='directory')``. Used to stream large listings.
+
+        May return a Future of the iterator.
+        The default implementation builds the whole listing with `get`.
+        Subclasses can override it to produce entries lazily.
+        """
+        model = yield gen.maybe_future(self.get(path, content=True, type='directory'))
+        raise gen.Return(iter(model['content']))
+
+    @gen.coroutine
+    def get_directory_page(self, path, offset=0, limit=None, sort='name'):
+        """Get a directory model containing one page of its listing
+
+        Entries are sorted by `sort` (see `parse_sort_key`), and the
+        `limit` entries starting at `offset` are returned as the content.
+        The model gets an additional 'pagination' entry,
+        with the 'next_offset' to request to get the next page.
+
+        May return a Future of the model.
+        The default implementation builds the whole listing with `get`.
+        Subclasses can override it to only build the models in the page.
+        """
+        key, reverse = parse_sort_key(sort)
+        check_page(offset, limit)
+        model = yield gen.maybe_future(self.get(path, content=True, type='directory'))
+        contents = sorted(
+            model['content'], key=directory_sort_key(key), reverse=reverse)
+        stop = None if limit is None else offset + limit
+        model['content'] = contents[offset:stop]
+        model['pagination'] = page_info(offset, limit, len(contents), sort)
+        raise gen.Return(model)
+
+    @gen.coroutine
+    def get_revision(self, path):
+        """Get the revision of a file, which changes whenever it is saved
+
+        Used as the ETag of notebooks, against which they can be patched.
+        May return a Future.
+        The default implementation uses the last_modified date of the file.
+        """
+        model = yield gen.maybe_future(self.get(path, content=False))
+        raise gen.Return(model['last_modified'].isoformat())
+
+    @gen.coroutine
+    def patch_notebook(self, path, operations, revision=None):
+        """Save a notebook by applying JSON-patch operations to it
+
+        See `notebookpatch.apply_patch` for the supported operations.
+
+        Parameters
+        ----------
+        path : str
+            The API path of the notebook.
+        operations : list
+            The JSON-patch operations to apply.
+        revision : str, optional
+            The revision (from `get_revision`) the operations apply to.
+            Raises 412 if the notebook has changed since.
+
+        Returns the model of the saved notebook, without content,
+        or a Future of it.
+
+        The default implementation reads and saves the whole notebook.
+        Subclasses can override it to avoid re-reading the notebook,
+        and only validate what changed.
+        """
+        path = path.strip('/')
+        if revision is not None:
+            current = yield gen.maybe_future(self.get_revision(path))
+            if current != revision:
+                raise HTTPError(412, u'Notebook %s has changed' % path)
+        model = yield gen.maybe_future(self.get(path, content=True, type='notebook'))
+        apply_patch(model['content'], operations)
+        model = yield gen.maybe_future(self.save(model, path))
+        raise gen.Return(model)
+
+    def read_directory_batch(self, entries, size):
+        """Get the next models from an iterator returned by `iter_directory`
+
+        Returns a list of at most `size` models,
+        which is empty once the iterator is exhausted.
+
+        Subclasses that list directories asynchronously
+        can override it to return a Future of the list.
+        """
+        return list(itertools.islice(entries, size))
+
+    @gen.coroutine
+    def open_raw(self, path):
+        """Open a file, to read its raw bytes with `read_raw_chunk`
+
+        Returns a file-like object, to be closed by the caller,
+        or a Future of one.
+
+        The default implementation reads the whole file with `get`.
+        Subclasses can override it to read the file lazily.
+        """
+        model = yield gen.maybe_future(
+            self.get(path, content=True, type='file', format='base64'))
+        raise gen.Return(io.BytesIO(decodebytes(model['content'].encode('ascii'))))
+
+    def read_raw_chunk(self, f, size):
+        """Read at most `size` bytes from a file opened with `open_raw`
+
+        Returns an empty bytestring at the end of the file.
+        Subclasses reading files asynchronously
+        can override it to return a Future of the bytes.
+        """
+        return f.read(size)
+
+    def open_raw_writer(self, path):
+        """Start saving a file from its raw bytes
+
+        Returns a writer, or a Future of one, which is written to with
+        `write_raw_chunk`, and then closed with either `close_raw_writer`,
+        saving the file, or `abort_raw_writer`, discarding it.
+
+        The default implementation buffers the file in memory,
+        and saves it with `save`. Subclasses can override it,
+        along with the other raw writer methods, to write chunks directly.
+        """
+        if path.strip('/').endswith('.ipynb'):
+            raise HTTPError(400, u'Notebooks must be saved as JSON models')
+        return io.BytesIO()
+
+    def write_raw_chunk(self, writer, chunk):
+        """Write a chunk of bytes to a writer from `open_raw_writer`
+
+        May return a Future.
+        """
+        writer.write(chunk)
+
+    @gen.coroutine
+    def close_raw_writer(self, writer, path):
+        """Save the file written to a writer from `open_raw_writer`
+
+        Returns the model of the saved file, without content,
+        or a Future of it.
+        """
+        model = {
+            'type': 'file',
+            'format': 'base64',
+            'content': encodebytes(writer.getvalue()).decode('ascii'),
+        }
+        writer.close()
+        model = yield gen.maybe_future(self.save(model, path))
+        raise gen.Return(model)
+
+    def abort_raw_writer(self, writer):
+        """Discard a writer from `open_raw_writer`, e.g. on a failed upload
+
+        May return a Future.
+        """
+        writer.close()
+
+    def shutdown(self):
+        """Release the resources held by the contents manager
+
+        Called when the notebook server stops.
+        """
+        pass
+
     def info_string(self):
         return "Serving contents"
 
@@ -428,30 +660,34 @@ class ContentsManager(LoggingConfigurable):
         from_path must be a full path to a file.
         """
         path = from_path.strip('/')
-        if to_path is not None:
-            to_path = to_path.strip('/')
-
-        if '/' in path:
-            from_dir, from_name = path.rsplit('/', 1)
-        else:
-            from_dir = ''
-            from_name = path
-        
         model = self.get(path)
         model.pop('path', None)
         model.pop('name', None)
         if model['type'] == 'directory':
             raise HTTPError(400, "Can't copy directories")
-        
+
+        to_path = self._copy_path(path, to_path)
+        model = self.save(model, to_path)
+        return model
+
+    def _copy_path(self, from_path, to_path=None):
+        """Get the path of a copy of from_path, as described in `copy`"""
+        if to_path is not None:
+            to_path = to_path.strip('/')
+
+        if '/' in from_path:
+            from_dir, from_name = from_path.rsplit('/', 1)
+        else:
+            from_dir = ''
+            from_name = from_path
+
         if to_path is None:
             to_path = from_dir
         if self.dir_exists(to_path):
             name = copy_pat.sub(u'.', from_name)
             to_name = self.increment_filename(name, to_path, insert='-Copy')
             to_path = u'{0}/{1}'.format(to_path, to_name)
-        
-        model = self.save(model, to_path)
-        return model
+        return to_path.strip('/')
 
     def log_info(self):
         self.log.info(self.info_string())
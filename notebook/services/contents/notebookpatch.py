@@ -0,0 +1,171 @@
+"""Apply JSON-patch style deltas to notebooks.
+
+Supports the 'add', 'remove', 'replace' and 'test' operations of
+RFC 6902, on the cells and the metadata of a notebook,
+so that a client can save a notebook by sending only what changed.
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import copy
+import json
+
+from tornado.web import HTTPError
+
+import nbformat
+from nbformat import validate as validate_nb, ValidationError
+from ipython_genutils.py3compat import string_types
+
+# top-level keys of a notebook that can be patched
+patchable_keys = ('cells', 'metadata')
+
+
+def parse_pointer(pointer):
+    """Split a JSON pointer into its unescaped tokens"""
+    if not isinstance(pointer, string_types) or not pointer.startswith('/'):
+        raise HTTPError(400, u'Invalid patch path: %r' % (pointer,))
+    tokens = [
+        token.replace('~1', '/').replace('~0', '~')
+        for token in pointer[1:].split('/')
+    ]
+    if tokens[0] not in patchable_keys:
+        raise HTTPError(400, u'Cannot patch %r, only %s' % (
+            pointer, ' and '.join(patchable_keys)))
+    return tokens
+
+
+def _list_index(container, token, pointer, allow_end=False):
+    """Get the index in a list of a JSON pointer token"""
+    if allow_end and token == '-':
+        return len(container)
+    try:
+        index = int(token)
+    except ValueError:
+        raise HTTPError(400, u'Invalid list index in patch path %r' % pointer)
+    upper = len(container) if allow_end else len(container) - 1
+    if not 0 <= index <= upper:
+        raise HTTPError(400, u'List index out of range in patch path %r' % pointer)
+    return index
+
+
+def _resolve(nb, tokens, pointer):
+    """Get the container of the target of a JSON pointer, and its key"""
+    container = nb
+    for token in tokens[:-1]:
+        if isinstance(container, list):
+            container = container[_list_index(container, token, pointer)]
+        elif isinstance(container, dict) and token in container:
+            container = container[token]
+        else:
+            raise HTTPError(400, u'No such path in notebook: %r' % pointer)
+    return container, tokens[-1]
+
+
+def _get(container, key, pointer):
+    if isinstance(container, list):
+        return container[_list_index(container, key, pointer)]
+    elif isinstance(container, dict) and key in container:
+        return container[key]
+    raise HTTPError(400, u'No such path in notebook: %r' % pointer)
+
+
+def apply_patch(nb, operations):
+    """Apply a list of JSON-patch operations to a notebook, in place
+
+    Returns
+    -------
+    touched_cells : list
+        The cells of the notebook that were added or modified.
+    metadata_touched : bool
+        Whether the metadata of the notebook was modified.
+    """
+    if not isinstance(operations, list):
+        raise HTTPError(400, u'A patch must be a list of operations')
+    touched = {}
+    metadata_touched = False
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise HTTPError(400, u'Invalid patch operation: %r' % (operation,))
+        op = operation.get('op')
+        pointer = operation.get('path')
+        tokens = parse_pointer(pointer)
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise HTTPError(400, u'Missing value for %s of %r' % (op, pointer))
+        if len(tokens) == 1 and op != 'test':
+            if op != 'replace':
+                raise HTTPError(400, u'Cannot %s %r' % (op, pointer))
+            expected = list if tokens[0] == 'cells' else dict
+            if not isinstance(operation['value'], expected):
+                raise HTTPError(400, u'Invalid value for %r' % pointer)
+        container, key = _resolve(nb, tokens, pointer)
+
+        if op == 'test':
+            if _get(container, key, pointer) != operation['value']:
+                raise HTTPError(409, u'Patch test failed for %r' % pointer)
+            continue
+        elif op == 'add':
+            value = nbformat.from_dict(copy.deepcopy(operation['value']))
+            if isinstance(container, list):
+                container.insert(_list_index(container, key, pointer, allow_end=True), value)
+            elif isinstance(container, dict):
+                container[key] = value
+            else:
+                raise HTTPError(400, u'No such path in notebook: %r' % pointer)
+        elif op == 'replace':
+            value = nbformat.from_dict(copy.deepcopy(operation['value']))
+            _get(container, key, pointer)
+            if isinstance(container, list):
+                container[_list_index(container, key, pointer)] = value
+            else:
+                container[key] = value
+        elif op == 'remove':
+            _get(container, key, pointer)
+            if isinstance(container, list):
+                del container[_list_index(container, key, pointer)]
+            else:
+                del container[key]
+        else:
+            raise HTTPError(400, u'Unsupported patch operation: %r' % (op,))
+
+        if tokens[0] == 'metadata':
+            metadata_touched = True
+        elif len(tokens) == 1:
+            # all cells were replaced
+            for cell in nb.cells:
+                touched[id(cell)] = cell
+        elif len(tokens) > 2 or op != 'remove':
+            index = _list_index(nb.cells, tokens[1], pointer, allow_end=True)
+            if index == len(nb.cells):
+                index -= 1
+            cell = nb.cells[index]
+            touched[id(cell)] = cell
+
+    # cells that were modified, and then removed, don't need validating
+    current = set(id(cell) for cell in nb.cells)
+    touched_cells = [cell for key, cell in touched.items() if key in current]
+    return touched_cells, metadata_touched
+
+
+def validate_patched(nb, touched_cells, metadata_touched):
+    """Validate the parts of a notebook modified by `apply_patch`
+
+    Returns a validation message, or None if they are valid.
+    """
+    version = (nb.nbformat, nb.nbformat_minor)
+    try:
+        for cell in touched_cells:
+            validate_nb(cell, ref='cell', version=version[0], version_minor=version[1])
+        if metadata_touched:
+            # validate the metadata alone, without the cells
+            stub = nbformat.from_dict({
+                'cells': [],
+                'metadata': nb.metadata,
+                'nbformat': version[0],
+                'nbformat_minor': version[1],
+            })
+            validate_nb(stub, version=version[0], version_minor=version[1])
+    except ValidationError as e:
+        return u'Notebook validation failed: {}:\n{}'.format(
+            e.message, json.dumps(e.instance, indent=1, default=lambda obj: '<UNKNOWN>'),
+        )
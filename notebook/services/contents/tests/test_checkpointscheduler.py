@@ -0,0 +1,59 @@
+"""Tests for the checkpoint scheduler."""
+
+from unittest import TestCase
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+from ..checkpointscheduler import CheckpointScheduler
+
+
+class TestCheckpointScheduler(TestCase):
+
+    def test_coalesce(self):
+        created = []
+
+        def create(path):
+            future = Future()
+            created.append((path, future))
+            return future
+
+        scheduler = CheckpointScheduler(create)
+
+        @gen.coroutine
+        def run():
+            first = scheduler.schedule('a')
+            second = scheduler.schedule('a')
+            third = scheduler.schedule('a')
+            other = scheduler.schedule('dir/b')
+            # the first checkpoint is created right away,
+            # and the next ones wait for it, coalesced
+            self.assertIs(second, third)
+            self.assertEqual([p for p, f in created], ['a', 'dir/b'])
+            self.assertEqual(scheduler.stats(), {
+                'queued': 1, 'running': 2,
+                'created': 0, 'coalesced': 1, 'failed': 0,
+            })
+
+            flushed = scheduler.flush('dir')
+            created[1][1].set_result({'id': 'b'})
+            yield flushed
+            self.assertEqual((yield other), {'id': 'b'})
+
+            flushed = scheduler.flush('a')
+            created[0][1].set_result({'id': 1})
+            self.assertEqual((yield first), {'id': 1})
+            self.assertFalse(flushed.done())
+            self.assertEqual([p for p, f in created], ['a', 'dir/b', 'a'])
+            created[2][1].set_exception(ValueError('failed'))
+            yield flushed
+            with self.assertRaises(ValueError):
+                yield second
+
+            self.assertEqual(scheduler.stats(), {
+                'queued': 0, 'running': 0,
+                'created': 2, 'coalesced': 1, 'failed': 1,
+            })
+
+        IOLoop.current().run_sync(run)
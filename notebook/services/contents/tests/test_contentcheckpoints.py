@@ -0,0 +1,182 @@
+# coding: utf-8
+"""Tests for content-addressed checkpoints."""
+
+import os
+from unittest import TestCase
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch # py2
+
+from nbformat import v4 as nbformat
+from tornado.web import HTTPError
+
+from ipython_genutils.tempdir import TemporaryDirectory
+
+from ..contentcheckpoints import ContentCheckpoints, GenericContentCheckpoints
+from ..filemanager import FileContentsManager
+
+
+class TestContentCheckpoints(TestCase):
+
+    checkpoints_class = ContentCheckpoints
+
+    def setUp(self):
+        self._temp_dir = TemporaryDirectory()
+        self.td = self._temp_dir.name
+        self.contents_manager = FileContentsManager(
+            root_dir=self.td,
+            checkpoints_class=self.checkpoints_class,
+        )
+        self.checkpoints = self.contents_manager.checkpoints
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def count_blobs(self):
+        objects = self.checkpoints._store_path('objects')
+        return sum(len(files) for _, _, files in os.walk(objects))
+
+    def save_notebook(self, path, sources):
+        nb = nbformat.new_notebook()
+        for source in sources:
+            cell = nbformat.new_code_cell(source)
+            cell.outputs.append(nbformat.new_output('stream', text=source))
+            nb.cells.append(cell)
+        self.contents_manager.save({'type': 'notebook', 'content': nb}, path)
+        return nb
+
+    def test_dedup(self):
+        cm = self.contents_manager
+        sources = ['a = %i' % i for i in range(5)]
+        self.save_notebook('a.ipynb', sources)
+        cp1 = cm.create_checkpoint('a.ipynb')
+        # the notebook, and a cell and an output per cell
+        self.assertEqual(self.count_blobs(), 11)
+
+        sources[2] = 'changed'
+        self.save_notebook('a.ipynb', sources)
+        cp2 = cm.create_checkpoint('a.ipynb')
+        # only the changed cell and its output are stored
+        self.assertEqual(self.count_blobs(), 13)
+        self.assertEqual(cm.list_checkpoints('a.ipynb'), [cp1, cp2])
+
+        # a copy of the notebook shares all its blobs
+        cm.copy('a.ipynb', 'b.ipynb')
+        cm.create_checkpoint('b.ipynb')
+        self.assertEqual(self.count_blobs(), 13)
+
+        cm.restore_checkpoint(cp1['id'], 'a.ipynb')
+        nb = cm.get('a.ipynb')['content']
+        self.assertEqual([cell.source for cell in nb.cells], ['a = %i' % i for i in range(5)])
+        self.assertEqual(nb.cells[2].outputs[0].text, 'a = 2')
+        cm.restore_checkpoint(cp2['id'], 'a.ipynb')
+        nb = cm.get('a.ipynb')['content']
+        self.assertEqual(nb.cells[2].source, 'changed')
+
+    def test_unchanged(self):
+        cm = self.contents_manager
+        self.save_notebook('a.ipynb', ['x'])
+        cp1 = cm.create_checkpoint('a.ipynb')
+        cp2 = cm.create_checkpoint('a.ipynb')
+        self.assertEqual(cp1['id'], cp2['id'])
+        self.assertEqual(cm.list_checkpoints('a.ipynb'), [cp2])
+
+    def test_prune(self):
+        cm = self.contents_manager
+        self.checkpoints.max_checkpoints = 2
+        ids = []
+        for i in range(4):
+            self.save_notebook('a.ipynb', ['shared', 'step %i' % i])
+            ids.append(cm.create_checkpoint('a.ipynb')['id'])
+        self.assertEqual([cp['id'] for cp in cm.list_checkpoints('a.ipynb')], ids[-2:])
+        # the blobs of the pruned checkpoints are deleted
+        self.assertEqual(self.count_blobs(), 7)
+
+        cm.delete_checkpoint(ids[-1], 'a.ipynb')
+        self.assertEqual(self.count_blobs(), 5)
+        with self.assertRaises(HTTPError) as e:
+            cm.delete_checkpoint(ids[-1], 'a.ipynb')
+        self.assertEqual(e.exception.status_code, 404)
+
+    def test_files(self):
+        cm = self.contents_manager
+        data = b'\xff\x00binary'
+        cm.save({'type': 'file', 'format': 'text', 'content': u'text'}, 'a.txt')
+        cp_text = cm.create_checkpoint('a.txt')
+        with open(os.path.join(self.td, 'a.txt'), 'wb') as f:
+            f.write(data)
+        cp_binary = cm.create_checkpoint('a.txt')
+
+        cm.restore_checkpoint(cp_text['id'], 'a.txt')
+        self.assertEqual(cm.get('a.txt')['content'], u'text')
+        cm.restore_checkpoint(cp_binary['id'], 'a.txt')
+        with open(os.path.join(self.td, 'a.txt'), 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_directories(self):
+        cm = self.contents_manager
+        cm.new_untitled(type='directory')
+        self.save_notebook('Untitled Folder/a.ipynb', ['x'])
+        cp = cm.create_checkpoint('Untitled Folder/a.ipynb')
+
+        cm.rename('Untitled Folder', 'renamed')
+        self.assertEqual(cm.list_checkpoints('Untitled Folder/a.ipynb'), [])
+        self.assertEqual(cm.list_checkpoints('renamed/a.ipynb'), [cp])
+
+        cm.delete('renamed/a.ipynb')
+        cm.delete('renamed')
+        self.assertEqual(cm.list_checkpoints('renamed/a.ipynb'), [])
+        self.assertEqual(self.count_blobs(), 0)
+
+    def test_refcounts(self):
+        cm = self.contents_manager
+        self.checkpoints.max_checkpoints = 1
+        self.save_notebook('a.ipynb', ['x'])
+        cm.create_checkpoint('a.ipynb')
+        self.save_notebook('b.ipynb', ['x'])
+        cm.create_checkpoint('b.ipynb')
+        walk = self.checkpoints._walk_manifests
+        with patch.object(self.checkpoints, '_walk_manifests', side_effect=walk) as walked:
+            for i in range(3):
+                self.save_notebook('a.ipynb', ['x', 'step %i' % i])
+                cm.create_checkpoint('a.ipynb')
+        # pruning doesn't read the manifests of other files
+        self.assertEqual(walked.call_count, 0)
+        # the blobs shared with b.ipynb are kept
+        self.assertEqual(self.count_blobs(), 5)
+        cm.delete('b.ipynb')
+        self.assertEqual(self.count_blobs(), 5)
+
+    def test_blobs_synced_once(self):
+        cm = self.contents_manager
+        # the first save creates a checkpoint
+        self.save_notebook('a.ipynb', ['x'])
+        self.save_notebook('a.ipynb', ['a = %i' % i for i in range(5)])
+        syncer = self.checkpoints.file_syncer
+        with patch.object(syncer, 'sync', wraps=syncer.sync) as sync, \
+                patch.object(syncer, 'sync_written', wraps=syncer.sync_written) as sync_written:
+            cm.create_checkpoint('a.ipynb')
+        # the new cells and outputs together, then the manifest
+        self.assertEqual(sync_written.call_count, 1)
+        self.assertEqual(len(sync_written.call_args[0][0]), 10)
+        self.assertEqual(sync.call_count, 1)
+
+    def test_truncated_blob(self):
+        cm = self.contents_manager
+        self.save_notebook('a.ipynb', ['x'])
+        cp = cm.create_checkpoint('a.ipynb')
+        cm.delete_checkpoint(cp['id'], 'a.ipynb')
+        self.assertEqual(self.count_blobs(), 0)
+        # a blob left empty by a crash is written again
+        key = self.checkpoints._write_blob(b'data', [])
+        with open(self.checkpoints._blob_path(key), 'wb'):
+            pass
+        self.assertEqual(self.checkpoints._write_blob(b'data', []), key)
+        self.assertEqual(self.checkpoints._read_blob(key), b'data')
+
+
+class TestGenericContentCheckpoints(TestContentCheckpoints):
+
+    checkpoints_class = GenericContentCheckpoints
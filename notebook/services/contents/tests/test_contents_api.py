@@ -3,6 +3,8 @@
 
 from contextlib import contextmanager
 from functools import partial
+import errno
+import hashlib
 import io
 import json
 import os
@@ -13,7 +15,9 @@ pjoin = os.path.join
 
 import requests
 
+from ..contentcheckpoints import ContentCheckpoints, GenericContentCheckpoints
 from ..filecheckpoints import GenericFileCheckpoints
+from ..filemanager import AsyncFileContentsManager
 
 from traitlets.config import Config
 from notebook.utils import url_path_join, url_escape, to_os_path
@@ -53,10 +57,10 @@ class API(object):
     def __init__(self, request):
         self.request = request
 
-    def _req(self, verb, path, body=None, params=None):
+    def _req(self, verb, path, body=None, params=None, headers=None):
         response = self.request(verb,
                 url_path_join('api/contents', path),
-                data=body, params=params,
+                data=body, params=params, headers=headers or {},
         )
         response.raise_for_status()
         return response
@@ -64,6 +68,19 @@ class API(object):
     def list(self, path='/'):
         return self._req('GET', path)
 
+    def list_page(self, path='/', offset=None, limit=None, sort=None):
+        params = {}
+        if offset is not None:
+            params['offset'] = offset
+        if limit is not None:
+            params['limit'] = limit
+        if sort is not None:
+            params['sort'] = sort
+        return self._req('GET', path, params=params)
+
+    def list_stream(self, path='/'):
+        return self._req('GET', path, params={'stream': '1'})
+
     def read(self, path, type=None, format=None, content=None):
         params = {}
         if type is not None:
@@ -93,6 +110,14 @@ class API(object):
     def upload(self, path, body):
         return self._req('PUT', path, body)
 
+    def read_raw(self, path):
+        return self._req('GET', path,
+            headers={'Accept': 'application/octet-stream'})
+
+    def upload_raw(self, path, body):
+        return self._req('PUT', path, body,
+            headers={'Content-Type': 'application/octet-stream'})
+
     def mkdir(self, path='/'):
         return self._req('PUT', path, json.dumps({'type': 'directory'}))
 
@@ -103,6 +128,12 @@ class API(object):
     def save(self, path, body):
         return self._req('PUT', path, body)
 
+    def patch(self, path, operations, revision):
+        return self._req('PATCH', path, json.dumps(operations), headers={
+            'Content-Type': 'application/json-patch+json',
+            'If-Match': revision,
+        })
+
     def delete(self, path='/'):
         return self._req('DELETE', path)
 
@@ -266,6 +297,103 @@ class APITest(NotebookTestBase):
             self.assertIn('content', model)
             self.assertEqual(model['content'], None)
 
+    def test_list_paginated(self):
+        listing = self.api.list('ordering').json()['content']
+        names = sorted(m['name'] for m in listing)
+        self.assertEqual(len(names), 9)
+
+        paged = []
+        offset = 0
+        while offset is not None:
+            model = self.api.list_page('ordering', offset=offset, limit=4).json()
+            self.assertEqual(model['type'], 'directory')
+            self.assertLessEqual(len(model['content']), 4)
+            self.assertEqual(model['pagination']['total'], 9)
+            paged.extend(model['content'])
+            offset = model['pagination']['next_offset']
+        self.assertEqual([m['name'] for m in paged], names)
+        self.assertEqual(
+            sorted(paged, key=lambda m: m['name']),
+            sorted(listing, key=lambda m: m['name']),
+        )
+
+        model = self.api.list_page('ordering', limit=2, sort='-name').json()
+        self.assertEqual([m['name'] for m in model['content']], names[::-1][:2])
+        self.assertEqual(model['pagination']['next_offset'], 2)
+
+        model = self.api.list_page('ordering', sort='last_modified').json()
+        self.assertEqual(len(model['content']), 9)
+
+        with assert_http_error(400):
+            self.api.list_page('ordering', sort='size')
+        with assert_http_error(400):
+            self.api.list_page('ordering', limit=-1)
+        # an empty page would never advance next_offset
+        with assert_http_error(400):
+            self.api.list_page('ordering', limit=0)
+        with self.assertRaises(requests.HTTPError) as e:
+            self.api.list_page('ordering', offset='abc')
+        self.assertIn("'abc'", e.exception.response.json()['message'])
+
+    def test_list_paginated_same_mtime(self):
+        # entries with the same mtime are ordered by name
+        listing = self.api.list('ordering').json()['content']
+        names = sorted(m['name'] for m in listing)
+        for name in names:
+            os.utime(self.to_os_path(url_path_join('ordering', name)), (0, 0))
+        for sort, expected in [('last_modified', names), ('-last_modified', names[::-1])]:
+            paged = []
+            offset = 0
+            while offset is not None:
+                model = self.api.list_page('ordering', offset=offset, limit=2,
+                                           sort=sort).json()
+                paged.extend(m['name'] for m in model['content'])
+                offset = model['pagination']['next_offset']
+            self.assertEqual(paged, expected)
+
+    def test_list_stream(self):
+        for d in self.dirs:
+            listing = self.api.list(d).json()
+            streamed = self.api.list_stream(d).json()
+            self.assertEqual(
+                sorted(streamed.pop('content'), key=lambda m: m['name']),
+                sorted(listing.pop('content'), key=lambda m: m['name']),
+            )
+            self.assertEqual(streamed, listing)
+
+        with assert_http_error(404):
+            self.api.list_stream('nonexistant')
+
+    @contextmanager
+    def failing_listing(self, after):
+        """Make reading a directory listing fail after `after` batches"""
+        cm = self.notebook.contents_manager
+        batches = []
+        def read_directory_batch(entries, size):
+            if len(batches) >= after:
+                raise OSError(errno.EACCES, 'Permission denied')
+            batches.append(size)
+            return type(cm).read_directory_batch(cm, entries, size)
+        cm.read_directory_batch = read_directory_batch
+        try:
+            yield
+        finally:
+            del cm.read_directory_batch
+
+    def test_list_stream_error(self):
+        # an error before anything was sent is a regular error response
+        with self.failing_listing(after=0):
+            with assert_http_error(500):
+                self.api.list_stream('foo')
+
+        # an error in the middle of the listing aborts the response
+        with self.failing_listing(after=1):
+            with self.assertRaises((
+                requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.ConnectionError,
+            )):
+                self.api.list_stream('foo')
+
     def test_list_nonexistant_dir(self):
         with assert_http_error(404):
             self.api.list('nonexistant')
@@ -457,6 +585,106 @@ class APITest(NotebookTestBase):
         decoded = decodebytes(model['content'].encode('ascii'))
         self.assertEqual(decoded, body)
 
+    def test_read_raw(self):
+        for d, name in self.dirs_nbs:
+            path = url_path_join(d, name + '.blob')
+            r = self.api.read_raw(path)
+            self.assertEqual(r.headers['Content-Type'], 'application/octet-stream')
+            self.assertEqual(r.content, self._blob_for_name(name))
+
+            path = url_path_join(d, name + '.txt')
+            r = self.api.read_raw(path)
+            self.assertEqual(r.content, self._txt_for_name(name).encode('utf-8'))
+
+        with assert_http_error(400):
+            self.api.read_raw('foo')
+        with assert_http_error(404):
+            self.api.read_raw('foo/nonexistant.blob')
+
+    def test_upload_raw(self):
+        # larger than a chunk, so that it's written and read in pieces
+        body = os.urandom(3 * 1024 * 1024 + 5)
+        path = u'å b/Upload tést.dat'
+        r = self.api.upload_raw(path, body)
+        self.assertEqual(r.status_code, 201)
+        model = r.json()
+        self.assertEqual(model['path'], path)
+        self.assertEqual(model['type'], 'file')
+        self.assertIsNone(model['content'])
+        self.assertEqual(self.api.read_raw(path).content, body)
+        model = self.api.read(path).json()
+        self.assertEqual(decodebytes(model['content'].encode('ascii')), body)
+
+        # overwrite
+        r = self.api.upload_raw(path, b'\xFFblob')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(self.api.read_raw(path).content, b'\xFFblob')
+
+        # empty file
+        self.api.upload_raw(path, b'')
+        self.assertEqual(self.api.read_raw(path).content, b'')
+
+        # no intermediate files are left behind
+        names = [m['name'] for m in self.api.list(u'å b').json()['content']]
+        self.assertIn(u'Upload tést.dat', names)
+        self.assertEqual(
+            [n for n in os.listdir(self.to_os_path(u'å b')) if n.startswith('.~')],
+            [],
+        )
+
+        with assert_http_error(400):
+            self.api.upload_raw(u'å b/Upload tést.ipynb', b'{}')
+        with assert_http_error(400):
+            self.api.upload_raw(u'å b', b'blob')
+
+    def test_resumable_upload(self):
+        data = os.urandom(5000)
+        path = u'å b/resumable.dat'
+        url = url_path_join('api/contents', path, 'uploads')
+        body = json.dumps({'size': len(data),
+                           'sha256': hashlib.sha256(data).hexdigest()})
+        r = self.request('POST', url, data=body)
+        if not hasattr(self.notebook.contents_manager, 'create_upload'):
+            self.assertEqual(r.status_code, 400)
+            return
+        self.assertEqual(r.status_code, 201)
+        upload = r.json()
+        upload_url = url_path_join(url, upload['id'])
+        self.assertTrue(r.headers['Location'].endswith('/uploads/' + upload['id']))
+
+        for offset in (4000, 0):
+            chunk = data[offset:offset + 2000]
+            r = self.request('PUT', upload_url, data=chunk, params={
+                'offset': offset, 'sha256': hashlib.sha256(chunk).hexdigest()})
+            r.raise_for_status()
+        r = self.request('GET', upload_url)
+        self.assertEqual(r.json()['received'], [[0, 2000], [4000, 5000]])
+
+        r = self.request('POST', upload_url)
+        self.assertEqual(r.status_code, 400)
+        self.request('PUT', upload_url, data=data[2000:4000],
+            params={'offset': 2000}).raise_for_status()
+        r = self.request('POST', upload_url)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()['path'], path)
+        self.assertEqual(self.api.read_raw(path).content, data)
+        self.assertEqual(self.request('GET', upload_url).status_code, 404)
+
+        # aborted upload
+        r = self.request('POST', url, data=json.dumps({'size': 10}))
+        upload_url = url_path_join(url, r.json()['id'])
+        self.assertEqual(self.request('DELETE', upload_url).status_code, 204)
+        self.assertEqual(self.request('GET', upload_url).status_code, 404)
+
+    def test_upload_raw_unauthenticated(self):
+        r = requests.put(
+            url_path_join(self.base_url(), 'api/contents', 'foo/raw.dat'),
+            data=b'blob',
+            headers={'Content-Type': 'application/octet-stream'},
+        )
+        self.assertEqual(r.status_code, 403)
+        self.assertFalse(self.isfile('foo/raw.dat'))
+
     def test_upload_v2(self):
         nb = v2.new_notebook()
         ws = v2.new_worksheet()
@@ -591,6 +819,59 @@ class APITest(NotebookTestBase):
         self.assertEqual(newnb.cells[0].source,
                          u'Created by test ³')
 
+    def test_patch(self):
+        path = 'foo/a.ipynb'
+        revision = self.api.read(path).headers['ETag']
+        r = self.api.patch(path, [
+            {'op': 'add', 'path': '/cells/-', 'value': new_markdown_cell(u'Patched ³')},
+            {'op': 'add', 'path': '/metadata/patched', 'value': True},
+        ], revision)
+        self.assertEqual(r.json()['type'], 'notebook')
+        self.assertNotIn('message', r.json())
+        self.assertNotEqual(r.headers['ETag'], revision)
+        revision = r.headers['ETag']
+
+        r = self.api.read(path)
+        self.assertEqual(r.headers['ETag'], revision)
+        nb = r.json()['content']
+        self.assertEqual(nb['cells'][-1]['source'], u'Patched ³')
+        self.assertTrue(nb['metadata']['patched'])
+
+        r = self.api.patch(path, [
+            {'op': 'test', 'path': '/cells/0/source', 'value': u'Patched ³'},
+            {'op': 'replace', 'path': '/cells/0/source', 'value': u'Replaced'},
+        ], revision)
+        revision = r.headers['ETag']
+        nb = self.api.read(path).json()['content']
+        self.assertEqual(nb['cells'][0]['source'], u'Replaced')
+
+        # the notebook changed since the revision
+        with assert_http_error(412):
+            self.api.patch(path, [
+                {'op': 'remove', 'path': '/cells/0'},
+            ], '"stale"')
+        with assert_http_error(409):
+            self.api.patch(path, [
+                {'op': 'test', 'path': '/cells/0/source', 'value': u'Patched ³'},
+            ], revision)
+        with assert_http_error(400):
+            self.api.patch(path, [
+                {'op': 'remove', 'path': '/nbformat'},
+            ], revision)
+        with assert_http_error(428):
+            self.api._req('PATCH', path, '[]', headers={
+                'Content-Type': 'application/json-patch+json',
+            })
+        nb = self.api.read(path).json()['content']
+        self.assertEqual(len(nb['cells']), 1)
+
+        # invalid cells are saved with a validation message
+        r = self.api.patch(path, [
+            {'op': 'add', 'path': '/cells/0/bad', 'value': 1},
+        ], revision)
+        self.assertIn('Notebook validation failed', r.json()['message'])
+        self.assertIn('bad', self.api.read(path).json()['content']['cells'][0])
+
     def test_checkpoints(self):
         resp = self.api.read('foo/a.ipynb')
         r = self.api.new_checkpoint('foo/a.ipynb')
@@ -718,3 +999,63 @@ class GenericFileCheckpointsAPITest(APITest):
         )
 
 
+class ContentCheckpointsAPITest(APITest):
+    """
+    Run the tests from APITest with ContentCheckpoints.
+    """
+    config = Config()
+    config.FileContentsManager.checkpoints_class = ContentCheckpoints
+
+    def test_config_did_something(self):
+
+        self.assertIsInstance(
+            self.notebook.contents_manager.checkpoints,
+            ContentCheckpoints,
+        )
+
+
+class GenericContentCheckpointsAPITest(APITest):
+    """
+    Run the tests from APITest with GenericContentCheckpoints.
+    """
+    config = Config()
+    config.FileContentsManager.checkpoints_class = GenericContentCheckpoints
+
+    def test_config_did_something(self):
+
+        self.assertIsInstance(
+            self.notebook.contents_manager.checkpoints,
+            GenericContentCheckpoints,
+        )
+
+
+class AsyncFileContentsManagerAPITest(APITest):
+    """
+    Run the tests from APITest with AsyncFileContentsManager.
+    """
+    config = Config()
+    config.NotebookApp.contents_manager_class = AsyncFileContentsManager
+
+    def test_config_did_something(self):
+
+        self.assertIsInstance(
+            self.notebook.contents_manager,
+            AsyncFileContentsManager,
+        )
+
+
+class AsyncGenericFileCheckpointsAPITest(AsyncFileContentsManagerAPITest):
+    """
+    Run the tests from APITest with AsyncFileContentsManager
+    and GenericFileCheckpoints.
+    """
+    config = Config()
+    config.NotebookApp.contents_manager_class = AsyncFileContentsManager
+    config.FileContentsManager.checkpoints_class = GenericFileCheckpoints
+
+    def test_config_did_something(self):
+
+        self.assertIsInstance(
+            self.notebook.contents_manager.checkpoints,
+            GenericFileCheckpoints,
+        )
@@ -4,14 +4,16 @@
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
 
+import errno
 import io as stdlib_io
 import os.path
 import stat
+import threading
 
 import nose.tools as nt
 
 from ipython_genutils.testing.decorators import skip_win32
-from ..fileio import atomic_writing
+from ..fileio import atomic_writing, copy2_safe, FileCopier, FileSyncer, ShortCopyError
 
 from ipython_genutils.tempdir import TemporaryDirectory
 
@@ -48,6 +50,10 @@ def test_atomic_writing():
         with stdlib_io.open(f1, 'r') as f:
             nt.assert_equal(f.read(), u'Before')
 
+        # the temporary file was removed, and the file never copied
+        nt.assert_equal(sorted(os.listdir(td)),
+                        ['flamingo', 'penguin'] if have_symlink else ['penguin'])
+
         with atomic_writing(f1) as f:
             f.write(u'Overwritten')
 
@@ -66,6 +72,123 @@ def test_atomic_writing():
             with stdlib_io.open(f1, 'r') as f:
                 nt.assert_equal(f.read(), u'written from symlink')
 
+def test_atomic_writing_syncers():
+    with TemporaryDirectory() as td:
+        syncer = FileSyncer('group', interval=0.05)
+        paths = [os.path.join(td, str(i)) for i in range(4)]
+
+        def write(path):
+            with atomic_writing(path, syncer=syncer) as f:
+                f.write(path)
+
+        threads = [threading.Thread(target=write, args=(path,)) for path in paths]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        syncer.close()
+        for path in paths:
+            with stdlib_io.open(path) as f:
+                nt.assert_equal(f.read(), path)
+        # writes after close are synced right away
+        write(paths[0])
+
+        syncer = FileSyncer('shutdown')
+        write(paths[1])
+        # the directory is synced too, for the rename to stay
+        nt.assert_equal(syncer._unsynced, {paths[1], td})
+        syncer.close()
+        nt.assert_equal(syncer._unsynced, set())
+
+        with nt.assert_raises(ValueError):
+            FileSyncer('sometimes')
+
+        nt.assert_equal(sorted(os.listdir(td)), sorted(os.path.basename(p) for p in paths))
+
+
+def test_copy2_safe_copiers():
+    with TemporaryDirectory() as td:
+        src = os.path.join(td, 'src')
+        data = os.urandom(3 * 1024 * 1024 + 1)
+        with stdlib_io.open(src, 'wb') as f:
+            f.write(data)
+        os.utime(src, (1000000000, 1000000000))
+
+        for method in FileCopier.methods:
+            copier = FileCopier([method])
+            for atomic in (True, False):
+                dst = os.path.join(td, 'dst')
+                copy2_safe(src, dst, copier=copier, atomic=atomic)
+                with stdlib_io.open(dst, 'rb') as f:
+                    nt.assert_equal(f.read(), data)
+                nt.assert_equal(os.stat(dst).st_mtime, 1000000000)
+            # each copy is counted for one method, which this one falls back to
+            stats = copier.stats()
+            nt.assert_equal(sum(s['files'] for s in stats.values()), 2)
+            nt.assert_equal(sum(s['bytes'] for s in stats.values()), 2 * len(data))
+            used = [m for m in stats if stats[m]['files']]
+            nt.assert_equal(len(used), 1)
+            nt.assert_in(used[0], (method, 'buffered'))
+
+        nt.assert_equal(sorted(os.listdir(td)), ['dst', 'src'])
+
+        with nt.assert_raises(ValueError):
+            FileCopier(['teleport'])
+
+
+def test_copier_fallback():
+    copier = FileCopier(['sendfile', 'buffered'])
+    tried = []
+
+    def unsupported(src_fd, dst_fd, size):
+        tried.append(size)
+        os.write(dst_fd, b'partial')
+        raise OSError(errno.EOPNOTSUPP, "not supported")
+    copier.methods = ['sendfile', 'buffered']
+    copier._stats['sendfile'] = {'files': 0, 'bytes': 0}
+    copier._copy_sendfile = unsupported
+
+    with TemporaryDirectory() as td:
+        src = os.path.join(td, 'src')
+        with stdlib_io.open(src, 'wb') as f:
+            f.write(b'data')
+        for i in range(2):
+            dst = os.path.join(td, 'dst%i' % i)
+            copy2_safe(src, dst, copier=copier)
+            with stdlib_io.open(dst, 'rb') as f:
+                nt.assert_equal(f.read(), b'data')
+    # the filesystem is only probed once
+    nt.assert_equal(tried, [4])
+    nt.assert_equal(copier.stats()['buffered'], {'files': 2, 'bytes': 8})
+
+
+def test_copier_errors():
+    copier = FileCopier(['sendfile', 'buffered'])
+    copier.methods = ['sendfile', 'buffered']
+    copier._stats['sendfile'] = {'files': 0, 'bytes': 0}
+
+    def short(src_fd, dst_fd, size):
+        raise ShortCopyError("copied 0/%i bytes" % size)
+
+    def failing(src_fd, dst_fd, size):
+        raise OSError(errno.EIO, "I/O error")
+
+    with TemporaryDirectory() as td:
+        src = os.path.join(td, 'src')
+        with stdlib_io.open(src, 'wb') as f:
+            f.write(b'data')
+        # short copies fall back to the next method
+        copier._copy_sendfile = short
+        copy2_safe(src, os.path.join(td, 'dst1'), copier=copier)
+        nt.assert_equal(copier.stats()['buffered']['files'], 1)
+        # other errors are raised
+        copier._probed.clear()
+        copier._copy_sendfile = failing
+        with nt.assert_raises(OSError) as cm:
+            copy2_safe(src, os.path.join(td, 'dst2'), copier=copier)
+        nt.assert_equal(cm.exception.errno, errno.EIO)
+
+
 def _save_umask():
     global umask
     umask = os.umask(0)
@@ -0,0 +1,75 @@
+# coding: utf-8
+"""Tests for the pluggable JSON libraries"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from datetime import datetime
+import json
+
+import nose.tools as nt
+
+import nbformat
+from nbformat.v4 import new_notebook, new_code_cell, new_output
+from jupyter_client.jsonutil import date_default
+from notebook import _tz as tz
+
+from ..fileio import FileManagerMixin
+from ..jsoncodec import get_codec, stdlib_codec, fast_json_libraries
+from ..handlers import dumps_model
+
+
+def _installed_codecs():
+    codecs = [stdlib_codec]
+    for name in fast_json_libraries:
+        try:
+            codecs.append(get_codec(name))
+        except ImportError:
+            pass
+    return codecs
+
+
+def test_get_codec():
+    nt.assert_is(get_codec('json'), stdlib_codec)
+    nt.assert_in(get_codec().name, ['json'] + fast_json_libraries)
+    with nt.assert_raises(ImportError):
+        get_codec('not_a_json_library')
+
+
+def test_codecs():
+    obj = {u'a': [1, 2.5, None, True], u'ü': u'ç /\n'}
+    for codec in _installed_codecs():
+        out = codec.dumps(obj)
+        if isinstance(out, bytes):
+            out = out.decode('utf-8')
+        nt.assert_equal(json.loads(out), obj)
+        nt.assert_equal(codec.loads(json.dumps(obj)), obj)
+        # values the fast libraries may not support fall back on the stdlib
+        nt.assert_equal(codec.loads(u'[%d]' % 2 ** 70), [2 ** 70])
+        nt.assert_equal(json.loads(codec.dumps([2 ** 70])), [2 ** 70])
+
+
+def test_parse_notebook():
+    nb = new_notebook(cells=[
+        new_code_cell(u'a = 1\nb', outputs=[new_output('stream', text=u'ü\n')]),
+    ])
+    s = nbformat.writes(nb)
+    for codec in _installed_codecs():
+        mixin = FileManagerMixin(json_codec=codec)
+        nt.assert_equal(mixin._parse_notebook(s), nbformat.reads(s, as_version=4))
+        with nt.assert_raises(ValueError):
+            mixin._parse_notebook(u'[]')
+
+
+def test_dumps_model():
+    now = datetime.now(tz=tz.UTC)
+    model = {
+        'type': 'directory', 'name': u'ü', 'created': now, 'last_modified': now,
+        'content': [{'type': 'file', 'created': now, 'last_modified': now}],
+    }
+    out = dumps_model(model)
+    if isinstance(out, bytes):
+        out = out.decode('utf-8')
+    nt.assert_equal(json.loads(out), json.loads(json.dumps(model, default=date_default)))
+    # the model isn't modified
+    nt.assert_is(model['content'][0]['created'], now)
@@ -1,6 +1,11 @@
 from unittest import TestCase
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch # py2
 from ipython_genutils.tempdir import TemporaryDirectory
-from ..largefilemanager import LargeFileManager
+from ..largefilemanager import LargeFileManager, merge_ranges
+import hashlib
 import os
 from tornado import web
 
@@ -111,3 +116,99 @@ class TestLargeFileManager(TestCase):
         self.assertIn('path', model)
         self.assertEqual(model['name'], 'Untitled.ipynb')
         self.assertEqual(model['path'], 'foo/Untitled.ipynb')
+
+    def test_merge_ranges(self):
+        self.assertEqual(merge_ranges([], 5, 10), [[5, 10]])
+        self.assertEqual(merge_ranges([[5, 10]], 0, 5), [[0, 10]])
+        self.assertEqual(merge_ranges([[0, 2], [8, 10]], 4, 6), [[0, 2], [4, 6], [8, 10]])
+        self.assertEqual(merge_ranges([[0, 2], [4, 6], [8, 10]], 1, 9), [[0, 10]])
+
+    def test_upload(self):
+        cm = self.contents_manager
+        data = os.urandom(10000)
+        digest = hashlib.sha256(data).hexdigest()
+        upload = cm.create_upload('big.dat', len(data), sha256=digest)
+        self.assertEqual(upload['received'], [])
+        upload_id = upload['id']
+        # the partial file isn't listed
+        self.assertEqual(cm.get('')['content'], [])
+
+        # out of order chunks
+        chunks = [(offset, data[offset:offset + 3000]) for offset in (6000, 0, 9000)]
+        for offset, chunk in chunks:
+            cm.save_upload_chunk('big.dat', upload_id, offset, chunk,
+                sha256=hashlib.sha256(chunk).hexdigest())
+        self.assertEqual(cm.get_upload('big.dat', upload_id)['received'],
+            [[0, 3000], [6000, 10000]])
+        with self.assertRaises(web.HTTPError) as e:
+            cm.finish_upload('big.dat', upload_id)
+        self.assertIn('incomplete', str(e.exception))
+
+        # corrupted and out of bounds chunks are rejected
+        with self.assertRaises(web.HTTPError) as e:
+            cm.save_upload_chunk('big.dat', upload_id, 3000, b'x' * 3000,
+                sha256=hashlib.sha256(data[3000:6000]).hexdigest())
+        self.assertIn('Checksum mismatch', str(e.exception))
+        with self.assertRaises(web.HTTPError):
+            cm.save_upload_chunk('big.dat', upload_id, 9000, data[:3000])
+
+        # resume with another contents manager, e.g. after a restart
+        cm2 = LargeFileManager(root_dir=self.td)
+        upload = cm2.get_upload('big.dat', upload_id)
+        self.assertEqual(upload['received'], [[0, 3000], [6000, 10000]])
+        cm2.save_upload_chunk('big.dat', upload_id, 3000, data[3000:6000])
+        model = cm2.finish_upload('big.dat', upload_id)
+        self.assertEqual(model['path'], 'big.dat')
+        self.assertEqual(model['type'], 'file')
+        with open(os.path.join(self.td, 'big.dat'), 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(os.listdir(self.td), ['big.dat'])
+        with self.assertRaises(web.HTTPError) as e:
+            cm2.get_upload('big.dat', upload_id)
+        self.assertEqual(e.exception.status_code, 404)
+
+    def test_upload_hashed_incrementally(self):
+        cm = self.contents_manager
+        data = os.urandom(10000)
+        upload = cm.create_upload('big.dat', len(data),
+            sha256=hashlib.sha256(data).hexdigest())
+        hash_range = cm._hash_range
+        with patch.object(cm, '_hash_range', side_effect=hash_range) as read:
+            # the chunk after a gap is read back once it is filled
+            for offset in (0, 6000, 3000):
+                cm.save_upload_chunk('big.dat', upload['id'], offset, data[offset:offset + 3000])
+            self.assertEqual(read.call_args_list[-1][0][2:], (6000, 9000))
+            read.reset_mock()
+            cm.save_upload_chunk('big.dat', upload['id'], 9000, data[9000:])
+            cm.finish_upload('big.dat', upload['id'])
+        # nothing is read back when the chunks follow each other
+        self.assertEqual(read.call_count, 0)
+        with open(os.path.join(self.td, 'big.dat'), 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_upload_checksum_mismatch(self):
+        cm = self.contents_manager
+        upload = cm.create_upload('big.dat', 3, sha256=hashlib.sha256(b'abc').hexdigest())
+        cm.save_upload_chunk('big.dat', upload['id'], 0, b'abd')
+        with self.assertRaises(web.HTTPError) as e:
+            cm.finish_upload('big.dat', upload['id'])
+        self.assertIn('Checksum mismatch', str(e.exception))
+        self.assertFalse(os.path.exists(os.path.join(self.td, 'big.dat')))
+
+        cm.delete_upload('big.dat', upload['id'])
+        self.assertEqual(os.listdir(self.td), [])
+
+    def test_upload_empty(self):
+        cm = self.contents_manager
+        upload = cm.create_upload('empty.dat', 0)
+        cm.finish_upload('empty.dat', upload['id'])
+        self.assertEqual(os.path.getsize(os.path.join(self.td, 'empty.dat')), 0)
+
+        with self.assertRaises(web.HTTPError):
+            cm.create_upload('empty.dat', -1)
+        with self.assertRaises(web.HTTPError):
+            cm.create_upload('nb.ipynb', 10)
+        with self.assertRaises(web.HTTPError) as e:
+            cm.get_upload('empty.dat', '../../etc')
+        self.assertEqual(e.exception.status_code, 404)
+
@@ -4,6 +4,7 @@ from __future__ import print_function
 
 import os
 import sys
+import threading
 import time
 from contextlib import contextmanager
 from itertools import combinations
@@ -19,7 +20,9 @@ from ipython_genutils.tempdir import TemporaryDirectory
 from traitlets import TraitError
 from ipython_genutils.testing import decorators as dec
 
-from ..filemanager import FileContentsManager
+from tornado.ioloop import IOLoop
+
+from ..filemanager import FileContentsManager, AsyncFileContentsManager
 
 
 def _make_dir(contents_manager, api_path):
@@ -60,6 +63,17 @@ class TestFileContentsManager(TestCase):
             fm = FileContentsManager(root_dir=td)
             self.assertEqual(fm.root_dir, td)
 
+    def test_group_fsync_policy(self):
+        # writes waiting for their group sync would block the event loop
+        with TemporaryDirectory() as td:
+            fm = FileContentsManager(root_dir=td, fsync_policy='group')
+            self.assertEqual(fm.file_syncer.policy, 'always')
+            self.assertEqual(fm.checkpoints.file_syncer.policy, 'always')
+            fm.shutdown()
+            fm = AsyncFileContentsManager(root_dir=td, fsync_policy='group')
+            self.assertEqual(fm.file_syncer.policy, 'group')
+            fm.shutdown()
+
     def test_missing_root_dir(self):
         with TemporaryDirectory() as td:
             root = os.path.join(td, 'notebook', 'dir', 'is', 'missing')
@@ -108,6 +122,201 @@ class TestFileContentsManager(TestCase):
         self.assertEqual(cp_dir, os.path.join(root, cpm.checkpoint_dir, cp_name))
         self.assertEqual(cp_subdir, os.path.join(root, subd, cpm.checkpoint_dir, cp_name))
 
+    def test_dir_listing_cache(self):
+        with TemporaryDirectory() as td:
+            cm = FileContentsManager(root_dir=td, dir_listing_cache_size=1)
+            cm.new_untitled(ext='.txt')
+            listing = cm.get('')['content']
+            self.assertEqual([m['name'] for m in listing], ['untitled.txt'])
+            self.assertEqual(len(cm._dir_listing_cache), 1)
+
+            # modifying a listing doesn't affect the cached models
+            listing[0]['name'] = 'changed'
+            listing = cm.get('')['content']
+            self.assertEqual([m['name'] for m in listing], ['untitled.txt'])
+
+            # saving through the contents manager invalidates the listing
+            cm.new_untitled(ext='.txt')
+            names = sorted(m['name'] for m in cm.get('')['content'])
+            self.assertEqual(names, ['untitled.txt', 'untitled1.txt'])
+
+            # so does a change to the directory made by another process
+            os.remove(cm._get_os_path('untitled.txt'))
+            names = [m['name'] for m in cm.get('')['content']]
+            self.assertEqual(names, ['untitled1.txt'])
+
+            # only dir_listing_cache_size listings are kept
+            _make_dir(cm, 'sub')
+            self.assertEqual(cm.get('sub')['content'], [])
+            self.assertEqual(list(cm._dir_listing_cache), [cm._get_os_path('sub')])
+
+    def test_directory_page(self):
+        with TemporaryDirectory() as td:
+            for name in ['b', 'a', 'd', 'c', 'e']:
+                with open(os.path.join(td, name), 'w') as f:
+                    f.write(name)
+                os.utime(os.path.join(td, name), (0, 0))
+            uncached = FileContentsManager(root_dir=td)
+            cached = FileContentsManager(root_dir=td, dir_listing_cache_size=1)
+            for cm in (uncached, cached):
+                for sort, names in [('name', 'abcde'), ('-last_modified', 'edcba')]:
+                    pages = [
+                        cm.get_directory_page('', offset=offset, limit=2, sort=sort)
+                        for offset in (0, 2, 4)
+                    ]
+                    listed = [m['name'] for page in pages for m in page['content']]
+                    self.assertEqual(''.join(listed), names)
+                    self.assertEqual(
+                        [page['pagination']['next_offset'] for page in pages],
+                        [2, 4, None],
+                    )
+                    self.assertEqual(pages[0]['pagination']['total'], 5)
+            # the sorted listings are cached along with the listing
+            listing = list(cached._dir_listing_cache.values())[0][1]
+            self.assertEqual(sorted(listing['sorted']), ['-last_modified', 'name'])
+
+            with self.assertRaises(HTTPError):
+                cached.get_directory_page('', limit=0)
+
+    def test_dir_listing_cache_invalidation(self):
+        with TemporaryDirectory() as td:
+            cm = FileContentsManager(root_dir=td, dir_listing_cache_size=10)
+            cm.new(path='a.txt', model={'type': 'file', 'format': 'text',
+                                        'content': u'one'})
+            cp = cm.create_checkpoint('a.txt')
+            os_path = cm._get_os_path('a.txt')
+            # make sure the checkpoint and the file have distinct mtimes
+            os.utime(os_path, (time.time() + 10, time.time() + 10))
+            cm.get('')
+            restored_mtime = cm.get('a.txt', content=False)['last_modified']
+
+            # restoring a checkpoint overwrites the file in place,
+            # without changing the mtime of the directory
+            cm.restore_checkpoint(cp['id'], 'a.txt')
+            listed = cm.get('')['content'][0]
+            self.assertNotEqual(listed['last_modified'], restored_mtime)
+            self.assertEqual(
+                listed['last_modified'],
+                cm.get('a.txt', content=False)['last_modified'],
+            )
+
+            # deleting a directory forgets its own listing
+            cm.delete_to_trash = False
+            _make_dir(cm, 'sub')
+            cm.get('sub')
+            self.assertIn(cm._get_os_path('sub'), cm._dir_listing_cache)
+            cm.delete('sub')
+            self.assertNotIn(cm._get_os_path('sub'), cm._dir_listing_cache)
+
+    def test_recover_intermediate(self):
+        # notebooks left half-written by the atomic writes of older versions
+        with TemporaryDirectory() as td:
+            cm = FileContentsManager(root_dir=td)
+            nb = nbformat.new_notebook()
+            nb.cells.append(nbformat.new_code_cell(u"a = 1"))
+            os_path = cm._get_os_path(u'a.ipynb')
+            with open(os_path, 'w') as f:
+                f.write(nbformat.writes(nb)[:20])
+            with open(os.path.join(td, '.~a.ipynb'), 'w') as f:
+                f.write(nbformat.writes(nb))
+
+            model = cm.get(u'a.ipynb')
+            self.assertEqual(model['content'].cells[0].source, u"a = 1")
+            self.assertEqual(sorted(os.listdir(td)), ['a.ipynb', 'a.ipynb.invalid'])
+
+            with open(os_path, 'w') as f:
+                f.write(u'{')
+            with self.assertRaisesHTTPError(400):
+                cm.get(u'a.ipynb')
+
+    def test_notebook_cache(self):
+        with TemporaryDirectory() as td:
+            cm = FileContentsManager(root_dir=td, notebook_cache_size=10 ** 6)
+            nb = nbformat.new_notebook()
+            nb.cells.append(nbformat.new_code_cell(u"a = 1"))
+            cm.save({'type': 'notebook', 'content': nb}, u'a.ipynb')
+            cm.save({'type': 'notebook', 'content': nb}, u'b.ipynb')
+
+            first = cm.get(u'a.ipynb')['content']
+            second = cm.get(u'a.ipynb')['content']
+            stats = cm.notebook_cache_stats()
+            self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+            self.assertEqual(stats['notebooks'], 1)
+            self.assertEqual(stats['size'], os.stat(cm._get_os_path(u'a.ipynb')).st_size)
+            # callers get their own cells, sharing their sources and outputs
+            self.assertEqual(first, second)
+            self.assertIsNot(first.cells[0], second.cells[0])
+            self.assertIs(first.cells[0].outputs, second.cells[0].outputs)
+            first.cells[0].source = u'a = 2'
+            first.cells[0].metadata.trusted = False
+            cached = cm.get(u'a.ipynb')['content']
+            self.assertEqual(cached.cells[0].source, u'a = 1')
+            self.assertTrue(cached.cells[0].metadata.trusted)
+
+            # saving forgets the cached notebook
+            cm.save({'type': 'notebook', 'content': first}, u'a.ipynb')
+            self.assertEqual(cm.notebook_cache_stats()['notebooks'], 0)
+            self.assertEqual(cm.get(u'a.ipynb')['content'].cells[0].source, u'a = 2')
+
+            # files modified on disk are read again
+            os_path = cm._get_os_path(u'a.ipynb')
+            nb.cells[0].source = u'a = 3'
+            with open(os_path, 'w') as f:
+                f.write(nbformat.writes(nb))
+            self.assertEqual(cm.get(u'a.ipynb')['content'].cells[0].source, u'a = 3')
+
+            cm.rename(u'a.ipynb', u'c.ipynb')
+            self.assertEqual(cm.notebook_cache_stats()['notebooks'], 0)
+
+            # the least recently read notebooks are evicted first
+            cm.notebook_cache_size = max(
+                os.stat(cm._get_os_path(name)).st_size for name in (u'b.ipynb', u'c.ipynb'))
+            cm.get(u'b.ipynb')
+            cm.get(u'c.ipynb')
+            stats = cm.notebook_cache_stats()
+            self.assertEqual((stats['notebooks'], stats['evictions']), (1, 1))
+            self.assertEqual(list(cm._notebook_cache), [cm._get_os_path(u'c.ipynb')])
+
+    def test_patch_notebook(self):
+        with TemporaryDirectory() as td:
+            cm = FileContentsManager(root_dir=td)
+            nb = nbformat.new_notebook()
+            nb.cells.append(nbformat.new_code_cell(u"a = 1"))
+            cm.save({'type': 'notebook', 'content': nb}, u'a.ipynb')
+            revision = cm.get_revision(u'a.ipynb')
+
+            model = cm.patch_notebook(u'a.ipynb', [
+                {'op': 'replace', 'path': '/cells/0/source', 'value': u'a = 2'},
+            ], revision=revision)
+            self.assertEqual(model['type'], 'notebook')
+            self.assertNotEqual(cm.get_revision(u'a.ipynb'), revision)
+            with self.assertRaisesHTTPError(412):
+                cm.patch_notebook(u'a.ipynb', [], revision=revision)
+
+            # the patched notebook is kept, and not read again
+            reads = []
+            read_notebook = cm._read_notebook
+            def _read_notebook(*args, **kwargs):
+                reads.append(args)
+                return read_notebook(*args, **kwargs)
+            cm._read_notebook = _read_notebook
+            cm.patch_notebook(u'a.ipynb', [
+                {'op': 'add', 'path': '/cells/-', 'value': nbformat.new_markdown_cell(u'b')},
+            ], revision=cm.get_revision(u'a.ipynb'))
+            self.assertEqual(reads, [])
+
+            # a failed patch discards the kept notebook
+            with self.assertRaisesHTTPError(400):
+                cm.patch_notebook(u'a.ipynb', [
+                    {'op': 'add', 'path': '/metadata/x', 'value': 1},
+                    {'op': 'remove', 'path': '/cells/9'},
+                ])
+            cells = cm.get(u'a.ipynb')['content'].cells
+            self.assertEqual([c.source for c in cells], [u'a = 2', u'b'])
+            self.assertTrue(cells[0].metadata.trusted)
+            cm.patch_notebook(u'a.ipynb', [])
+            self.assertEqual(len(reads), 2)
+
     @dec.skipif(sys.platform == 'win32' and sys.version_info[0] < 3)
     def test_bad_symlink(self):
         with TemporaryDirectory() as td:
@@ -195,6 +404,106 @@ class TestFileContentsManager(TestCase):
                 }, path='../foo')
 
 
+class TestAsyncFileContentsManager(TestCase):
+
+    def setUp(self):
+        self._temp_dir = TemporaryDirectory()
+        self.td = self._temp_dir.name
+        self.contents_manager = AsyncFileContentsManager(root_dir=self.td)
+
+    def tearDown(self):
+        self.contents_manager.shutdown()
+        self._temp_dir.cleanup()
+
+    def run_sync(self, func, *args, **kwargs):
+        return IOLoop.current().run_sync(lambda: func(*args, **kwargs))
+
+    def test_save_get_rename_delete(self):
+        cm = self.contents_manager
+        nb = nbformat.new_notebook()
+        nb.cells.append(nbformat.new_code_cell(u"print('hi')"))
+        model = {'type': 'notebook', 'content': nb}
+
+        saved = self.run_sync(cm.save, model, u'a.ipynb')
+        self.assertEqual(saved['path'], u'a.ipynb')
+        self.assertIsNone(saved['content'])
+
+        model = self.run_sync(cm.get, u'a.ipynb')
+        self.assertEqual(model['type'], 'notebook')
+        self.assertEqual(model['content'].cells[0].source, u"print('hi')")
+        # a notebook saved by this server is trusted
+        self.assertTrue(model['content'].cells[0].metadata.trusted)
+
+        listing = self.run_sync(cm.get, u'')
+        self.assertEqual([m['name'] for m in listing['content']], [u'a.ipynb'])
+
+        copied = self.run_sync(cm.copy, u'a.ipynb')
+        self.assertEqual(copied['name'], u'a-Copy1.ipynb')
+        self.assertTrue(self.run_sync(cm.get, copied['path'])['content'].cells[0].metadata.trusted)
+        copied = self.run_sync(cm.copy, u'a-Copy1.ipynb', u'c.ipynb')
+        self.assertEqual(copied['name'], u'c.ipynb')
+        self.run_sync(cm.delete, u'a-Copy1.ipynb')
+        self.run_sync(cm.delete, u'c.ipynb')
+
+        self.run_sync(cm.rename, u'a.ipynb', u'b.ipynb')
+        self.assertFalse(cm.file_exists(u'a.ipynb'))
+        self.assertTrue(cm.file_exists(u'b.ipynb'))
+
+        self.run_sync(cm.delete, u'b.ipynb')
+        self.assertFalse(cm.file_exists(u'b.ipynb'))
+
+        with self.assertRaises(HTTPError) as e:
+            self.run_sync(cm.get, u'b.ipynb')
+        self.assertEqual(e.exception.status_code, 404)
+
+    def test_io_off_the_loop(self):
+        cm = self.contents_manager
+        loop_thread = threading.current_thread()
+        threads = []
+        def record(func):
+            def recorded(*args, **kwargs):
+                threads.append(threading.current_thread())
+                return func(*args, **kwargs)
+            return recorded
+        cm.exists = record(cm.exists)
+        cm.checkpoints.list_checkpoints = record(cm.checkpoints.list_checkpoints)
+
+        nb = nbformat.new_notebook()
+        self.run_sync(cm.save, {'type': 'notebook', 'content': nb}, u'a.ipynb')
+        self.run_sync(cm.get, u'a.ipynb')
+        self.run_sync(cm.copy, u'a.ipynb', u'b.ipynb')
+        self.run_sync(cm.patch_notebook, u'a.ipynb', [
+            {'op': 'add', 'path': '/metadata/x', 'value': 1}])
+        self.run_sync(cm.update, {'path': u'c.ipynb'}, u'b.ipynb')
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+
+    def test_checkpoints(self):
+        cm = self.contents_manager
+        self.run_sync(cm.save, {'type': 'file', 'format': 'text',
+                                'content': u'one'}, u'f.txt')
+        cp = self.run_sync(cm.create_checkpoint, u'f.txt')
+        self.run_sync(cm.save, {'type': 'file', 'format': 'text',
+                                'content': u'two'}, u'f.txt')
+        self.run_sync(cm.restore_checkpoint, cp['id'], u'f.txt')
+        model = self.run_sync(cm.get, u'f.txt')
+        self.assertEqual(model['content'], u'one')
+
+        # the first checkpoint of a notebook is created in the background,
+        # and listed as soon as the save returns
+        self.run_sync(cm.save, {'type': 'notebook', 'content': nbformat.new_notebook()},
+                      u'nb.ipynb')
+        self.assertEqual(len(self.run_sync(cm.list_checkpoints, u'nb.ipynb')), 1)
+        self.assertEqual(cm.checkpoint_queue_stats()['queued'], 0)
+
+        # files are copied without reading them into a model
+        cm._read_file = None
+        copied = self.run_sync(cm.copy, u'f.txt')
+        del cm._read_file
+        model = self.run_sync(cm.get, copied['path'])
+        self.assertEqual(model['content'], u'one')
+
+
 class TestContentsManager(TestCase):
     @contextmanager
     def assertRaisesHTTPError(self, status, msg=None):
@@ -495,6 +804,33 @@ class TestContentsManager(TestCase):
         self.assertEqual(model['name'], 'Untitled.ipynb')
         self.assertEqual(model['path'], 'foo/Untitled.ipynb')
 
+    def test_save_model(self):
+        cm = self.contents_manager
+        nb, name, path = self.new_notebook()
+        full_model = cm.get(path)
+        txt_model = {'type': 'file', 'format': 'text', 'content': u'text'}
+        cm.save(txt_model, u'a.txt')
+
+        validated = []
+        validate_notebook_model = cm.validate_notebook_model
+        def _validate_notebook_model(model):
+            validated.append(model)
+            return validate_notebook_model(model)
+        def _get(*args, **kwargs):
+            raise AssertionError("The model of a saved file is built from its stat")
+        cm.validate_notebook_model = _validate_notebook_model
+        cm.get = _get
+        try:
+            model = cm.save(full_model, path)
+            txt_saved = cm.save(txt_model, u'a.txt')
+        finally:
+            del cm.validate_notebook_model, cm.get
+
+        # notebooks are validated once per save
+        self.assertEqual(len(validated), 1)
+        self.assertEqual(model, cm.get(path, content=False))
+        self.assertEqual(txt_saved, cm.get(u'a.txt', content=False))
+
     def test_delete(self):
         cm = self.contents_manager
         # Create a notebook
@@ -585,6 +921,42 @@ class TestContentsManager(TestCase):
         self.assertEqual(copy2['name'], name)
         self.assertEqual(copy2['path'], name)
 
+    def test_copy_files(self):
+        cm = self.contents_manager
+        calls = []
+        cm.pre_save_hook = lambda model, path, **kwargs: calls.append(('pre', path))
+        cm.post_save_hook = lambda model, os_path, **kwargs: calls.append(
+            ('post', model['path']))
+        cm.save({'type': 'file', 'format': 'base64', 'content': u'AP8='}, u'data.bin')
+        del calls[:]
+
+        # files are copied without reading them into a model
+        cm._read_file = cm._save_file = None
+        copy = cm.copy(u'data.bin')
+        del cm._read_file, cm._save_file
+        self.assertEqual(copy['name'], u'data-Copy1.bin')
+        self.assertEqual(calls, [('pre', u'data-Copy1.bin'), ('post', u'data-Copy1.bin')])
+        with open(os.path.join(self.td, u'data-Copy1.bin'), 'rb') as f:
+            self.assertEqual(f.read(), b'\x00\xff')
+
+        # notebooks are copied through their model when a pre-save hook may change them
+        nb, name, path = self.new_notebook()
+        cm.pre_save_hook = lambda model, **kwargs: model['content'].cells.pop()
+        copy = cm.copy(path)
+        self.assertEqual(cm.get(copy['path'])['content'].cells, [])
+
+    def test_copy_trust(self):
+        cm = self.contents_manager
+        nb, name, path = self.new_notebook()
+        copy = cm.copy(path)
+        self.assertFalse(cm.notary.check_cells(cm.get(copy['path'])['content']))
+        # one checkpoint always exists for notebooks
+        self.assertEqual(len(cm.list_checkpoints(copy['path'])), 1)
+
+        cm.trust_notebook(path)
+        copy = cm.copy(path)
+        self.assertTrue(cm.notary.check_cells(cm.get(copy['path'])['content']))
+
     def test_trust_notebook(self):
         cm = self.contents_manager
         nb, name, path = self.new_notebook()
@@ -0,0 +1,71 @@
+# coding: utf-8
+"""Tests for applying JSON-patch deltas to notebooks"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import nose.tools as nt
+from tornado.web import HTTPError
+
+from nbformat.v4 import new_notebook, new_code_cell, new_markdown_cell
+
+from ..notebookpatch import apply_patch, parse_pointer, validate_patched
+
+
+def _nb():
+    nb = new_notebook()
+    nb.cells = [new_code_cell(u'a = 1'), new_markdown_cell(u'# Title')]
+    return nb
+
+
+def _assert_status(status, func, *args):
+    with nt.assert_raises(HTTPError) as cm:
+        func(*args)
+    nt.assert_equal(cm.exception.status_code, status)
+
+
+def test_parse_pointer():
+    nt.assert_equal(parse_pointer('/cells/0/source'), ['cells', '0', 'source'])
+    nt.assert_equal(parse_pointer('/metadata/a~1b~0c'), ['metadata', 'a/b~c'])
+    _assert_status(400, parse_pointer, 'cells/0')
+    _assert_status(400, parse_pointer, '/nbformat')
+
+
+def test_apply_patch():
+    nb = _nb()
+    touched, metadata_touched = apply_patch(nb, [
+        {'op': 'replace', 'path': '/cells/0/source', 'value': u'a = 2'},
+        {'op': 'add', 'path': '/cells/1', 'value': new_markdown_cell(u'ü')},
+        {'op': 'remove', 'path': '/cells/2'},
+    ])
+    nt.assert_equal([c.source for c in nb.cells], [u'a = 2', u'ü'])
+    nt.assert_equal(len(touched), 2)
+    nt.assert_false(metadata_touched)
+    nt.assert_is_none(validate_patched(nb, touched, metadata_touched))
+
+    touched, metadata_touched = apply_patch(nb, [
+        {'op': 'add', 'path': '/metadata/kernelspec', 'value': {'name': 'python3'}},
+    ])
+    nt.assert_equal(touched, [])
+    nt.assert_true(metadata_touched)
+    # kernelspec requires a display_name
+    nt.assert_in('validation failed', validate_patched(nb, touched, metadata_touched))
+
+
+def test_apply_patch_errors():
+    nb = _nb()
+    _assert_status(400, apply_patch, nb, {'op': 'remove', 'path': '/cells/0'})
+    _assert_status(400, apply_patch, nb, [{'op': 'move', 'path': '/cells/0'}])
+    _assert_status(400, apply_patch, nb, [{'op': 'remove', 'path': '/cells'}])
+    _assert_status(400, apply_patch, nb, [{'op': 'remove', 'path': '/cells/5'}])
+    _assert_status(400, apply_patch, nb, [{'op': 'replace', 'path': '/cells', 'value': {}}])
+    _assert_status(400, apply_patch, nb, [{'op': 'add', 'path': '/cells/0/x/y', 'value': 1}])
+    _assert_status(409, apply_patch, nb, [{'op': 'test', 'path': '/cells/0/source', 'value': u'b'}])
+
+
+def test_validate_patched_cell():
+    nb = _nb()
+    touched, metadata_touched = apply_patch(nb, [
+        {'op': 'add', 'path': '/cells/0/bad', 'value': 1},
+    ])
+    nt.assert_in('validation failed', validate_patched(nb, touched, metadata_touched))
@@ -0,0 +1,60 @@
+"""
+A priority queue of kernels by deadline, to act on each when it expires.
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import heapq
+
+
+class DeadlineQueue(object):
+    """A queue of keys, e.g. kernel ids, by deadline, earliest first
+
+    Each key has at most one deadline: pushing it again replaces it.
+    Replaced and removed deadlines are left in the heap,
+    and skipped when they reach the top.
+    """
+
+    def __init__(self):
+        # (deadline, key), including replaced ones
+        self._heap = []
+        # key: its current deadline
+        self._deadlines = {}
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def push(self, key, deadline):
+        """Set the deadline of a key"""
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+
+    def remove(self, key):
+        """Remove a key, if it is queued"""
+        self._deadlines.pop(key, None)
+
+    def peek(self):
+        """The earliest (deadline, key), or None if the queue is empty"""
+        heap = self._heap
+        while heap:
+            deadline, key = heap[0]
+            if self._deadlines.get(key) == deadline:
+                return deadline, key
+            heapq.heappop(heap)
+        return None
+
+    def pop(self):
+        """Remove and return the earliest (deadline, key)
+
+        Raises IndexError if the queue is empty.
+        """
+        entry = self.peek()
+        if entry is None:
+            raise IndexError("pop from an empty DeadlineQueue")
+        heapq.heappop(self._heap)
+        del self._deadlines[entry[1]]
+        return entry
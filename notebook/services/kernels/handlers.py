@@ -19,9 +19,15 @@ from ipython_genutils.py3compat import cast_unicode
 from notebook.utils import url_path_join, url_escape
 
 from ...base.handlers import APIHandler
-from ...base.zmqhandlers import AuthenticatedZMQStreamHandler, deserialize_binary_message
+from ...base.zmqhandlers import (
+    AuthenticatedZMQStreamHandler, KERNEL_WS_PROTOCOL_V1, RawMessage,
+    deserialize_binary_message, deserialize_msg_from_ws_v1,
+)
+from .ratelimiter import IOPubRateLimiter
+from .replaybuffer import ReplayBuffer
 
 from jupyter_client import protocol_version as client_protocol_version
+from jupyter_client.session import DELIM
 
 class MainKernelHandler(APIHandler):
 
@@ -52,6 +58,16 @@ class MainKernelHandler(APIHandler):
         self.finish(json.dumps(model, default=date_default))
 
 
+class KernelResourcesHandler(APIHandler):
+
+    @web.authenticated
+    def get(self):
+        km = self.kernel_manager
+        if not hasattr(km, 'resource_stats'):
+            raise web.HTTPError(404, u'Kernel resources are not available')
+        self.finish(json.dumps(km.resource_stats()))
+
+
 class KernelHandler(APIHandler):
 
     @web.authenticated
@@ -118,16 +134,22 @@ class ZMQChannelsHandler(AuthenticatedZMQStreamHandler):
     def rate_limit_window(self):
         return self.settings.get('rate_limit_window', 1.0)
 
+    @property
+    def iopub_coalesce_window(self):
+        return self.settings.get('iopub_coalesce_window', 0)
+
     def __repr__(self):
         return "%s(%s)" % (self.__class__.__name__, getattr(self, 'kernel_id', 'uninitialized'))
 
     def create_stream(self):
         km = self.kernel_manager
         identity = self.session.bsession
-        for channel in ('shell', 'iopub', 'stdin'):
+        for channel in ('shell', 'stdin'):
             meth = getattr(km, 'connect_' + channel)
             self.channels[channel] = stream = meth(self.kernel_id, identity=identity)
             stream.channel = channel
+        # IOPub messages are received once for all the connections to a kernel
+        self.channels['iopub'] = km.subscribe_iopub(self.kernel_id)
     
     def request_kernel_info(self):
         """send a request for kernel_info"""
@@ -201,14 +223,17 @@ class ZMQChannelsHandler(AuthenticatedZMQStreamHandler):
         self.session_key = ''
 
         # Rate limiting code
-        self._iopub_window_msg_count = 0
-        self._iopub_window_byte_count = 0
+        # whether the client was told that the limits are exceeded
         self._iopub_msgs_exceeded = False
         self._iopub_data_exceeded = False
-        # Queue of (time stamp, byte count)
-        # Allows you to specify that the byte count should be lowered
-        # by a delta amount at some point in the future.
-        self._iopub_window_byte_queue = []
+
+        # Coalescing of high-rate output
+        # messages held until the end of the coalescing window
+        self._iopub_batch = None
+        self._iopub_flush_timeout = None
+        self._iopub_flushing = False
+        # the time the last message was sent, or the last batch flushed
+        self._iopub_last_sent = 0
 
     @gen.coroutine
     def pre_get(self):
@@ -270,6 +295,7 @@ class ZMQChannelsHandler(AuthenticatedZMQStreamHandler):
                 for channel, msg_list in replay_buffer:
                     stream = self.channels[channel]
                     self._on_zmq_reply(stream, msg_list)
+            replay_buffer.close()
         else:
             try:
                 self.create_stream()
@@ -294,6 +320,9 @@ class ZMQChannelsHandler(AuthenticatedZMQStreamHandler):
             # already closed, ignore the message
             self.log.debug("Received message on closed websocket %r", msg)
             return
+        if self.subprotocol == KERNEL_WS_PROTOCOL_V1:
+            self._on_v1_message(msg)
+            return
         if isinstance(msg, bytes):
             msg = deserialize_binary_message(msg)
         else:
@@ -308,86 +337,80 @@ class ZMQChannelsHandler(AuthenticatedZMQStreamHandler):
         stream = self.channels[channel]
         self.session.send(stream, msg)
 
+    def _on_v1_message(self, ws_msg):
+        """Send a message of the v1 kernel websocket protocol to the kernel
+
+        Its parts are forwarded as they are, only signed,
+        unless the session adapts messages to the kernel's protocol version.
+        """
+        channel, msg_list = deserialize_msg_from_ws_v1(ws_msg)
+        if channel not in self.channels:
+            self.log.warning("No such channel: %r", channel)
+            return
+        stream = self.channels[channel]
+        parts = [part.tobytes() for part in msg_list[:4]]
+        buffers = msg_list[4:]
+        if self.session.adapt_version:
+            msg = dict(zip(RawMessage._parts,
+                [self.session.unpack(part) for part in parts]))
+            msg['buffers'] = buffers
+            self.session.send(stream, msg)
+        else:
+            stream.send_multipart([DELIM, self.session.sign(parts)] + parts + buffers)
+
     def _on_zmq_reply(self, stream, msg_list):
-        idents, fed_msg_list = self.session.feed_identities(msg_list)
-        msg = self.session.deserialize(fed_msg_list)
-        parent = msg['parent_header']
+        # only the header is parsed, unless needed.
+        # IOPub messages are already deserialized by the IOPubHub of the kernel.
+        if isinstance(msg_list, list):
+            msg = self._deserialize_reply(msg_list)
+        else:
+            msg = msg_list
         def write_stderr(error_message):
             self.log.warning(error_message)
-            msg = self.session.msg("stream",
+            stderr_msg = self.session.msg("stream",
                 content={"text": error_message + '\n', "name": "stderr"},
-                parent=parent
+                parent=msg['parent_header']
             )
-            msg['channel'] = 'iopub'
-            self.write_message(json.dumps(msg, default=date_default))
+            self._write_msg(stderr_msg, channel='iopub')
         channel = getattr(stream, 'channel', None)
         msg_type = msg['header']['msg_type']
 
         if channel == 'iopub' and msg_type == 'status' and msg['content'].get('execution_state') == 'idle':
-            # reset rate limit counter on status=idle,
+            # the rate limiter of the kernel resets on status=idle,
             # to avoid 'Run All' hitting limits prematurely.
-            self._iopub_window_byte_queue = []
-            self._iopub_window_msg_count = 0
-            self._iopub_window_byte_count = 0
             self._iopub_msgs_exceeded = False
             self._iopub_data_exceeded = False
 
-        if channel == 'iopub' and msg_type not in {'status', 'comm_open', 'execute_input'}:
-            
-            # Remove the counts queued for removal.
-            now = IOLoop.current().time()
-            while len(self._iopub_window_byte_queue) > 0:
-                queued = self._iopub_window_byte_queue[0]
-                if (now >= queued[0]):
-                    self._iopub_window_byte_count -= queued[1]
-                    self._iopub_window_msg_count -= 1
-                    del self._iopub_window_byte_queue[0]
-                else:
-                    # This part of the queue hasn't be reached yet, so we can
-                    # abort the loop.
-                    break
-
-            # Increment the bytes and message count
-            self._iopub_window_msg_count += 1
-            if msg_type == 'stream':
-                byte_count = sum([len(x) for x in msg_list])
-            else:
-                byte_count = 0
-            self._iopub_window_byte_count += byte_count
-            
-            # Queue a removal of the byte and message count for a time in the 
-            # future, when we are no longer interested in it.
-            self._iopub_window_byte_queue.append((now + self.rate_limit_window, byte_count))
-            
-            # Check the limits, set the limit flags, and reset the
-            # message and data counts.
-            msg_rate = float(self._iopub_window_msg_count) / self.rate_limit_window
-            data_rate = float(self._iopub_window_byte_count) / self.rate_limit_window
-            
-            # Check the msg rate
-            if self.iopub_msg_rate_limit > 0 and msg_rate > self.iopub_msg_rate_limit:
-                if not self._iopub_msgs_exceeded:
-                    self._iopub_msgs_exceeded = True
-                    write_stderr(dedent("""\
-                    IOPub message rate exceeded.
-                    The notebook server will temporarily stop sending output
-                    to the client in order to avoid crashing it.
-                    To change this limit, set the config variable
-                    `--NotebookApp.iopub_msg_rate_limit`.
+        # The rates of the kernel are recorded once for all its connections,
+        # by its IOPubHub. Coalesced messages were checked when held.
+        if (channel == 'iopub' and not self._iopub_flushing
+                and msg_type not in IOPubRateLimiter.unlimited_msg_types):
+            limiter = self.kernel_manager.iopub_rate_limiter(self.kernel_id)
+
+            # Check the msg rate, of the messages not coalesced
+            if limiter.counts_messages(msg_type):
+                if limiter.msgs_exceeded:
+                    if not self._iopub_msgs_exceeded:
+                        self._iopub_msgs_exceeded = True
+                        write_stderr(dedent("""\
+                        IOPub message rate exceeded.
+                        The notebook server will temporarily stop sending output
+                        to the client in order to avoid crashing it.
+                        To change this limit, set the config variable
+                        `--NotebookApp.iopub_msg_rate_limit`.
                     
-                    Current values:
-                    NotebookApp.iopub_msg_rate_limit={} (msgs/sec)
-                    NotebookApp.rate_limit_window={} (secs)
-                    """.format(self.iopub_msg_rate_limit, self.rate_limit_window)))
-            else:
-                # resume once we've got some headroom below the limit
-                if self._iopub_msgs_exceeded and msg_rate < (0.8 * self.iopub_msg_rate_limit):
+                        Current values:
+                        NotebookApp.iopub_msg_rate_limit={} (msgs/sec)
+                        NotebookApp.rate_limit_window={} (secs)
+                        """.format(self.iopub_msg_rate_limit, self.rate_limit_window)))
+                elif self._iopub_msgs_exceeded:
+                    # resumed once we've got some headroom below the limit
                     self._iopub_msgs_exceeded = False
                     if not self._iopub_data_exceeded:
                         self.log.warning("iopub messages resumed")
 
             # Check the data rate
-            if self.iopub_data_rate_limit > 0 and data_rate > self.iopub_data_rate_limit:
+            if limiter.data_exceeded:
                 if not self._iopub_data_exceeded:
                     self._iopub_data_exceeded = True
                     write_stderr(dedent("""\
@@ -401,28 +424,81 @@ class ZMQChannelsHandler(AuthenticatedZMQStreamHandler):
                     NotebookApp.iopub_data_rate_limit={} (bytes/sec)
                     NotebookApp.rate_limit_window={} (secs)
                     """.format(self.iopub_data_rate_limit, self.rate_limit_window)))
-            else:
-                # resume once we've got some headroom below the limit
-                if self._iopub_data_exceeded and data_rate < (0.8 * self.iopub_data_rate_limit):
-                    self._iopub_data_exceeded = False
-                    if not self._iopub_msgs_exceeded:
-                        self.log.warning("iopub messages resumed")
-        
+            elif self._iopub_data_exceeded:
+                self._iopub_data_exceeded = False
+                if not self._iopub_msgs_exceeded:
+                    self.log.warning("iopub messages resumed")
+
             # If either of the limit flags are set, do not send the message.
-            if self._iopub_msgs_exceeded or self._iopub_data_exceeded:
-                # we didn't send it, remove the current message from the calculus
-                self._iopub_window_msg_count -= 1
-                self._iopub_window_byte_count -= byte_count
-                self._iopub_window_byte_queue.pop(-1)
+            if self._iopub_data_exceeded or (
+                    self._iopub_msgs_exceeded and limiter.counts_messages(msg_type)):
                 return
+
+        if channel == 'iopub' and self._coalesce_iopub(msg):
+            return
         super(ZMQChannelsHandler, self)._on_zmq_reply(stream, msg)
 
+    def _coalesce_iopub(self, msg):
+        """Hold IOPub output arriving at a high rate, to coalesce it
+
+        stream and update_display_data messages arriving less than
+        iopub_coalesce_window after the previous one are held
+        until the end of the window, then sent coalesced:
+        consecutive stream messages are merged into one,
+        and only the latest update of each display is sent.
+        Other messages flush the held ones first, to keep their order.
+
+        Returns whether the message is held.
+        """
+        window = self.iopub_coalesce_window
+        if window <= 0 or self._iopub_flushing:
+            return False
+        if msg['msg_type'] not in IOPubRateLimiter.coalescible_msg_types:
+            self._flush_iopub()
+            return False
+        loop = IOLoop.current()
+        if self._iopub_batch is None:
+            now = loop.time()
+            if now >= self._iopub_last_sent + window:
+                # not a high rate, send it right away
+                self._iopub_last_sent = now
+                return False
+            self._iopub_batch = ReplayBuffer()
+            self._iopub_flush_timeout = loop.call_at(
+                self._iopub_last_sent + window, self._flush_iopub)
+        self._iopub_batch.append('iopub', msg)
+        return True
+
+    def _flush_iopub(self):
+        """Send the IOPub messages held for coalescing"""
+        batch = self._iopub_batch
+        if batch is None:
+            return
+        self._iopub_batch = None
+        IOLoop.current().remove_timeout(self._iopub_flush_timeout)
+        self._iopub_flush_timeout = None
+        self._iopub_last_sent = IOLoop.current().time()
+        stream = self.channels.get('iopub')
+        if stream is None:
+            return
+        self._iopub_flushing = True
+        try:
+            for channel, msg in batch:
+                self._on_zmq_reply(stream, msg)
+        finally:
+            self._iopub_flushing = False
+
     def close(self):
         super(ZMQChannelsHandler, self).close()
         return self._close_future
 
     def on_close(self):
         self.log.debug("Websocket closed %s", self.session_key)
+        if self._iopub_batch is not None:
+            # nowhere to send them anymore
+            IOLoop.current().remove_timeout(self._iopub_flush_timeout)
+            self.log.debug("Discarding %s coalesced messages", len(self._iopub_batch))
+            self._iopub_batch = None
         # unregister myself as an open session (only if it's really me)
         if self._open_sessions.get(self.session_key) is self:
             self._open_sessions.pop(self.session_key)
@@ -458,8 +534,12 @@ class ZMQChannelsHandler(AuthenticatedZMQStreamHandler):
         msg = self.session.msg("status",
             {'execution_state': status}
         )
-        msg['channel'] = 'iopub'
-        self.write_message(json.dumps(msg, default=date_default))
+        self._write_msg(msg, channel='iopub')
+
+    def _write_msg(self, msg, channel):
+        """Send a message created by the server to the websocket"""
+        payload = self._reserialize_reply(msg, channel=channel)
+        self.write_message(payload, binary=isinstance(payload, bytes))
 
     def on_kernel_restarted(self):
         logging.warn("kernel %s restarted", self.kernel_id)
@@ -480,6 +560,7 @@ _kernel_action_regex = r"(?P<action>restart|interrupt)"
 
 default_handlers = [
     (r"/api/kernels", MainKernelHandler),
+    (r"/api/kernels/resources", KernelResourcesHandler),
     (r"/api/kernels/%s" % _kernel_id_regex, KernelHandler),
     (r"/api/kernels/%s/%s" % (_kernel_id_regex, _kernel_action_regex), KernelActionHandler),
     (r"/api/kernels/%s/channels" % _kernel_id_regex, ZMQChannelsHandler),
@@ -0,0 +1,134 @@
+"""
+Receive the IOPub messages of a kernel once, for all its subscribers.
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from notebook.base.zmqhandlers import deserialize_header
+
+
+class IOPubSubscription(object):
+    """A subscription to the IOPub messages of a kernel
+
+    Stands in for the IOPub ZMQStream of a websocket handler:
+    the messages are passed to the callbacks already deserialized,
+    as RawMessages, or message dicts if they couldn't be passed raw.
+    """
+
+    channel = 'iopub'
+
+    def __init__(self, hub):
+        self._hub = hub
+        self._callback = None
+
+    def on_recv(self, callback):
+        """Register a callback, called with each message"""
+        self._callback = callback
+
+    def on_recv_stream(self, callback):
+        """Register a callback, called with the subscription and each message"""
+        if callback is None:
+            self._callback = None
+        else:
+            self._callback = lambda msg: callback(self, msg)
+
+    def _deliver(self, msg):
+        if self._callback is not None:
+            self._callback(msg)
+
+    def closed(self):
+        return self._hub is None or self._hub.closed()
+
+    def close(self):
+        if self._hub is not None:
+            self._hub.unsubscribe(self)
+        self._hub = None
+        self._callback = None
+
+
+class IOPubHub(object):
+    """Multicast the IOPub messages of a kernel to its subscribers
+
+    Each message is received by a single IOPub socket,
+    and deserialized once, with only its header parsed when possible,
+    so that it is serialized for the websockets only once as well.
+
+    Parameters
+    ----------
+    connect : callable
+      Returns a new IOPub stream connected to the kernel.
+    session : Session
+      The session used to check and deserialize messages.
+    log : Logger
+    rate_limiter : IOPubRateLimiter, optional
+      Records each message, before it is passed to the subscribers.
+    """
+
+    def __init__(self, connect, session, log, rate_limiter=None):
+        self._connect = connect
+        self.session = session
+        self.log = log
+        self.rate_limiter = rate_limiter
+        self._subscriptions = []
+        # the number of messages received
+        self.received = 0
+        self.stream = connect()
+        self.stream.on_recv(self._on_recv)
+
+    def reconnect(self):
+        """Replace the IOPub stream with a new connection to the kernel"""
+        if self.stream.closed():
+            return
+        stream = self._connect()
+        self.stream.on_recv(None)
+        self.stream.close()
+        self.stream = stream
+        self.stream.on_recv(self._on_recv)
+
+    def subscribe(self):
+        """Subscribe to the messages of the kernel
+
+        Returns an IOPubSubscription, to close to unsubscribe.
+        """
+        subscription = IOPubSubscription(self)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+
+    def closed(self):
+        return self.stream.closed()
+
+    def close(self):
+        """Close the IOPub stream, and all the subscriptions"""
+        if not self.stream.closed():
+            self.stream.on_recv(None)
+            self.stream.close()
+        for subscription in list(self._subscriptions):
+            subscription.close()
+
+    def _deserialize(self, msg_list):
+        idents, msg_list = self.session.feed_identities(msg_list)
+        msg = deserialize_header(self.session, msg_list)
+        if msg is None:
+            msg = self.session.deserialize(msg_list)
+        return msg
+
+    def _on_recv(self, msg_list):
+        self.received += 1
+        try:
+            msg = self._deserialize(msg_list)
+        except Exception:
+            self.log.critical("Malformed message: %r" % msg_list, exc_info=True)
+            return
+        if self.rate_limiter is not None:
+            self.rate_limiter.record(msg)
+        for subscription in list(self._subscriptions):
+            try:
+                subscription._deliver(msg)
+            except Exception:
+                self.log.error("Error handling IOPub message %s", msg['msg_type'],
+                    exc_info=True)
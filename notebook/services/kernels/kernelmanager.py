@@ -11,6 +11,7 @@ from collections import defaultdict
 from datetime import datetime, timedelta
 from functools import partial
 import os
+import uuid
 
 from tornado import gen, web
 from tornado.concurrent import Future
@@ -18,13 +19,21 @@ from tornado.ioloop import IOLoop, PeriodicCallback
 
 from jupyter_client.session import Session
 from jupyter_client.multikernelmanager import MultiKernelManager
-from traitlets import (Any, Bool, Dict, List, Unicode, TraitError, Integer,
+from traitlets import (Any, Bool, Dict, Float, List, Unicode, TraitError, Integer,
        Instance, default, validate
 )
 
 from notebook.utils import to_os_path, exists
 from notebook._tz import utcnow, isoformat
-from ipython_genutils.py3compat import getcwd
+from ipython_genutils.py3compat import getcwd, unicode_type
+
+from .iopubhub import IOPubHub
+from .deadlines import DeadlineQueue
+from .kernelpool import KernelPool
+from .operations import KernelOperationQueue
+from .ratelimiter import IOPubRateLimiter
+from .replaybuffer import ReplayBuffer
+from .resources import ResourceSampler, host_memory, process_rss
 
 
 class MappingKernelManager(MultiKernelManager):
@@ -40,10 +49,23 @@ class MappingKernelManager(MultiKernelManager):
     
     _kernel_connections = Dict()
 
-    _culler_callback = None
+    _memory_culler_callback = None
 
     _initialized_culler = False
 
+    # the timeout of the culler, and its deadline
+    _cull_timeout = None
+    _cull_deadline = None
+
+    _cull_queue = Instance(DeadlineQueue, ())
+
+    _sampler_callback = None
+
+    _resource_sampler = Instance(ResourceSampler, ())
+
+    # called with the id of each kernel removed, e.g. to drop its sessions
+    _removal_callbacks = List()
+
     @default('root_dir')
     def _default_root_dir(self):
         try:
@@ -70,7 +92,11 @@ class MappingKernelManager(MultiKernelManager):
 
     cull_interval_default = 300 # 5 minutes
     cull_interval = Integer(cull_interval_default, config=True,
-        help="""The interval (in seconds) on which to check for idle kernels exceeding the cull timeout value."""
+        help="""The interval (in seconds) on which to check again kernels which were busy,
+        or connected, when they exceeded the cull timeout value.
+
+        Idle kernels are culled as soon as they exceed the cull timeout value.
+        """
     )
 
     cull_connected = Bool(False, config=True,
@@ -83,6 +109,28 @@ class MappingKernelManager(MultiKernelManager):
         Only effective if cull_idle_timeout > 0."""
     )
 
+    cull_memory_threshold = Float(0, config=True,
+        help="""The fraction of the memory of the host in use, e.g. 0.9,
+        beyond which idle kernels are culled, least recently active first,
+        until enough of their memory is freed.
+        Kernels which are busy or connected are culled only if cull_busy
+        or cull_connected are set. 0 (default) disables it.
+        Only effective where /proc is available.
+        """
+    )
+
+    cull_memory_interval = Integer(10, config=True,
+        help="""The interval (in seconds) on which to check the memory of the host,
+        if cull_memory_threshold is set."""
+    )
+
+    resource_sample_interval = Float(5, config=True,
+        help="""The interval (in seconds) on which to sample the CPU, memory,
+        threads and open files of the kernels, reported by the kernels API.
+        0 disables it. Only effective where /proc is available.
+        """
+    )
+
     buffer_offline_messages = Bool(True, config=True,
         help="""Whether messages from kernels whose frontends have disconnected should be buffered in-memory.
 
@@ -94,10 +142,91 @@ class MappingKernelManager(MultiKernelManager):
         """
     )
 
+    buffer_max_messages = Integer(10000, config=True,
+        help="""The maximum number of messages buffered in memory for a kernel
+        whose frontends have disconnected. 0 means unlimited.
+
+        Beyond that, the oldest messages are spilled to disk,
+        if buffer_spill_bytes is set, or dropped.
+        """
+    )
+
+    buffer_max_bytes = Integer(64 * 1024 * 1024, config=True,
+        help="""The maximum size, in bytes, of the messages buffered in memory
+        for a kernel whose frontends have disconnected. 0 means unlimited.
+
+        Beyond that, the oldest messages are spilled to disk,
+        if buffer_spill_bytes is set, or dropped.
+        """
+    )
+
+    buffer_spill_bytes = Integer(0, config=True,
+        help="""The size, in bytes, of the memory-mapped file to which messages
+        are spilled when the buffer of a kernel exceeds its limits in memory.
+        The oldest messages are dropped when it is full.
+        0 (default) disables spilling to disk.
+        """
+    )
+
+    buffer_spill_dir = Unicode(config=True,
+        help="""The directory of the files of spilled messages.
+        Defaults to the temporary directory."""
+    )
+
+    kernel_pool = Dict(config=True,
+        help="""The number of idle kernels to keep started, by kernel spec name,
+        e.g. {'python3': 2}, for new sessions to claim without waiting.
+
+        Only the kernels of Python kernel specs are pooled, since their working
+        directory is set, when they are claimed, by executing code.
+        """
+    )
+
+    kernel_pool_max_memory = Integer(0, config=True,
+        help="""The resident memory, in bytes, of all the idle kernels of the pool
+        beyond which no more are started. 0 means unlimited.
+        """
+    )
+
+    kernel_pool_ready_timeout = Integer(60, config=True,
+        help="""The time, in seconds, to wait for a kernel started for the pool to be ready."""
+    )
+
+    _kernel_pool = Instance(KernelPool)
+    @default('_kernel_pool')
+    def _default_kernel_pool(self):
+        return KernelPool(self.kernel_pool, max_memory=self.kernel_pool_max_memory)
+
+    kernel_operations_limit = Integer(16, config=True,
+        help="""The number of kernels started, shut down or restarted at a time.
+        Others wait for their turn. 0 means unlimited.
+
+        Kernels are given KernelManager.shutdown_wait_time seconds to shut down
+        before they are killed, while other requests are served.
+        """
+    )
+
+    _kernel_operations = Instance(KernelOperationQueue)
+    @default('_kernel_operations')
+    def _default_kernel_operations(self):
+        return KernelOperationQueue(self.kernel_operations_limit)
+
+    # kernel_id: Future of the shutdown of the kernels shutting down
+    _shutting_down = Dict()
+
+    # kernel id: resident memory of the kernels culled due to memory pressure,
+    # until they are shut down
+    _memory_culled = Dict()
+
     _kernel_buffers = Any()
     @default('_kernel_buffers')
     def _default_kernel_buffers(self):
-        return defaultdict(lambda: {'buffer': [], 'session_key': '', 'channels': {}})
+        return defaultdict(lambda: {'buffer': ReplayBuffer(), 'session_key': '', 'channels': {}})
+
+    _buffer_stats = Dict()
+    @default('_buffer_stats')
+    def _default_buffer_stats(self):
+        return {'replayed': 0, 'discarded': 0, 'collapsed': 0, 'dropped': 0}
 
     last_kernel_activity = Instance(datetime,
         help="The last activity on any kernel, including shutting down a kernel")
@@ -113,8 +242,33 @@ class MappingKernelManager(MultiKernelManager):
     def _handle_kernel_died(self, kernel_id):
         """notice that a kernel died"""
         self.log.warning("Kernel %s died, removing from map.", kernel_id)
+        self._kernel_pool.discard(kernel_id)
+        self._cull_queue.remove(kernel_id)
         self.remove_kernel(kernel_id)
 
+    def add_removal_callback(self, callback):
+        """Register a callback to be called with the id of each kernel removed,
+        whether it was shut down or died.
+        """
+        self._removal_callbacks.append(callback)
+
+    def remove_removal_callback(self, callback):
+        """Unregister a callback registered with add_removal_callback"""
+        try:
+            self._removal_callbacks.remove(callback)
+        except ValueError:
+            pass
+
+    def remove_kernel(self, kernel_id):
+        """Remove a kernel from the mapping, and notify the removal callbacks"""
+        km = super(MappingKernelManager, self).remove_kernel(kernel_id)
+        for callback in list(self._removal_callbacks):
+            try:
+                callback(kernel_id)
+            except Exception:
+                self.log.error("Kernel removal callback %r failed", callback, exc_info=True)
+        return km
+
     def cwd_for_path(self, path):
         """Turn API path into absolute OS path."""
         os_path = to_os_path(path, self.root_dir)
@@ -141,11 +295,16 @@ class MappingKernelManager(MultiKernelManager):
             The name identifying which kernel spec to launch. This is ignored if
             an existing kernel is returned, but it may be checked in the future.
         """
+        if kernel_id is not None:
+            self._check_kernel_id(kernel_id)
+            self.log.info("Using existing kernel: %s" % kernel_id)
+        else:
+            kernel_id = yield self._claim_pooled_kernel(path, kwargs)
         if kernel_id is None:
             if path is not None:
                 kwargs['cwd'] = self.cwd_for_path(path)
-            kernel_id = yield gen.maybe_future(
-                super(MappingKernelManager, self).start_kernel(**kwargs)
+            kernel_id = yield self._kernel_operations.run('start',
+                super(MappingKernelManager, self).start_kernel, **kwargs
             )
             self._kernel_connections[kernel_id] = 0
             self.start_watching_activity(kernel_id)
@@ -156,17 +315,153 @@ class MappingKernelManager(MultiKernelManager):
                 lambda : self._handle_kernel_died(kernel_id),
                 'dead',
             )
-        else:
-            self._check_kernel_id(kernel_id)
-            self.log.info("Using existing kernel: %s" % kernel_id)
 
         # Initialize culling if not already
         if not self._initialized_culler:
             self.initialize_culler()
 
+        if self._sampler_callback is None:
+            self.initialize_resource_sampler()
+
+        if self._kernel_pool.sizes:
+            # replenish the pool in the background
+            IOLoop.current().spawn_callback(self.fill_kernel_pool)
+
         # py2-compat
         raise gen.Return(kernel_id)
 
+    @gen.coroutine
+    def _claim_pooled_kernel(self, path, kwargs):
+        """Claim an idle kernel from the pool, for start_kernel
+
+        Its working directory is changed to the session's.
+        Kernels started with other arguments than their kernel spec name
+        are never taken from the pool.
+
+        Returns the id of the kernel, or None.
+        """
+        if set(kwargs) - {'kernel_name'}:
+            raise gen.Return(None)
+        kernel_name = kwargs.get('kernel_name') or self.default_kernel_name
+        kernel_id = self._kernel_pool.claim(kernel_name)
+        if kernel_id is None:
+            raise gen.Return(None)
+        kernel = self._kernels[kernel_id]
+        cwd = self.cwd_for_path(path) if path is not None else getcwd()
+        # restarts launch the kernel in the session's directory
+        kernel._launch_args['cwd'] = cwd
+        self._kernel_connections[kernel_id] = 0
+        self.start_watching_activity(kernel_id)
+        self.log.info("Kernel claimed from the pool: %s" % kernel_id)
+        try:
+            yield self._execute_silently(kernel_id,
+                "__import__('os').chdir(%r)" % cwd,
+            )
+        except gen.TimeoutError:
+            self.log.warning("Timeout setting the working directory of kernel %s", kernel_id)
+        else:
+            kernel.execution_state = 'idle'
+        raise gen.Return(kernel_id)
+
+    @gen.coroutine
+    def fill_kernel_pool(self):
+        """Start the idle kernels missing from the pool
+
+        The kernels of each kernel spec are started one at a time.
+        """
+        pool = self._kernel_pool
+        yield [self._fill_kernel_pool(kernel_name) for kernel_name in pool.sizes
+            if pool.needed(kernel_name) > 0]
+
+    @gen.coroutine
+    def _fill_kernel_pool(self, kernel_name):
+        pool = self._kernel_pool
+        if pool.starting(kernel_name):
+            # already filling
+            return
+        try:
+            language = self.kernel_spec_manager.get_kernel_spec(kernel_name).language
+        except Exception:
+            self.log.error("Not pooling kernels of %s", kernel_name, exc_info=True)
+            pool.sizes.pop(kernel_name, None)
+            return
+        if language.lower() != 'python':
+            self.log.warning("Not pooling kernels of %s: %s kernels are not supported",
+                kernel_name, language)
+            pool.sizes.pop(kernel_name, None)
+            return
+        while pool.needed(kernel_name) > 0:
+            kernel_id = unicode_type(uuid.uuid4())
+            pool.record_start(kernel_name, kernel_id)
+            try:
+                yield self._kernel_operations.run('start',
+                    super(MappingKernelManager, self).start_kernel,
+                    kernel_id=kernel_id, kernel_name=kernel_name, cwd=self.root_dir,
+                )
+            except Exception:
+                pool.failed(kernel_name, kernel_id)
+                self.log.error("Failed to start a kernel for the pool of %s",
+                    kernel_name, exc_info=True)
+                return
+            # the kernels of the pool don't exist for the API until claimed
+            self._kernels[kernel_id].add_restart_callback(
+                lambda kernel_id=kernel_id: self._handle_kernel_died(kernel_id),
+                'dead',
+            )
+            try:
+                yield self._kernel_info(kernel_id)
+            except gen.TimeoutError:
+                self.log.error("Timeout waiting for kernel %s of the pool of %s to be ready",
+                    kernel_id, kernel_name)
+                yield self._shutdown_kernel(kernel_id, now=True)
+                pool.failed(kernel_name, kernel_id)
+                return
+            if pool.closed or kernel_id not in self._kernels:
+                # shut down, or died, while starting
+                if kernel_id in self._kernels:
+                    yield self._shutdown_kernel(kernel_id, now=True)
+                pool.failed(kernel_name, kernel_id)
+                return
+            pool.add(kernel_name, kernel_id, pid=getattr(self._kernels[kernel_id].kernel, 'pid', None))
+            self.log.info("Kernel started for the pool of %s: %s", kernel_name, kernel_id)
+
+    def _request(self, kernel_id, msg_type, content=None):
+        """Send a request to a kernel on a new shell channel
+
+        Returns a Future resolving to the reply,
+        or failing with a TimeoutError after kernel_pool_ready_timeout.
+        """
+        kernel = self._kernels[kernel_id]
+        channel = kernel.connect_shell()
+        reply = Future()
+
+        def on_reply(msg):
+            if not reply.done():
+                reply.set_result(msg)
+
+        def finish(future):
+            channel.on_recv(None)
+            channel.close()
+
+        channel.on_recv(on_reply)
+        kernel.session.send(channel, msg_type, content=content)
+        future = gen.with_timeout(timedelta(seconds=self.kernel_pool_ready_timeout), reply)
+        future.add_done_callback(finish)
+        return future
+
+    def _kernel_info(self, kernel_id):
+        return self._request(kernel_id, 'kernel_info_request')
+
+    def _execute_silently(self, kernel_id, code):
+        return self._request(kernel_id, 'execute_request', content={
+            'code': code, 'silent': True, 'store_history': False,
+            'user_expressions': {}, 'allow_stdin': False,
+        })
+
+    def kernel_pool_stats(self):
+        """Statistics of the pool of idle kernels, see KernelPool.stats"""
+        return self._kernel_pool.stats()
+
     def start_buffering(self, kernel_id, session_key, channels):
         """Start buffering messages for a kernel
 
@@ -194,14 +489,18 @@ class MappingKernelManager(MultiKernelManager):
         buffer_info = self._kernel_buffers[kernel_id]
         # record the session key because only one session can buffer
         buffer_info['session_key'] = session_key
-        # TODO: the buffer should likely be a memory bounded queue, we're starting with a list to keep it simple
-        buffer_info['buffer'] = []
+        buffer_info['buffer'] = ReplayBuffer(
+            max_messages=self.buffer_max_messages,
+            max_bytes=self.buffer_max_bytes,
+            spill_bytes=self.buffer_spill_bytes,
+            spill_dir=self.buffer_spill_dir or None,
+        )
         buffer_info['channels'] = channels
 
         # forward any future messages to the internal buffer
         def buffer_msg(channel, msg_parts):
             self.log.debug("Buffering msg on %s:%s", kernel_id, channel)
-            buffer_info['buffer'].append((channel, msg_parts))
+            buffer_info['buffer'].append(channel, msg_parts)
 
         for channel, stream in channels.items():
             stream.on_recv(partial(buffer_msg, channel))
@@ -226,6 +525,7 @@ class MappingKernelManager(MultiKernelManager):
         if buffer_info['session_key'] == session_key:
             # remove buffer
             self._kernel_buffers.pop(kernel_id)
+            self._record_buffer_stats(buffer_info['buffer'], 'replayed')
             # only return buffer_info if it's a match
             return buffer_info
         else:
@@ -255,22 +555,129 @@ class MappingKernelManager(MultiKernelManager):
         if msg_buffer:
             self.log.info("Discarding %s buffered messages for %s",
                 len(msg_buffer), buffer_info['session_key'])
+        self._record_buffer_stats(msg_buffer, 'discarded')
+        msg_buffer.close()
+
+    def _record_buffer_stats(self, msg_buffer, outcome):
+        """Record the stats of a buffer replayed or discarded"""
+        stats = self._buffer_stats
+        stats[outcome] += len(msg_buffer)
+        buffer_stats = msg_buffer.stats()
+        stats['collapsed'] += buffer_stats['collapsed']
+        stats['dropped'] += buffer_stats['dropped']
+
+    def buffer_stats(self):
+        """Statistics of the buffers of messages of disconnected kernels
+
+        The numbers of kernels 'buffering', and of the messages and bytes
+        in their buffers, in memory and spilled to disk, and the total
+        numbers of messages 'replayed' on reconnection, 'discarded'
+        with their buffer, 'collapsed' into others and 'dropped'
+        beyond the limits of the buffers.
+        """
+        stats = dict(self._buffer_stats)
+        stats.update(buffering=0, messages=0, bytes=0,
+            spilled_messages=0, spilled_bytes=0)
+        for buffer_info in self._kernel_buffers.values():
+            stats['buffering'] += 1
+            buffer_stats = buffer_info['buffer'].stats()
+            for key in ('messages', 'bytes', 'spilled_messages', 'spilled_bytes',
+                        'collapsed', 'dropped'):
+                stats[key] += buffer_stats[key]
+        return stats
 
+    @gen.coroutine
+    def _stop_kernel_process(self, km, now=False, restart=False):
+        """Stop the process of a kernel without blocking the event loop
+
+        Like KernelManager.shutdown_kernel, the kernel is asked to shut down,
+        and killed if it is still alive after its shutdown_wait_time.
+        """
+        km.stop_restarter()
+        if km.has_kernel and not now:
+            km.request_shutdown(restart=restart)
+            deadline = IOLoop.current().time() + max(km.shutdown_wait_time, 0)
+            while km.is_alive() and IOLoop.current().time() < deadline:
+                yield gen.sleep(0.1)
+        if km.has_kernel:
+            if km.is_alive():
+                self.log.debug("Kernel is taking too long to finish, killing")
+            # reaps the process, even if it exited
+            km._kill_kernel()
+        km.cleanup(connection_file=not restart)
+
+    @gen.coroutine
     def shutdown_kernel(self, kernel_id, now=False):
-        """Shutdown a kernel by kernel_id"""
+        """Shutdown a kernel by kernel_id
+
+        The kernel is removed at once, and its process stopped concurrently
+        with other kernels', up to kernel_operations_limit.
+        """
         self._check_kernel_id(kernel_id)
-        kernel = self._kernels[kernel_id]
-        kernel._activity_stream.close()
-        self.stop_buffering(kernel_id)
-        self._kernel_connections.pop(kernel_id, None)
-        self.last_kernel_activity = utcnow()
-        return super(MappingKernelManager, self).shutdown_kernel(kernel_id, now=now)
+        yield self._shutdown_kernel(kernel_id, now=now)
+
+    @gen.coroutine
+    def _shutdown_kernel(self, kernel_id, now=False):
+        """Shutdown a kernel, or an idle kernel of the pool"""
+        if not self._kernel_pool.discard(kernel_id):
+            kernel = self._kernels[kernel_id]
+            kernel._iopub_hub.close()
+            self.stop_buffering(kernel_id)
+            self._kernel_connections.pop(kernel_id, None)
+            self.last_kernel_activity = utcnow()
+        self._cull_queue.remove(kernel_id)
+        km = self.remove_kernel(kernel_id)
+        future = self._shutting_down[kernel_id] = self._kernel_operations.run(
+            'shutdown', self._stop_kernel_process, km, now=now)
+        try:
+            yield future
+        finally:
+            self._shutting_down.pop(kernel_id, None)
+        self.log.info("Kernel shutdown: %s" % kernel_id)
+
+    @gen.coroutine
+    def shutdown_all(self, now=False):
+        """Shutdown all kernels, including the idle kernels of the pool, concurrently"""
+        self._kernel_pool.close()
+        kernel_ids = self.list_kernel_ids()
+        progress = {'done': 0}
+
+        @gen.coroutine
+        def shutdown(kernel_id):
+            try:
+                if kernel_id in self._kernel_pool:
+                    yield self._shutdown_kernel(kernel_id, now=now)
+                else:
+                    yield self.shutdown_kernel(kernel_id, now=now)
+            except Exception:
+                self.log.error("Failed to shut down kernel %s", kernel_id, exc_info=True)
+            progress['done'] += 1
+            self.log.debug("Shut down %i/%i kernels", progress['done'], len(kernel_ids))
+
+        yield [shutdown(kernel_id) for kernel_id in kernel_ids]
+        # and the kernels already shutting down
+        for future in list(self._shutting_down.values()):
+            try:
+                yield future
+            except Exception:
+                pass
 
+    @gen.coroutine
+    def _restart_kernel_process(self, km):
+        """Restart the process of a kernel, as KernelManager.restart_kernel"""
+        yield self._stop_kernel_process(km, restart=True)
+        km.start_kernel(**km._launch_args)
+
+    @gen.coroutine
     def restart_kernel(self, kernel_id):
-        """Restart a kernel by kernel_id"""
+        """Restart a kernel by kernel_id
+
+        Resolves when the kernel has successfully restarted.
+        """
         self._check_kernel_id(kernel_id)
-        super(MappingKernelManager, self).restart_kernel(kernel_id)
         kernel = self.get_kernel(kernel_id)
+        yield self._kernel_operations.run('restart', self._restart_kernel_process, kernel)
+        self.log.info("Kernel restarted: %s" % kernel_id)
         # return a Future that will resolve when the kernel has successfully restarted
         channel = kernel.connect_shell()
         future = Future()
@@ -305,7 +712,46 @@ class MappingKernelManager(MultiKernelManager):
         channel.on_recv(on_reply)
         loop = IOLoop.current()
         timeout = loop.add_timeout(loop.time() + 30, on_timeout)
-        return future
+        msg = yield future
+        raise gen.Return(msg)
+
+    def kernel_operations_stats(self):
+        """Statistics of the starts, shutdowns and restarts of kernels,
+        see KernelOperationQueue.stats
+        """
+        return self._kernel_operations.stats()
+
+    def subscribe_iopub(self, kernel_id):
+        """Subscribe to the IOPub messages of a kernel
+
+        The messages are received by a single IOPub socket per kernel,
+        and passed to all the subscriptions already deserialized.
+        """
+        self._check_kernel_id(kernel_id)
+        hub = self._kernels[kernel_id]._iopub_hub
+        if not hub.received:
+            # The IOPub socket connected while the kernel was starting
+            # may never get its messages: connect again, now that it is up.
+            hub.reconnect()
+        return hub.subscribe()
+
+    def _new_iopub_rate_limiter(self):
+        """The rate limits of the notebook server apply to every kernel"""
+        try:
+            app = self.parent
+            return IOPubRateLimiter(
+                msg_rate_limit=app.iopub_msg_rate_limit,
+                data_rate_limit=app.iopub_data_rate_limit,
+                window=app.rate_limit_window,
+                coalesced=app.iopub_coalesce_window > 0,
+            )
+        except AttributeError:
+            return IOPubRateLimiter()
+
+    def iopub_rate_limiter(self, kernel_id):
+        """The IOPubRateLimiter of a kernel, shared by its connections"""
+        self._check_kernel_id(kernel_id)
+        return self._kernels[kernel_id]._iopub_hub.rate_limiter
 
     def notify_connect(self, kernel_id):
         """Notice a new connection to a kernel"""
@@ -332,6 +778,12 @@ class MappingKernelManager(MultiKernelManager):
             "execution_state": kernel.execution_state,
             "connections": self._kernel_connections[kernel_id],
         }
+        hub = getattr(kernel, '_iopub_hub', None)
+        if hub is not None:
+            model['iopub_rates'] = hub.rate_limiter.rates()
+        resources = self._resource_sampler.get(kernel_id)
+        if resources is not None:
+            model['resources'] = resources
         return model
 
     def list_kernels(self):
@@ -339,11 +791,69 @@ class MappingKernelManager(MultiKernelManager):
         kernels = []
         kernel_ids = super(MappingKernelManager, self).list_kernel_ids()
         for kernel_id in kernel_ids:
+            if kernel_id in self._kernel_pool:
+                # idle kernels of the pool are not listed until claimed
+                continue
             model = self.kernel_model(kernel_id)
             kernels.append(model)
         return kernels
 
+    # sampling resources:
+
+    def initialize_resource_sampler(self):
+        """Sample the resources of the kernels every resource_sample_interval"""
+        if (self._sampler_callback is None and self.resource_sample_interval > 0
+                and self._resource_sampler.available):
+            self._sampler_callback = PeriodicCallback(
+                self.sample_resources, 1000 * self.resource_sample_interval)
+            self._sampler_callback.start()
+
+    def sample_resources(self):
+        """Sample the resources of all the kernels, in a single pass"""
+        pids = {}
+        for kernel_id, kernel in list(self._kernels.items()):
+            if kernel_id in self._kernel_pool:
+                continue
+            pid = getattr(kernel.kernel, 'pid', None)
+            if pid:
+                pids[kernel_id] = pid
+        self._resource_sampler.sample(pids)
+
+    def resource_stats(self):
+        """The resources used by all the kernels, as last sampled
+
+        The numbers of 'kernels' and of kernels 'sampled', the sums of their
+        'cpu_percent', 'rss', 'threads' and 'fds', and of the 'msg_rate' and
+        'data_rate' of their IOPub messages.
+        """
+        stats = dict(kernels=0, sampled=0, cpu_percent=0., rss=0, threads=0, fds=0,
+            msg_rate=0., data_rate=0.)
+        for kernel_id in self.list_kernel_ids():
+            if kernel_id in self._kernel_pool:
+                continue
+            stats['kernels'] += 1
+            hub = getattr(self._kernels[kernel_id], '_iopub_hub', None)
+            if hub is not None:
+                rates = hub.rate_limiter.rates()
+                stats['msg_rate'] += rates['msg_rate']
+                stats['data_rate'] += rates['data_rate']
+            resources = self._resource_sampler.get(kernel_id)
+            if resources is None:
+                continue
+            stats['sampled'] += 1
+            for key in ('cpu_percent', 'rss', 'threads', 'fds'):
+                if resources[key] is not None:
+                    stats[key] += resources[key]
+        return stats
+
     # override _check_kernel_id to raise 404 instead of KeyError
+    def __contains__(self, kernel_id):
+        """Whether a kernel exists
+
+        The idle kernels of the pool don't exist until they are claimed.
+        """
+        return kernel_id in self._kernels and kernel_id not in self._kernel_pool
+
     def _check_kernel_id(self, kernel_id):
         """Check a that a kernel_id exists and raise 404 if not."""
         if kernel_id not in self:
@@ -356,65 +866,198 @@ class MappingKernelManager(MultiKernelManager):
         
         - update last_activity on every message
         - record execution_state from status messages
+
+        The IOPub messages are received by an IOPubHub,
+        shared with the websockets connected to the kernel.
         """
         kernel = self._kernels[kernel_id]
         # add busy/activity markers:
         kernel.execution_state = 'starting'
         kernel.last_activity = utcnow()
-        kernel._activity_stream = kernel.connect_iopub()
         session = Session(
             config=kernel.session.config,
             key=kernel.session.key,
         )
+        kernel._iopub_hub = IOPubHub(kernel.connect_iopub, session, self.log,
+            rate_limiter=self._new_iopub_rate_limiter())
 
-        def record_activity(msg_list):
+        def record_activity(msg):
             """Record an IOPub message arriving from a kernel"""
             self.last_kernel_activity = kernel.last_activity = utcnow()
 
-            idents, fed_msg_list = session.feed_identities(msg_list)
-            msg = session.deserialize(fed_msg_list)
-
             msg_type = msg['header']['msg_type']
             self.log.debug("activity on %s: %s", kernel_id, msg_type)
             if msg_type == 'status':
                 kernel.execution_state = msg['content']['execution_state']
 
-        kernel._activity_stream.on_recv(record_activity)
+        kernel._iopub_hub.subscribe().on_recv(record_activity)
+        if self._initialized_culler and self.cull_idle_timeout > 0:
+            self._schedule_cull(kernel_id)
 
     def initialize_culler(self):
-        """Start idle culler if 'cull_idle_timeout' is greater than zero.
-
-        Regardless of that value, set flag that we've been here.
-        """
-        if not self._initialized_culler and self.cull_idle_timeout > 0:
-            if self._culler_callback is None:
-                loop = IOLoop.current()
-                if self.cull_interval <= 0: #handle case where user set invalid value
-                    self.log.warning("Invalid value for 'cull_interval' detected (%s) - using default value (%s).",
-                        self.cull_interval, self.cull_interval_default)
-                    self.cull_interval = self.cull_interval_default
-                self._culler_callback = PeriodicCallback(
-                    self.cull_kernels, 1000*self.cull_interval)
-                self.log.info("Culling kernels with idle durations > %s seconds at %s second intervals ...",
-                    self.cull_idle_timeout, self.cull_interval)
-                if self.cull_busy:
-                    self.log.info("Culling kernels even if busy")
-                if self.cull_connected:
-                    self.log.info("Culling kernels even with connected clients")
-                self._culler_callback.start()
+        """Start idle culler if 'cull_idle_timeout' is greater than zero,
+        and the memory culler if 'cull_memory_threshold' is.
+
+        Regardless of these values, set flag that we've been here.
+        """
+        if self._initialized_culler:
+            return
+        if self.cull_idle_timeout > 0:
+            if self.cull_interval <= 0: #handle case where user set invalid value
+                self.log.warning("Invalid value for 'cull_interval' detected (%s) - using default value (%s).",
+                    self.cull_interval, self.cull_interval_default)
+                self.cull_interval = self.cull_interval_default
+            self.log.info("Culling kernels with idle durations > %s seconds, busy or connected ones checked again at %s second intervals ...",
+                self.cull_idle_timeout, self.cull_interval)
+            if self.cull_busy:
+                self.log.info("Culling kernels even if busy")
+            if self.cull_connected:
+                self.log.info("Culling kernels even with connected clients")
+            for kernel_id in list(self._kernels):
+                if kernel_id not in self._kernel_pool:
+                    self._schedule_cull(kernel_id)
+
+        if self.cull_memory_threshold > 0 and self._memory_culler_callback is None:
+            self._memory_culler_callback = PeriodicCallback(
+                self.cull_kernels_for_memory, 1000*self.cull_memory_interval)
+            self.log.info("Culling idle kernels when more than %i%% of the memory is in use",
+                100 * self.cull_memory_threshold)
+            self._memory_culler_callback.start()
 
         self._initialized_culler = True
 
+    def _schedule_cull(self, kernel_id):
+        """Schedule the culling of a kernel, when it will exceed the cull timeout,
+        if it isn't active again by then
+        """
+        kernel = self._kernels[kernel_id]
+        idle = (utcnow() - kernel.last_activity).total_seconds()
+        deadline = IOLoop.current().time() + self.cull_idle_timeout - idle
+        self._cull_queue.push(kernel_id, deadline)
+        self._reschedule_culler()
+
+    def _reschedule_culler(self):
+        """Wake the culler when the earliest kernel may exceed the cull timeout"""
+        loop = IOLoop.current()
+        entry = self._cull_queue.peek()
+        if entry is not None and self._cull_timeout is not None and self._cull_deadline <= entry[0]:
+            return
+        if self._cull_timeout is not None:
+            loop.remove_timeout(self._cull_timeout)
+            self._cull_timeout = None
+        if entry is not None:
+            self._cull_deadline = entry[0]
+            self._cull_timeout = loop.call_at(entry[0], self._cull_expired)
+
+    def _cull_expired(self):
+        """Cull the kernels whose deadline has passed
+
+        Kernels active since their deadline was set are rescheduled
+        from their last activity, and kernels not culled because they are busy
+        or connected are checked again after cull_interval.
+        """
+        self._cull_timeout = None
+        queue = self._cull_queue
+        now = IOLoop.current().time()
+        while True:
+            entry = queue.peek()
+            if entry is None or entry[0] > now:
+                break
+            deadline, kernel_id = queue.pop()
+            if kernel_id not in self._kernels or kernel_id in self._kernel_pool:
+                continue
+            kernel = self._kernels[kernel_id]
+            remaining = self.cull_idle_timeout - (utcnow() - kernel.last_activity).total_seconds()
+            if remaining > 0:
+                queue.push(kernel_id, now + remaining)
+                continue
+            try:
+                future = self.cull_kernel_if_idle(kernel_id)
+            except Exception as e:
+                self.log.exception("The following exception was encountered while checking the idle duration of kernel %s: %s",
+                    kernel_id, e)
+                future = None
+            if future is None:
+                queue.push(kernel_id, now + self.cull_interval)
+            else:
+                IOLoop.current().add_future(future, partial(self._log_cull_failure, kernel_id))
+        self._reschedule_culler()
+
+    def cull_kernels_for_memory(self):
+        """Cull idle kernels, least recently active first,
+        while the memory of the host in use exceeds cull_memory_threshold
+
+        Only as many kernels are culled as their resident memory covers the
+        excess, counting the memory of the kernels still being culled.
+        Culling stops at a kernel whose memory is unknown.
+        """
+        total, available = host_memory()
+        if not total:
+            return
+        excess = (total - available) - self.cull_memory_threshold * total
+        # the memory of the kernels culled before, not freed yet
+        excess -= sum(self._memory_culled.values())
+        if excess <= 0:
+            return
+        candidates = []
+        for kernel_id, kernel in list(self._kernels.items()):
+            if kernel_id in self._kernel_pool or getattr(kernel, 'last_activity', None) is None:
+                continue
+            if not self.cull_busy and kernel.execution_state == 'busy':
+                continue
+            if not self.cull_connected and self._kernel_connections.get(kernel_id, 0):
+                continue
+            candidates.append((kernel.last_activity, kernel_id))
+        candidates.sort()
+        for last_activity, kernel_id in candidates:
+            if excess <= 0:
+                break
+            kernel = self._kernels[kernel_id]
+            pid = getattr(kernel.kernel, 'pid', None)
+            rss = process_rss(pid) if pid else 0
+            if not rss:
+                self.log.warning("Not culling kernels due to memory pressure: "
+                    "the memory of kernel %s is unknown.", kernel_id)
+                break
+            self.log.warning("Culling '%s' kernel '%s' (%s) using %i MB, last active %s, due to memory pressure.",
+                kernel.execution_state, kernel.kernel_name, kernel_id, rss // (1024 * 1024),
+                isoformat(last_activity))
+            self._memory_culled[kernel_id] = rss
+            IOLoop.current().add_future(self.shutdown_kernel(kernel_id),
+                partial(self._memory_cull_done, kernel_id))
+            excess -= rss
+
+    def _memory_cull_done(self, kernel_id, future):
+        self._memory_culled.pop(kernel_id, None)
+        self._log_cull_failure(kernel_id, future)
+
     def cull_kernels(self):
-        self.log.debug("Polling every %s seconds for kernels idle > %s seconds...",
-            self.cull_interval, self.cull_idle_timeout)
-        """Create a separate list of kernels to avoid conflicting updates while iterating"""
+        """Check every kernel for culling
+
+        Kernels are culled as they expire, without scanning them all.
+        """
+        self.log.debug("Checking all kernels for idle > %s seconds...",
+            self.cull_idle_timeout)
+        # Create a separate list of kernels to avoid conflicting updates while iterating
         for kernel_id in list(self._kernels):
+            if kernel_id in self._kernel_pool:
+                continue
             try:
-                self.cull_kernel_if_idle(kernel_id)
+                future = self.cull_kernel_if_idle(kernel_id)
             except Exception as e:
                 self.log.exception("The following exception was encountered while checking the idle duration of kernel %s: %s",
                     kernel_id, e)
+            else:
+                if future is not None:
+                    # the kernels are shut down concurrently
+                    IOLoop.current().add_future(future,
+                        partial(self._log_cull_failure, kernel_id))
+
+    def _log_cull_failure(self, kernel_id, future):
+        try:
+            future.result()
+        except Exception:
+            self.log.error("Failed to cull kernel %s", kernel_id, exc_info=True)
 
     def cull_kernel_if_idle(self, kernel_id):
         kernel = self._kernels[kernel_id]
@@ -432,5 +1075,5 @@ class MappingKernelManager(MultiKernelManager):
                 idle_duration = int(dt_idle.total_seconds())
                 self.log.warning("Culling '%s' kernel '%s' (%s) with %d connections due to %s seconds of inactivity.",
                                  kernel.execution_state, kernel.kernel_name, kernel_id, connections, idle_duration)
-                self.shutdown_kernel(kernel_id)
+                return self.shutdown_kernel(kernel_id)
 
@@ -0,0 +1,126 @@
+"""
+A pool of idle kernels, started ahead of the sessions which claim them.
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from collections import defaultdict, deque
+
+from .resources import process_rss
+
+
+class KernelPool(object):
+    """The idle kernels started ahead of sessions, for each kernel spec
+
+    The pool only keeps track of the kernels,
+    which are started and claimed by the MappingKernelManager.
+
+    Parameters
+    ----------
+    sizes : dict
+      The number of idle kernels to keep, by kernel spec name.
+    max_memory : int
+      The resident memory of all the idle kernels, in bytes,
+      beyond which no more are started. 0 means unlimited.
+    """
+
+    def __init__(self, sizes=None, max_memory=0):
+        self.sizes = dict(sizes or {})
+        self.max_memory = max_memory
+        # kernel spec name: ids of the idle kernels, oldest first
+        self._idle = defaultdict(deque)
+        # kernel spec name: ids of the kernels starting
+        self._starting = defaultdict(set)
+        # kernel id: pid of the idle kernels
+        self._pids = {}
+        self.hits = 0
+        self.misses = 0
+        self.closed = False
+
+    def __contains__(self, kernel_id):
+        """Whether a kernel is idle in the pool, or starting for it"""
+        return kernel_id in self._pids or any(
+            kernel_id in starting for starting in self._starting.values())
+
+    def __len__(self):
+        return len(self._pids)
+
+    def memory(self):
+        """The resident memory of the idle kernels, in bytes"""
+        return sum(process_rss(pid) for pid in self._pids.values() if pid)
+
+    def needed(self, kernel_name):
+        """The number of kernels to start to fill the pool of a kernel spec"""
+        if self.closed or (self.max_memory and self.memory() >= self.max_memory):
+            return 0
+        size = self.sizes.get(kernel_name, 0)
+        return size - len(self._idle[kernel_name]) - len(self._starting[kernel_name])
+
+    def starting(self, kernel_name):
+        """The number of kernels starting for the pool of a kernel spec"""
+        return len(self._starting[kernel_name])
+
+    def record_start(self, kernel_name, kernel_id):
+        """Record a kernel starting for the pool"""
+        self._starting[kernel_name].add(kernel_id)
+
+    def add(self, kernel_name, kernel_id, pid=None):
+        """Add a kernel, started for the pool, once it is ready"""
+        self._starting[kernel_name].discard(kernel_id)
+        self._idle[kernel_name].append(kernel_id)
+        self._pids[kernel_id] = pid
+
+    def failed(self, kernel_name, kernel_id):
+        """Record a kernel started for the pool failing to be ready"""
+        self._starting[kernel_name].discard(kernel_id)
+
+    def claim(self, kernel_name):
+        """Claim an idle kernel
+
+        Returns its id, or None if the pool of the kernel spec is empty.
+        """
+        if self.closed or kernel_name not in self.sizes:
+            return None
+        idle = self._idle[kernel_name]
+        if not idle:
+            self.misses += 1
+            return None
+        self.hits += 1
+        kernel_id = idle.popleft()
+        del self._pids[kernel_id]
+        return kernel_id
+
+    def discard(self, kernel_id):
+        """Remove an idle or starting kernel, e.g. if it died
+
+        Returns whether it was in the pool.
+        """
+        if kernel_id not in self:
+            return False
+        self._pids.pop(kernel_id, None)
+        for idle in self._idle.values():
+            if kernel_id in idle:
+                idle.remove(kernel_id)
+        for starting in self._starting.values():
+            starting.discard(kernel_id)
+        return True
+
+    def close(self):
+        """Stop filling the pool, and claiming its kernels,
+        e.g. before they are shut down
+        """
+        self.closed = True
+
+    def stats(self):
+        """The numbers of idle and starting kernels, their memory,
+        and the numbers of sessions which got an idle kernel ('hits')
+        or had to start one ('misses').
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'idle': len(self._pids),
+            'starting': sum(len(starting) for starting in self._starting.values()),
+            'memory': self.memory(),
+        }
@@ -0,0 +1,72 @@
+"""
+Run the starts, shutdowns and restarts of kernels concurrently, up to a limit.
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from collections import deque
+
+from tornado import gen
+from tornado.concurrent import Future
+
+
+class KernelOperationQueue(object):
+    """Run operations on kernels concurrently, at most `limit` at a time
+
+    Operations beyond the limit wait for a running one to finish,
+    in the order they were requested.
+
+    Must be used from the thread of the event loop.
+
+    Parameters
+    ----------
+    limit : int
+      The number of operations to run at a time. 0 means unlimited.
+    """
+
+    kinds = ('start', 'shutdown', 'restart')
+
+    def __init__(self, limit=0):
+        self.limit = limit
+        self._running = 0
+        # Futures of the operations waiting to run, oldest first
+        self._waiting = deque()
+        self._stats = dict((kind, 0) for kind in self.kinds)
+        self._stats['failed'] = 0
+
+    @gen.coroutine
+    def run(self, kind, func, *args, **kwargs):
+        """Run an operation once there is room for it
+
+        func may return a Future. Returns a Future of its result.
+        """
+        if self.limit and self._running >= self.limit:
+            waiting = Future()
+            self._waiting.append(waiting)
+            # the operation finishing hands its slot over
+            yield waiting
+        else:
+            self._running += 1
+        try:
+            result = yield gen.maybe_future(func(*args, **kwargs))
+        except Exception:
+            self._stats['failed'] += 1
+            raise
+        else:
+            self._stats[kind] += 1
+        finally:
+            if self._waiting:
+                self._waiting.popleft().set_result(None)
+            else:
+                self._running -= 1
+        raise gen.Return(result)
+
+    def stats(self):
+        """The numbers of operations 'running' and 'queued', and the numbers
+        of kernels started, shut down and restarted, and of operations 'failed'.
+        """
+        stats = dict(self._stats)
+        stats['running'] = self._running
+        stats['queued'] = len(self._waiting)
+        return stats
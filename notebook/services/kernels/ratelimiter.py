@@ -0,0 +1,134 @@
+"""
+Limit the rate of the IOPub messages of a kernel sent to its frontends.
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from collections import deque
+
+from tornado.ioloop import IOLoop
+
+from notebook.base.zmqhandlers import message_size
+
+
+class IOPubRateLimiter(object):
+    """Measure the rates of the IOPub messages and data of a kernel,
+    over a sliding window, and flag when they exceed their limits
+
+    Each message is recorded once for all the frontends of the kernel,
+    and counted for `window` seconds, in O(1).
+    Its size includes all its parts and buffers.
+
+    Once a limit is exceeded, messages are not counted, and should not be
+    sent, until the rate falls to 80% of the limit.
+    status, comm_open and execute_input messages are never limited,
+    and an idle status resets the counts, to avoid 'Run All' hitting
+    limits prematurely.
+
+    When the frontends coalesce stream and update_display_data messages,
+    these are only limited by their data: they are sent as fewer messages
+    than the kernel sends.
+
+    Parameters
+    ----------
+    msg_rate_limit : float
+      In messages per second. 0 means unlimited.
+    data_rate_limit : float
+      In bytes per second. 0 means unlimited.
+    window : float
+      In seconds.
+    coalesced : bool
+      Whether stream and update_display_data messages are coalesced
+      before they are sent.
+    """
+
+    unlimited_msg_types = {'status', 'comm_open', 'execute_input'}
+
+    coalescible_msg_types = {'stream', 'update_display_data'}
+
+    def __init__(self, msg_rate_limit=0, data_rate_limit=0, window=1.0, coalesced=False):
+        self.msg_rate_limit = msg_rate_limit
+        self.data_rate_limit = data_rate_limit
+        self.window = window
+        self.coalesced = coalesced
+        self.reset()
+
+    def counts_messages(self, msg_type):
+        """Whether messages of a type count against the message rate limit"""
+        return msg_type not in self.unlimited_msg_types and not (
+            self.coalesced and msg_type in self.coalescible_msg_types)
+
+    def reset(self):
+        # (expiry time, message count, byte count) of the messages counted, oldest first
+        self._queue = deque()
+        self.msg_count = 0
+        self.byte_count = 0
+        self.msgs_exceeded = False
+        self.data_exceeded = False
+
+    @property
+    def exceeded(self):
+        """Whether messages should not be sent"""
+        return self.msgs_exceeded or self.data_exceeded
+
+    def _now(self):
+        return IOLoop.current().time()
+
+    def _expire(self, now):
+        queue = self._queue
+        while queue and queue[0][0] <= now:
+            expiry, msg_count, byte_count = queue.popleft()
+            self.msg_count -= msg_count
+            self.byte_count -= byte_count
+
+    def record(self, msg):
+        """Record an IOPub message of the kernel
+
+        Returns whether it can be sent.
+        """
+        msg_type = msg['msg_type']
+        if msg_type == 'status' and msg['content'].get('execution_state') == 'idle':
+            self.reset()
+        if msg_type in self.unlimited_msg_types:
+            return True
+
+        now = self._now()
+        self._expire(now)
+        byte_count = message_size(msg)
+        msg_count = 1 if self.counts_messages(msg_type) else 0
+        self.msg_count += msg_count
+        self.byte_count += byte_count
+        self._queue.append((now + self.window, msg_count, byte_count))
+
+        msg_rate = float(self.msg_count) / self.window
+        data_rate = float(self.byte_count) / self.window
+        if self.msg_rate_limit > 0 and msg_rate > self.msg_rate_limit:
+            self.msgs_exceeded = True
+        elif self.msgs_exceeded and msg_rate < (0.8 * self.msg_rate_limit):
+            # resume once we've got some headroom below the limit
+            self.msgs_exceeded = False
+        if self.data_rate_limit > 0 and data_rate > self.data_rate_limit:
+            self.data_exceeded = True
+        elif self.data_exceeded and data_rate < (0.8 * self.data_rate_limit):
+            self.data_exceeded = False
+
+        if self.data_exceeded or (msg_count and self.msgs_exceeded):
+            # it won't be sent, remove it from the calculus
+            self._queue.pop()
+            self.msg_count -= msg_count
+            self.byte_count -= byte_count
+            return False
+        return True
+
+    def rates(self):
+        """The current rates of messages and data, in messages and bytes per second,
+        and whether they exceed their limits
+        """
+        self._expire(self._now())
+        return {
+            'msg_rate': float(self.msg_count) / self.window,
+            'data_rate': float(self.byte_count) / self.window,
+            'msgs_exceeded': self.msgs_exceeded,
+            'data_exceeded': self.data_exceeded,
+        }
@@ -0,0 +1,340 @@
+"""
+A bounded buffer of the messages of a kernel, replayed when a frontend reconnects.
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from collections import deque
+import json
+import mmap
+import struct
+import tempfile
+
+from jupyter_client.jsonutil import date_default
+
+from notebook.base.zmqhandlers import RawMessage, message_size
+
+
+class SpillRing(object):
+    """A ring of records in a memory-mapped temporary file
+
+    When a new record doesn't fit, the oldest records are dropped.
+
+    Parameters
+    ----------
+    size : int
+      The size of the file, in bytes.
+    dir : str, optional
+      The directory of the file. Defaults to the temporary directory.
+    """
+
+    def __init__(self, size, dir=None):
+        self.size = size
+        self._file = tempfile.TemporaryFile(dir=dir)
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        # (offset, length) of the records, oldest first
+        self._records = deque()
+        self._end = 0
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def push(self, data):
+        """Add a record, dropping the oldest ones to make room
+
+        Returns the number of records dropped,
+        including the new one if it is larger than the ring.
+        """
+        n = len(data)
+        if n > self.size:
+            return 1
+        pos = self._end if self._records else 0
+        # the end of the space left unused when wrapping around
+        tail = self.size
+        if pos + n > self.size:
+            tail, pos = pos, 0
+        dropped = 0
+        # the records are in the order of their offsets from the oldest,
+        # so those overlapping the new one or left in the tail come first
+        while self._records:
+            offset, length = self._records[0]
+            if offset >= tail or (offset < pos + n and pos < offset + length):
+                self._records.popleft()
+                self.bytes -= length
+                dropped += 1
+            else:
+                break
+        self._map[pos:pos + n] = data
+        self._records.append((pos, n))
+        self._end = pos + n
+        self.bytes += n
+        return dropped
+
+    def pop(self):
+        """Remove and return the oldest record"""
+        offset, length = self._records.popleft()
+        self.bytes -= length
+        return self._map[offset:offset + length]
+
+    def close(self):
+        self._records.clear()
+        self.bytes = 0
+        self._map.close()
+        self._file.close()
+
+
+def _pack_frames(frames):
+    lengths = [len(f) for f in frames]
+    return b''.join(
+        [struct.pack('!%iI' % (len(frames) + 1), len(frames), *lengths)]
+        + [bytes(f) for f in frames]
+    )
+
+
+def _unpack_frames(data):
+    n, = struct.unpack_from('!I', data)
+    lengths = struct.unpack_from('!%iI' % n, data, 4)
+    offset = 4 * (n + 1)
+    frames = []
+    for length in lengths:
+        frames.append(data[offset:offset + length])
+        offset += length
+    return frames
+
+
+def _json_bytes(obj):
+    return json.dumps(obj, default=date_default).encode('utf8')
+
+
+class _Entry(object):
+    """A buffered message, and its size"""
+
+    __slots__ = ('channel', 'msg', 'nbytes', 'texts', 'display_id')
+
+    def __init__(self, channel, msg, nbytes):
+        self.channel = channel
+        # None once replaced by a later message
+        self.msg = msg
+        self.nbytes = nbytes
+        # the text of the stream messages collapsed into this one
+        self.texts = None
+        # the display updated by this update_display_data message
+        self.display_id = None
+
+    def message(self):
+        """The message to replay"""
+        if self.texts is None:
+            return self.msg
+        msg = self.msg
+        content = dict(msg['content'])
+        content['text'] = u''.join(self.texts)
+        return {
+            'header': msg['header'],
+            'msg_id': msg['msg_id'],
+            'msg_type': msg['msg_type'],
+            'parent_header': msg['parent_header'],
+            'metadata': msg['metadata'],
+            'content': content,
+            'buffers': [],
+        }
+
+    def pack(self):
+        """Serialize the message to spill it to disk"""
+        msg = self.message()
+        if isinstance(msg, list):
+            kind, frames = 'list', msg
+        elif isinstance(msg, RawMessage):
+            kind, frames = 'raw', msg.frames
+        else:
+            kind = 'raw'
+            frames = [_json_bytes(msg[key]) for key in RawMessage._parts]
+            frames.extend(msg['buffers'])
+        info = _json_bytes({'channel': self.channel, 'kind': kind})
+        return _pack_frames([info] + list(frames))
+
+    @staticmethod
+    def unpack(data):
+        """Deserialize a message spilled to disk
+
+        Returns (channel, msg).
+        """
+        frames = _unpack_frames(data)
+        info = json.loads(frames[0].decode('utf8'))
+        frames = frames[1:]
+        if info['kind'] == 'raw':
+            header = json.loads(frames[0].decode('utf8'))
+            return info['channel'], RawMessage(header, frames)
+        return info['channel'], frames
+
+
+class ReplayBuffer(object):
+    """A bounded buffer of the messages of a kernel
+
+    Messages are kept in memory, up to `max_messages` and `max_bytes`.
+    Beyond that, the oldest messages are spilled to a ring
+    in a memory-mapped file of `spill_bytes`, if not 0, or dropped.
+
+    While buffering, IOPub messages are collapsed:
+
+    - consecutive `stream` messages with the same name and parent
+      are replayed as a single message
+    - only the latest `update_display_data` message of a display
+      is replayed
+
+    Messages are passed to `append` as they are passed to the
+    callbacks of ZMQStreams (lists of bytes) or IOPubSubscriptions
+    (RawMessages or message dicts), and replayed so.
+
+    ZMQChannelsHandler also uses it, unbounded, to coalesce
+    output sent by kernels at a high rate.
+
+    Parameters
+    ----------
+    max_messages : int
+      The number of messages to keep in memory. 0 means unlimited.
+    max_bytes : int
+      The size of the messages to keep in memory. 0 means unlimited.
+    spill_bytes : int
+      The size of the ring of messages spilled to disk.
+      0 means the messages are dropped instead.
+    spill_dir : str, optional
+      The directory of the ring.
+    """
+
+    def __init__(self, max_messages=0, max_bytes=0, spill_bytes=0, spill_dir=None):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.spill_bytes = spill_bytes
+        self.spill_dir = spill_dir
+        self._entries = deque()
+        # the number of entries not replaced by a later message
+        self._messages = 0
+        self._bytes = 0
+        self._ring = None
+        # display_id: entry of its latest update_display_data message
+        self._display_updates = {}
+        self._stats = {'collapsed': 0, 'spilled': 0, 'dropped': 0}
+
+    def __len__(self):
+        ring = len(self._ring) if self._ring is not None else 0
+        return self._messages + ring
+
+    def __bool__(self):
+        return len(self) > 0
+
+    __nonzero__ = __bool__ # py2
+
+    def append(self, channel, msg):
+        """Buffer a message from a kernel"""
+        if channel == 'iopub' and not isinstance(msg, list) and self._collapse(msg):
+            self._stats['collapsed'] += 1
+        else:
+            nbytes = message_size(msg)
+            entry = _Entry(channel, msg, nbytes)
+            self._entries.append(entry)
+            self._messages += 1
+            self._bytes += nbytes
+            if channel == 'iopub' and not isinstance(msg, list):
+                self._index(entry)
+        self._evict()
+
+    def _index(self, entry):
+        msg = entry.msg
+        if msg['msg_type'] == 'update_display_data':
+            display_id = msg['content'].get('transient', {}).get('display_id')
+            if display_id is not None:
+                previous = self._display_updates.get(display_id)
+                if previous is not None:
+                    # replaced by the latest update
+                    self._bytes -= previous.nbytes
+                    self._messages -= 1
+                    previous.msg = None
+                    self._stats['collapsed'] += 1
+                entry.display_id = display_id
+                self._display_updates[display_id] = entry
+
+    def _collapse(self, msg):
+        """Collapse a stream message into the previous one, if possible"""
+        if msg['msg_type'] != 'stream' or not self._entries:
+            return False
+        last = self._entries[-1]
+        if (last.channel != 'iopub' or last.msg is None or isinstance(last.msg, list)
+                or last.msg['msg_type'] != 'stream'):
+            return False
+        content = msg['content']
+        last_content = last.msg['content']
+        if (content.get('name') != last_content.get('name')
+                or msg['parent_header'].get('msg_id') != last.msg['parent_header'].get('msg_id')):
+            return False
+        if last.texts is None:
+            last.texts = [last_content.get('text', u'')]
+        text = content.get('text', u'')
+        last.texts.append(text)
+        nbytes = len(text.encode('utf8'))
+        last.nbytes += nbytes
+        self._bytes += nbytes
+        return True
+
+    def _pop(self):
+        """Remove the oldest entry from memory"""
+        entry = self._entries.popleft()
+        if entry.msg is not None:
+            self._messages -= 1
+            self._bytes -= entry.nbytes
+            if entry.display_id is not None:
+                # only the updates in memory can be replaced
+                self._display_updates.pop(entry.display_id, None)
+        return entry
+
+    def _over(self):
+        return ((self.max_messages and self._messages > self.max_messages)
+            or (self.max_bytes and self._bytes > self.max_bytes))
+
+    def _evict(self):
+        while self._entries and self._over():
+            entry = self._pop()
+            if entry.msg is None:
+                continue
+            if self.spill_bytes:
+                if self._ring is None:
+                    self._ring = SpillRing(self.spill_bytes, dir=self.spill_dir)
+                self._stats['dropped'] += self._ring.push(entry.pack())
+                self._stats['spilled'] += 1
+            else:
+                self._stats['dropped'] += 1
+
+    def __iter__(self):
+        """Replay the messages, oldest first, emptying the buffer"""
+        while self._ring is not None and len(self._ring):
+            yield _Entry.unpack(self._ring.pop())
+        while self._entries:
+            entry = self._pop()
+            if entry.msg is not None:
+                yield entry.channel, entry.message()
+
+    def stats(self):
+        """The numbers of messages and bytes buffered in memory,
+        and on disk ('spilled_messages', 'spilled_bytes'),
+        and the numbers of messages 'collapsed' into others,
+        'spilled' to disk, and 'dropped'.
+        """
+        stats = dict(self._stats)
+        ring = self._ring
+        stats['messages'] = self._messages
+        stats['bytes'] = self._bytes
+        stats['spilled_messages'] = len(ring) if ring is not None else 0
+        stats['spilled_bytes'] = ring.bytes if ring is not None else 0
+        return stats
+
+    def close(self):
+        """Discard the buffered messages"""
+        self._entries.clear()
+        self._display_updates.clear()
+        self._messages = 0
+        self._bytes = 0
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
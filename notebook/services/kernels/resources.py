@@ -0,0 +1,124 @@
+"""
+The resources used by kernel processes, and by the host, read from /proc.
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+import os
+import time
+
+
+def process_rss(pid):
+    """The resident memory of a process, in bytes
+
+    Read from /proc, so 0 where it isn't available.
+    """
+    try:
+        with open('/proc/%i/statm' % pid) as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        return 0
+
+
+def host_memory():
+    """The total and available memory of the host, in bytes
+
+    Read from /proc/meminfo, so (0, 0) where it isn't available.
+    """
+    info = {}
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                info[key] = int(value.split()[0]) * 1024
+    except (IOError, OSError, ValueError, IndexError):
+        return 0, 0
+    total = info.get('MemTotal', 0)
+    available = info.get('MemAvailable')
+    if available is None:
+        # before Linux 3.14
+        available = info.get('MemFree', 0) + info.get('Buffers', 0) + info.get('Cached', 0)
+    return total, available
+
+
+def _read_stat(pid):
+    """The CPU time (in clock ticks), threads and resident pages of a process"""
+    with open('/proc/%i/stat' % pid) as f:
+        data = f.read()
+    # the fields after the command, which may contain spaces, start with the state
+    fields = data[data.rindex(')') + 2:].split()
+    return int(fields[11]) + int(fields[12]), int(fields[17]), int(fields[21])
+
+
+def _count_fds(pid):
+    try:
+        return len(os.listdir('/proc/%i/fd' % pid))
+    except (IOError, OSError):
+        # e.g. the process of another user
+        return None
+
+
+class ResourceSampler(object):
+    """Sample the resources used by processes, e.g. kernels, from /proc
+
+    All the processes are sampled in a single pass, reading
+    /proc/<pid>/stat, and listing /proc/<pid>/fd, for each.
+    Their CPU usage is measured between two passes.
+    """
+
+    def __init__(self):
+        try:
+            self._clock_ticks = os.sysconf('SC_CLK_TCK')
+            self._page_size = os.sysconf('SC_PAGE_SIZE')
+        except (AttributeError, ValueError, OSError):
+            self._clock_ticks = self._page_size = None
+        # key: (pid, time of the sample, CPU ticks)
+        self._previous = {}
+        # key: resources
+        self._samples = {}
+
+    @property
+    def available(self):
+        return self._clock_ticks is not None and os.path.isdir('/proc/self')
+
+    def sample(self, pids, now=None):
+        """Sample the processes, given as a dict of key: pid
+
+        The samples of keys missing from pids are discarded.
+        """
+        if not self.available:
+            return
+        if now is None:
+            now = time.time()
+        previous = self._previous
+        self._previous = {}
+        samples = {}
+        for key, pid in pids.items():
+            try:
+                ticks, threads, pages = _read_stat(pid)
+            except (IOError, OSError, ValueError, IndexError):
+                # exited
+                continue
+            cpu_percent = None
+            last = previous.get(key)
+            if last is not None and last[0] == pid and now > last[1]:
+                cpu_percent = 100. * (ticks - last[2]) / self._clock_ticks / (now - last[1])
+            self._previous[key] = (pid, now, ticks)
+            samples[key] = {
+                'cpu_percent': cpu_percent,
+                'rss': pages * self._page_size,
+                'threads': threads,
+                'fds': _count_fds(pid),
+            }
+        self._samples = samples
+
+    def get(self, key):
+        """The last sample of a process, or None
+
+        A dict of its 'cpu_percent' since the previous sample (None on the
+        first one), resident memory ('rss') in bytes, and numbers of
+        'threads' and open file descriptors ('fds', None if unknown).
+        """
+        return self._samples.get(key)
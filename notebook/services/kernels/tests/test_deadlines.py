@@ -0,0 +1,31 @@
+"""Tests for the queue of deadlines."""
+
+from unittest import TestCase
+
+from ..deadlines import DeadlineQueue
+
+
+class TestDeadlineQueue(TestCase):
+
+    def test_order(self):
+        queue = DeadlineQueue()
+        queue.push('a', 3)
+        queue.push('b', 1)
+        queue.push('c', 2)
+        self.assertEqual(queue.peek(), (1, 'b'))
+        self.assertEqual([queue.pop(), queue.pop(), queue.pop()], [(1, 'b'), (2, 'c'), (3, 'a')])
+        self.assertIsNone(queue.peek())
+        with self.assertRaises(IndexError):
+            queue.pop()
+
+    def test_replace_remove(self):
+        queue = DeadlineQueue()
+        queue.push('a', 1)
+        queue.push('b', 2)
+        queue.push('a', 3)
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue.pop(), (2, 'b'))
+        queue.remove('a')
+        self.assertNotIn('a', queue)
+        self.assertIsNone(queue.peek())
+        self.assertEqual(len(queue._heap), 0)
@@ -0,0 +1,94 @@
+"""Tests for the IOPub hub."""
+
+import logging
+from unittest import TestCase
+
+from jupyter_client.session import Session
+
+from notebook.base.zmqhandlers import RawMessage, serialize_raw_message
+from ..iopubhub import IOPubHub
+
+
+class FakeStream(object):
+    """A ZMQStream on which messages are received by calling recv"""
+
+    def __init__(self):
+        self.callback = None
+        self._closed = False
+
+    def on_recv(self, callback):
+        self.callback = callback
+
+    def recv(self, msg_list):
+        self.callback(msg_list)
+
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        self._closed = True
+
+
+class TestIOPubHub(TestCase):
+
+    def setUp(self):
+        self.session = Session(key=b'secret')
+        self.stream = FakeStream()
+        self.hub = IOPubHub(lambda: self.stream, Session(key=b'secret'), logging.getLogger())
+
+    def send(self, msg_type, content):
+        msg = self.session.msg(msg_type, content=content)
+        self.stream.recv(self.session.serialize(msg))
+
+    def test_multicast(self):
+        received = []
+        subscriptions = [self.hub.subscribe() for i in range(3)]
+        for s in subscriptions:
+            s.on_recv(received.append)
+        self.send('stream', {'name': 'stdout', 'text': 'hi'})
+        self.assertEqual(len(received), 3)
+        # the message is deserialized once, and shared
+        msg = received[0]
+        self.assertIsInstance(msg, RawMessage)
+        self.assertTrue(all(m is msg for m in received))
+        self.assertIs(serialize_raw_message(msg, 'iopub'), serialize_raw_message(msg, 'iopub'))
+
+        subscriptions[0].close()
+        self.assertTrue(subscriptions[0].closed())
+        self.send('status', {'execution_state': 'idle'})
+        self.assertEqual(len(received), 5)
+        self.assertEqual(received[-1]['content'], {'execution_state': 'idle'})
+
+    def test_on_recv_stream(self):
+        received = []
+        subscription = self.hub.subscribe()
+        subscription.on_recv_stream(lambda stream, msg: received.append((stream, msg)))
+        self.send('status', {'execution_state': 'busy'})
+        self.assertEqual(len(received), 1)
+        self.assertIs(received[0][0], subscription)
+        self.assertEqual(received[0][0].channel, 'iopub')
+
+    def test_malformed(self):
+        received = []
+        self.hub.subscribe().on_recv(received.append)
+        msg_list = Session(key=b'other').serialize(self.session.msg('status'))
+        self.stream.recv(msg_list)
+        self.assertEqual(received, [])
+
+    def test_reconnect(self):
+        received = []
+        self.hub.subscribe().on_recv(received.append)
+        old_stream = self.stream
+        self.stream = FakeStream()
+        self.hub.reconnect()
+        self.assertTrue(old_stream.closed())
+        self.assertIs(self.hub.stream, self.stream)
+        self.send('status', {'execution_state': 'idle'})
+        self.assertEqual(len(received), 1)
+        self.assertEqual(self.hub.received, 1)
+
+    def test_close(self):
+        subscription = self.hub.subscribe()
+        self.hub.close()
+        self.assertTrue(self.stream.closed())
+        self.assertTrue(subscription.closed())
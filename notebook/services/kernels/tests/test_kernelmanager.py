@@ -0,0 +1,74 @@
+"""Tests for the kernel manager, without kernels."""
+
+from datetime import timedelta
+from functools import partial
+from unittest import TestCase
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch # py2
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+from notebook._tz import utcnow
+from ..kernelmanager import MappingKernelManager
+
+MB = 1024 * 1024
+
+
+class DummyProcess(object):
+    def __init__(self, pid):
+        self.pid = pid
+
+
+class DummyKernel(object):
+    def __init__(self, pid, last_activity):
+        self.kernel = DummyProcess(pid)
+        self.kernel_name = 'python'
+        self.execution_state = 'idle'
+        self.last_activity = last_activity
+
+
+class MemoryCullerTest(TestCase):
+
+    def setUp(self):
+        self.km = MappingKernelManager(cull_memory_threshold=0.5)
+        self.shutdowns = {}
+        self.km.shutdown_kernel = self.shutdown_kernel
+        now = utcnow()
+        # pid: resident memory, of kernels a, b, c, least recently active first
+        self.rss = {1: 300 * MB, 2: 200 * MB, 3: 500 * MB}
+        for pid, kernel_id in enumerate('abc', 1):
+            self.km._kernels[kernel_id] = DummyKernel(pid, now - timedelta(minutes=10 - pid))
+        # 900 MB in use, 400 MB more than the threshold
+        self.memory = (1000 * MB, 100 * MB)
+        # not current, to leave the loop of the tests after these unchanged
+        self.loop = IOLoop(make_current=False)
+        self.addCleanup(partial(self.loop.close, all_fds=True))
+
+    def shutdown_kernel(self, kernel_id):
+        future = self.shutdowns[kernel_id] = Future()
+        return future
+
+    def cull(self):
+        @gen.coroutine
+        def run():
+            with patch('notebook.services.kernels.kernelmanager.host_memory', lambda: self.memory), \
+                    patch('notebook.services.kernels.kernelmanager.process_rss', self.rss.get):
+                self.km.cull_kernels_for_memory()
+        self.loop.run_sync(run)
+
+    def test_cull_least_recently_active(self):
+        self.cull()
+        self.assertEqual(sorted(self.shutdowns), ['a', 'b'])
+        # the memory of the kernels being culled is counted as freed
+        self.cull()
+        self.assertEqual(sorted(self.shutdowns), ['a', 'b'])
+
+    def test_unknown_memory(self):
+        self.rss[2] = 0
+        self.cull()
+        self.assertEqual(sorted(self.shutdowns), ['a'])
@@ -0,0 +1,57 @@
+"""Tests for the pool of idle kernels."""
+
+import os
+from unittest import TestCase
+
+from ..kernelpool import KernelPool
+from ..resources import process_rss
+
+
+class TestKernelPool(TestCase):
+
+    def test_claim(self):
+        pool = KernelPool({'python3': 2})
+        self.assertEqual(pool.needed('python3'), 2)
+        self.assertEqual(pool.needed('ir'), 0)
+        pool.record_start('python3', 'a')
+        pool.record_start('python3', 'b')
+        self.assertEqual(pool.needed('python3'), 0)
+        self.assertIn('b', pool)
+        pool.add('python3', 'a')
+        pool.failed('python3', 'b')
+        self.assertNotIn('b', pool)
+        self.assertEqual(pool.needed('python3'), 1)
+        self.assertIn('a', pool)
+
+        self.assertEqual(pool.claim('ir'), None)
+        self.assertEqual(pool.claim('python3'), 'a')
+        self.assertNotIn('a', pool)
+        self.assertEqual(pool.claim('python3'), None)
+        stats = pool.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual((stats['idle'], stats['starting']), (0, 0))
+
+    def test_discard(self):
+        pool = KernelPool({'python3': 2})
+        pool.record_start('python3', 'a')
+        pool.add('python3', 'a')
+        self.assertTrue(pool.discard('a'))
+        self.assertFalse(pool.discard('a'))
+        self.assertEqual(pool.claim('python3'), None)
+
+    def test_max_memory(self):
+        pool = KernelPool({'python3': 2}, max_memory=1)
+        pool.record_start('python3', 'a')
+        pool.add('python3', 'a', pid=os.getpid())
+        if process_rss(os.getpid()):
+            self.assertEqual(pool.needed('python3'), 0)
+            self.assertGreater(pool.stats()['memory'], 0)
+
+    def test_close(self):
+        pool = KernelPool({'python3': 2})
+        pool.record_start('python3', 'a')
+        pool.add('python3', 'a')
+        pool.close()
+        self.assertEqual(pool.needed('python3'), 0)
+        self.assertEqual(pool.claim('python3'), None)
+        self.assertTrue(pool.discard('a'))
@@ -1,14 +1,23 @@
 """Test the kernels service API."""
 
 import json
+import sys
 import time
+from unittest import skipUnless
 
+from tornado import gen
 from tornado.httpclient import HTTPRequest
 from tornado.ioloop import IOLoop
 from tornado.websocket import websocket_connect
 
+from jupyter_client.jsonutil import date_default
 from jupyter_client.kernelspec import NATIVE_KERNEL_NAME
+from jupyter_client.session import Session
+from traitlets.config import Config
 
+from notebook.base.zmqhandlers import (
+    KERNEL_WS_PROTOCOL_V1, serialize_msg_to_ws_v1, deserialize_msg_from_ws_v1,
+)
 from notebook.utils import url_path_join
 from notebook.tests.launchnotebook import NotebookTestBase, assert_http_error
 
@@ -146,6 +155,9 @@ class KernelAPITest(NotebookTestBase):
         assert isinstance(kern1, dict)
         self.assertIn('id', kern1)
         self.assertEqual(kern1['id'], kid)
+        self.assertEqual(set(kern1['iopub_rates']), {
+            'msg_rate', 'data_rate', 'msgs_exceeded', 'data_exceeded',
+        })
 
         # Request a bad kernel id and check that a JSON
         # message is returned!
@@ -182,3 +194,215 @@ class KernelAPITest(NotebookTestBase):
                 break
         model = self.kern_api.get(kid).json()
         self.assertEqual(model['connections'], 0)
+
+    def test_iopub_shared(self):
+        kid = self.kern_api.start().json()['id']
+        loop = IOLoop()
+        req = HTTPRequest(
+            url_path_join(self.base_url().replace('http', 'ws', 1), 'api/kernels', kid, 'channels'),
+            headers=self.auth_headers(),
+        )
+
+        @gen.coroutine
+        def read_stream(ws):
+            while True:
+                msg = yield ws.read_message()
+                msg = json.loads(msg)
+                if msg['msg_type'] == 'stream':
+                    raise gen.Return(msg)
+
+        @gen.coroutine
+        def run():
+            ws1 = yield websocket_connect(req, io_loop=loop)
+            ws2 = yield websocket_connect(req, io_loop=loop)
+            session = Session()
+            msg = session.msg('execute_request', content={
+                'code': 'print("hi")', 'silent': False,
+            })
+            msg['channel'] = 'shell'
+            ws1.write_message(json.dumps(msg, default=date_default))
+            # the output is received by both connections
+            msgs = yield [read_stream(ws1), read_stream(ws2)]
+            ws1.close()
+            ws2.close()
+            raise gen.Return(msgs)
+
+        msgs = loop.run_sync(run, timeout=30)
+        for msg in msgs:
+            self.assertEqual(msg['content']['text'], 'hi\n')
+            self.assertEqual(msg['channel'], 'iopub')
+            self.assertEqual(msg['buffers'], [])
+
+    def test_iopub_coalesce(self):
+        kid = self.kern_api.start().json()['id']
+        loop = IOLoop()
+        req = HTTPRequest(
+            url_path_join(self.base_url().replace('http', 'ws', 1), 'api/kernels', kid, 'channels'),
+            headers=self.auth_headers(),
+        )
+        code = '\n'.join([
+            'import sys, time',
+            'for i in range(50):',
+            '    print(i)',
+            '    sys.stdout.flush()',
+            '    time.sleep(0.002)',
+        ])
+
+        @gen.coroutine
+        def run():
+            ws = yield websocket_connect(req, io_loop=loop)
+            session = Session()
+            msg = session.msg('execute_request', content={'code': code, 'silent': False})
+            msg['channel'] = 'shell'
+            ws.write_message(json.dumps(msg, default=date_default))
+            texts = []
+            while True:
+                reply = json.loads((yield ws.read_message()))
+                if reply['parent_header'].get('msg_id') != msg['header']['msg_id']:
+                    continue
+                if reply['msg_type'] == 'stream':
+                    texts.append(reply['content']['text'])
+                elif reply['msg_type'] == 'status' and reply['content']['execution_state'] == 'idle':
+                    break
+            ws.close()
+            raise gen.Return(texts)
+
+        texts = loop.run_sync(run, timeout=30)
+        self.assertEqual(''.join(texts), ''.join('%i\n' % i for i in range(50)))
+        self.assertLess(len(texts), 50)
+
+    def test_ws_v1(self):
+        kid = self.kern_api.start().json()['id']
+        loop = IOLoop()
+        headers = self.auth_headers()
+        headers['Sec-WebSocket-Protocol'] = KERNEL_WS_PROTOCOL_V1
+        req = HTTPRequest(
+            url_path_join(self.base_url().replace('http', 'ws', 1), 'api/kernels', kid, 'channels'),
+            headers=headers,
+        )
+
+        @gen.coroutine
+        def run():
+            ws = yield websocket_connect(req, io_loop=loop)
+            session = Session()
+            msg = session.msg('execute_request', content={'code': 'print("hi")', 'silent': False})
+            msg_list = [json.dumps(msg[key], default=date_default).encode('utf8')
+                for key in ('header', 'parent_header', 'metadata', 'content')]
+            ws.write_message(serialize_msg_to_ws_v1(msg_list, 'shell'), binary=True)
+            replies = []
+            while True:
+                ws_msg = yield ws.read_message()
+                self.assertIsInstance(ws_msg, bytes)
+                channel, msg_list = deserialize_msg_from_ws_v1(ws_msg)
+                header = json.loads(msg_list[0].tobytes().decode('utf8'))
+                content = json.loads(msg_list[3].tobytes().decode('utf8'))
+                replies.append((channel, header['msg_type'], content))
+                if header['msg_type'] == 'execute_reply':
+                    break
+            ws.close()
+            raise gen.Return(replies)
+
+        replies = loop.run_sync(run, timeout=30)
+        self.assertIn(('iopub', 'stream', {'name': 'stdout', 'text': 'hi\n'}), replies)
+        self.assertEqual(replies[-1][0], 'shell')
+        self.assertEqual(replies[-1][2]['status'], 'ok')
+
+
+class KernelCompressionTest(NotebookTestBase):
+    """Test compressed websockets, with small messages sent uncompressed"""
+
+    config = Config()
+    config.NotebookApp.websocket_compression_options = {'min_size': 256}
+
+    def test_compression(self):
+        kid = KernelAPI(self.request, base_url=self.base_url(),
+            headers=self.auth_headers()).start().json()['id']
+        loop = IOLoop()
+        req = HTTPRequest(
+            url_path_join(self.base_url().replace('http', 'ws', 1), 'api/kernels', kid, 'channels'),
+            headers=self.auth_headers(),
+        )
+
+        @gen.coroutine
+        def run():
+            ws = yield websocket_connect(req, io_loop=loop, compression_options={})
+            session = Session()
+            msg = session.msg('execute_request', content={
+                'code': 'print("hi"); print("x" * 1000)', 'silent': False,
+            })
+            msg['channel'] = 'shell'
+            ws.write_message(json.dumps(msg, default=date_default))
+            text = ''
+            while len(text) < 1004:
+                reply = json.loads((yield ws.read_message()))
+                if reply['msg_type'] == 'stream':
+                    text += reply['content']['text']
+            ws.close()
+            raise gen.Return(text)
+
+        text = loop.run_sync(run, timeout=30)
+        self.assertEqual(text, 'hi\n' + 'x' * 1000 + '\n')
+
+
+class KernelCullingTest(NotebookTestBase):
+    """Test kernel culling """
+
+    config = Config()
+    config.MappingKernelManager.cull_idle_timeout = 2
+    config.MappingKernelManager.cull_interval = 1
+
+    def setUp(self):
+        self.kern_api = KernelAPI(self.request,
+                                  base_url=self.base_url(),
+                                  headers=self.auth_headers(),
+                                  )
+
+    def test_cull_idle(self):
+        start = time.time()
+        kid = self.kern_api.start().json()['id']
+        for i in range(100):
+            if not self.kern_api.list().json():
+                break
+            time.sleep(0.1)
+        else:
+            self.fail("Kernel %s was not culled" % kid)
+        self.assertGreaterEqual(time.time() - start, 2)
+        self.assertNotIn(kid, self.notebook.kernel_manager._cull_queue)
+
+
+@skipUnless(sys.platform.startswith('linux'), "reads /proc")
+class KernelResourcesTest(NotebookTestBase):
+    """Test the sampling of the resources of kernels"""
+
+    config = Config()
+    config.MappingKernelManager.resource_sample_interval = 0.2
+
+    def setUp(self):
+        self.kern_api = KernelAPI(self.request,
+                                  base_url=self.base_url(),
+                                  headers=self.auth_headers(),
+                                  )
+
+    def tearDown(self):
+        for k in self.kern_api.list().json():
+            self.kern_api.shutdown(k['id'])
+
+    def test_resources(self):
+        kid = self.kern_api.start().json()['id']
+        for i in range(50):
+            model = self.kern_api.get(kid).json()
+            if model.get('resources', {}).get('cpu_percent') is not None:
+                break
+            time.sleep(0.1)
+        else:
+            self.fail("Kernel %s was not sampled" % kid)
+        resources = model['resources']
+        self.assertEqual(set(resources), {'cpu_percent', 'rss', 'threads', 'fds'})
+        self.assertGreater(resources['rss'], 0)
+        self.assertGreater(resources['fds'], 0)
+
+        stats = self.kern_api._req('GET', 'resources').json()
+        self.assertEqual(stats['kernels'], 1)
+        self.assertEqual(stats['sampled'], 1)
+        self.assertGreater(stats['rss'], 0)
+        self.assertIn('msg_rate', stats)
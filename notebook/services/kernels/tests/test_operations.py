@@ -0,0 +1,58 @@
+"""Tests for the queue of operations on kernels."""
+
+from unittest import TestCase
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+from ..operations import KernelOperationQueue
+
+
+class TestKernelOperationQueue(TestCase):
+
+    def test_limit(self):
+        queue = KernelOperationQueue(limit=2)
+        started = []
+        # created in run, to belong to the loop running it
+        futures = []
+
+        def operation(i):
+            started.append(i)
+            return futures[i]
+
+        @gen.coroutine
+        def run():
+            futures.extend(Future() for i in range(3))
+            results = [queue.run('shutdown', operation, i) for i in range(3)]
+            yield gen.moment
+            self.assertEqual(started, [0, 1])
+            self.assertEqual(queue.stats()['running'], 2)
+            self.assertEqual(queue.stats()['queued'], 1)
+            futures[1].set_result('b')
+            self.assertEqual((yield results[1]), 'b')
+            yield gen.moment
+            self.assertEqual(started, [0, 1, 2])
+            self.assertEqual(queue.stats()['running'], 2)
+            futures[0].set_exception(RuntimeError())
+            futures[2].set_result('c')
+            with self.assertRaises(RuntimeError):
+                yield results[0]
+            self.assertEqual((yield results[2]), 'c')
+
+        IOLoop().run_sync(run)
+        stats = queue.stats()
+        self.assertEqual(stats['shutdown'], 2)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual((stats['running'], stats['queued']), (0, 0))
+
+    def test_unlimited(self):
+        queue = KernelOperationQueue()
+
+        @gen.coroutine
+        def run():
+            results = yield [queue.run('start', lambda i=i: i) for i in range(20)]
+            raise gen.Return(results)
+
+        self.assertEqual(IOLoop().run_sync(run), list(range(20)))
+        self.assertEqual(queue.stats()['start'], 20)
@@ -0,0 +1,70 @@
+"""Tests for the IOPub rate limiter."""
+
+from unittest import TestCase
+
+from jupyter_client.session import Session
+
+from notebook.base.zmqhandlers import deserialize_header
+from ..ratelimiter import IOPubRateLimiter
+
+
+class TestIOPubRateLimiter(TestCase):
+
+    def setUp(self):
+        self.session = Session()
+        self.now = 0
+        self.limiter = IOPubRateLimiter(msg_rate_limit=10, data_rate_limit=10000, window=1)
+        self.limiter._now = lambda: self.now
+
+    def msg(self, msg_type, content, buffers=None):
+        msg = self.session.msg(msg_type, content=content)
+        msg_list = self.session.serialize(msg) + (buffers or [])
+        idents, msg_list = self.session.feed_identities(msg_list)
+        return deserialize_header(self.session, msg_list)
+
+    def test_msg_rate(self):
+        limiter = self.limiter
+        msg = self.msg('display_data', {'data': {}, 'metadata': {}})
+        for i in range(10):
+            self.assertTrue(limiter.record(msg))
+        self.assertFalse(limiter.record(msg))
+        self.assertTrue(limiter.msgs_exceeded)
+        # status messages are never limited
+        self.assertTrue(limiter.record(self.msg('status', {'execution_state': 'busy'})))
+        rates = limiter.rates()
+        self.assertEqual(rates['msg_rate'], 10)
+        self.assertTrue(rates['msgs_exceeded'])
+
+        # resumes below 80% of the limit, once the counts expire
+        self.now = 1
+        self.assertEqual(limiter.rates()['msg_rate'], 0)
+        self.assertTrue(limiter.record(msg))
+        self.assertFalse(limiter.msgs_exceeded)
+
+    def test_data_rate(self):
+        limiter = self.limiter
+        msg = self.msg('display_data', {'data': {}, 'metadata': {}}, buffers=[b'x' * 6000])
+        self.assertTrue(limiter.record(msg))
+        self.assertGreater(limiter.rates()['data_rate'], 6000)
+        self.assertFalse(limiter.record(msg))
+        self.assertTrue(limiter.data_exceeded)
+        # an idle status resets the counts
+        limiter.record(self.msg('status', {'execution_state': 'idle'}))
+        self.assertFalse(limiter.exceeded)
+        self.assertEqual(limiter.rates()['data_rate'], 0)
+
+    def test_coalesced(self):
+        limiter = IOPubRateLimiter(msg_rate_limit=10, data_rate_limit=10000, window=1, coalesced=True)
+        limiter._now = lambda: self.now
+        stream = self.msg('stream', {'name': 'stdout', 'text': 'x'})
+        # coalesced messages are only limited by their data
+        for i in range(20):
+            self.assertTrue(limiter.record(stream))
+        self.assertFalse(limiter.msgs_exceeded)
+        self.assertEqual(limiter.rates()['msg_rate'], 0)
+        self.assertGreater(limiter.rates()['data_rate'], 0)
+        big = self.msg('stream', {'name': 'stdout', 'text': 'x' * 10000})
+        self.assertFalse(limiter.record(big))
+        self.assertTrue(limiter.data_exceeded)
+        self.assertFalse(limiter.counts_messages('stream'))
+        self.assertTrue(limiter.counts_messages('display_data'))
@@ -0,0 +1,113 @@
+"""Tests for the replay buffer."""
+
+from unittest import TestCase
+
+from jupyter_client.session import Session
+
+from notebook.base.zmqhandlers import deserialize_header
+from ..replaybuffer import ReplayBuffer, SpillRing
+
+
+class TestSpillRing(TestCase):
+
+    def test_ring(self):
+        ring = SpillRing(10)
+        self.assertEqual(ring.push(b'aaaa'), 0)
+        self.assertEqual(ring.push(b'bbbb'), 0)
+        # wraps around, dropping the oldest record
+        self.assertEqual(ring.push(b'ccc'), 1)
+        self.assertEqual(len(ring), 2)
+        self.assertEqual(ring.bytes, 7)
+        self.assertEqual(ring.push(b'x' * 11), 1)
+        self.assertEqual(ring.pop(), b'bbbb')
+        self.assertEqual(ring.pop(), b'ccc')
+        self.assertEqual(len(ring), 0)
+        ring.close()
+
+    def test_wrap_from_tail(self):
+        ring = SpillRing(100)
+        records = [c * n for c, n in zip([b'a', b'b', b'c', b'd', b'e'], [80, 20, 30, 30, 50])]
+        self.assertEqual([ring.push(r) for r in records[:4]], [0, 0, 1, 0])
+        # wrapping drops the records left at the tail, and those overwritten
+        self.assertEqual(ring.push(records[4]), 3)
+        self.assertEqual(len(ring), 1)
+        self.assertEqual(ring.bytes, 50)
+        self.assertEqual(ring.pop(), records[4])
+        ring.close()
+
+
+class TestReplayBuffer(TestCase):
+
+    def setUp(self):
+        self.session = Session()
+        self.parent = self.session.msg_header('execute_request')
+
+    def raw(self, msg_type, content):
+        msg = self.session.msg(msg_type, content=content, parent=self.parent)
+        idents, msg_list = self.session.feed_identities(self.session.serialize(msg))
+        return deserialize_header(self.session, msg_list)
+
+    def stream(self, text, name='stdout'):
+        return self.raw('stream', {'name': name, 'text': text})
+
+    def update(self, display_id, data):
+        return self.raw('update_display_data', {
+            'data': {'text/plain': data}, 'metadata': {},
+            'transient': {'display_id': display_id},
+        })
+
+    def replay(self, buf):
+        return [(channel, msg['msg_type'], msg['content']) for channel, msg in buf]
+
+    def test_collapse_stream(self):
+        buf = ReplayBuffer()
+        for i in range(3):
+            buf.append('iopub', self.stream(u'%i\n' % i))
+        buf.append('iopub', self.stream(u'error\n', name='stderr'))
+        buf.append('iopub', self.stream(u'3\n'))
+        self.assertEqual(len(buf), 3)
+        self.assertEqual(buf.stats()['collapsed'], 2)
+        self.assertEqual(self.replay(buf), [
+            ('iopub', 'stream', {'name': 'stdout', 'text': u'0\n1\n2\n'}),
+            ('iopub', 'stream', {'name': 'stderr', 'text': u'error\n'}),
+            ('iopub', 'stream', {'name': 'stdout', 'text': u'3\n'}),
+        ])
+        self.assertEqual(len(buf), 0)
+        self.assertEqual(buf.stats()['bytes'], 0)
+
+    def test_latest_display_update(self):
+        buf = ReplayBuffer()
+        buf.append('iopub', self.update('a', '1'))
+        buf.append('iopub', self.update('b', '1'))
+        buf.append('iopub', self.update('a', '2'))
+        buf.append('shell', [b'reply'])
+        self.assertEqual(len(buf), 3)
+        replayed = list(buf)
+        self.assertEqual([channel for channel, msg in replayed], ['iopub', 'iopub', 'shell'])
+        self.assertEqual([msg['content']['data'] for channel, msg in replayed[:2]], [
+            {'text/plain': '1'}, {'text/plain': '2'},
+        ])
+        self.assertEqual(replayed[2][1], [b'reply'])
+
+    def test_drop(self):
+        buf = ReplayBuffer(max_messages=2)
+        for i in range(4):
+            buf.append('shell', [b'%i' % i])
+        self.assertEqual(buf.stats()['dropped'], 2)
+        self.assertEqual(list(buf), [('shell', [b'2']), ('shell', [b'3'])])
+
+    def test_spill(self):
+        buf = ReplayBuffer(max_messages=1, spill_bytes=1024)
+        buf.append('shell', [b'0', b'reply'])
+        buf.append('iopub', self.update('a', '1'))
+        buf.append('iopub', self.stream(u'hi'))
+        stats = buf.stats()
+        self.assertEqual(stats['spilled'], 2)
+        self.assertEqual(stats['spilled_messages'], 2)
+        self.assertEqual(stats['messages'], 1)
+        self.assertEqual(len(buf), 3)
+        replayed = list(buf)
+        self.assertEqual(replayed[0], ('shell', [b'0', b'reply']))
+        self.assertEqual(replayed[1][1]['content']['data'], {'text/plain': '1'})
+        self.assertEqual(replayed[2][1]['content']['text'], u'hi')
+        buf.close()
@@ -0,0 +1,35 @@
+"""Tests for the resources of kernels."""
+
+import os
+import sys
+from unittest import TestCase, skipUnless
+
+from ..resources import ResourceSampler, host_memory, process_rss
+
+
+@skipUnless(sys.platform.startswith('linux'), "reads /proc")
+class TestResources(TestCase):
+
+    def test_process_rss(self):
+        self.assertGreater(process_rss(os.getpid()), 0)
+
+    def test_host_memory(self):
+        total, available = host_memory()
+        self.assertGreater(total, 0)
+        self.assertGreater(available, 0)
+        self.assertLessEqual(available, total)
+
+    def test_sampler(self):
+        sampler = ResourceSampler()
+        pid = os.getpid()
+        sampler.sample({'a': pid, 'b': 2 ** 22 + 1}, now=0)
+        self.assertIsNone(sampler.get('b'))
+        sample = sampler.get('a')
+        self.assertIsNone(sample['cpu_percent'])
+        self.assertGreater(sample['rss'], 0)
+        self.assertGreaterEqual(sample['threads'], 1)
+        self.assertGreater(sample['fds'], 0)
+        sampler.sample({'a': pid}, now=1)
+        self.assertGreaterEqual(sampler.get('a')['cpu_percent'], 0)
+        sampler.sample({})
+        self.assertIsNone(sampler.get('a'))
@@ -16,7 +16,9 @@ from tornado import gen, web
 
 from traitlets.config.configurable import LoggingConfigurable
 from ipython_genutils.py3compat import unicode_type
-from traitlets import Instance
+from traitlets import Instance, Undefined, observe
+
+from .sessionstore import SessionStore
 
 
 class SessionManager(LoggingConfigurable):
@@ -24,18 +26,38 @@ class SessionManager(LoggingConfigurable):
     kernel_manager = Instance('notebook.services.kernels.kernelmanager.MappingKernelManager')
     contents_manager = Instance('notebook.services.contents.manager.ContentsManager')
     
-    # Session database initialized below
+    # Sessions are looked up in the store, and recorded in the database
+    # initialized below for subclasses querying it
+    _store = Instance(SessionStore, ())
     _cursor = None
     _connection = None
     _columns = {'session_id', 'path', 'name', 'type', 'kernel_id'}
-    
+
+    @observe('kernel_manager')
+    def _kernel_manager_changed(self, change):
+        if change['old'] not in (None, Undefined):
+            change['old'].remove_removal_callback(self._kernel_removed)
+        if change['new'] is not None:
+            change['new'].add_removal_callback(self._kernel_removed)
+
+    def _kernel_removed(self, kernel_id):
+        """Delete the sessions of a kernel which was shut down or died"""
+        for row in self._store.find(kernel_id=kernel_id):
+            self._delete_row(row['session_id'])
+
+    def _delete_row(self, session_id):
+        self._store.remove(session_id)
+        self.cursor.execute("DELETE FROM session WHERE session_id=?", (session_id,))
+
     @property
     def cursor(self):
         """Start a cursor and create a database called 'session'"""
         if self._cursor is None:
             self._cursor = self.connection.cursor()
             self._cursor.execute("""CREATE TABLE session 
-                (session_id, path, name, type, kernel_id)""")
+                (session_id PRIMARY KEY, path, name, type, kernel_id)""")
+            self._cursor.execute("CREATE INDEX session_path ON session (path)")
+            self._cursor.execute("CREATE INDEX session_kernel_id ON session (kernel_id)")
         return self._cursor
 
     @property
@@ -48,6 +70,8 @@ class SessionManager(LoggingConfigurable):
     
     def close(self):
         """Close the sqlite connection"""
+        if self.kernel_manager is not None:
+            self.kernel_manager.remove_removal_callback(self._kernel_removed)
         if self._cursor is not None:
             self._cursor.close()
             self._cursor = None
@@ -58,12 +82,12 @@ class SessionManager(LoggingConfigurable):
 
     def session_exists(self, path):
         """Check to see if the session of a given name exists"""
-        self.cursor.execute("SELECT * FROM session WHERE path=?", (path,))
-        reply = self.cursor.fetchone()
-        if reply is None:
-            return False
-        else:
-            return True
+        for row in self._store.find(path=path):
+            if row['kernel_id'] in self.kernel_manager:
+                return True
+            # the kernel was removed without notifying us
+            self._delete_row(row['session_id'])
+        return False
 
     def new_session_id(self):
         "Create a uuid for a new session"
@@ -122,6 +146,8 @@ class SessionManager(LoggingConfigurable):
         self.cursor.execute("INSERT INTO session VALUES (?,?,?,?,?)",
             (session_id, path, name, type, kernel_id)
         )
+        self._store.add(dict(session_id=session_id, path=path, name=name,
+                             type=type, kernel_id=kernel_id))
         return self.get_session(session_id=session_id)
 
     def get_session(self, **kwargs):
@@ -145,20 +171,12 @@ class SessionManager(LoggingConfigurable):
         if not kwargs:
             raise TypeError("must specify a column to query")
 
-        conditions = []
         for column in kwargs.keys():
             if column not in self._columns:
                 raise TypeError("No such column: %r", column)
-            conditions.append("%s=?" % column)
 
-        query = "SELECT * FROM session WHERE %s" % (' AND '.join(conditions))
-
-        self.cursor.execute(query, list(kwargs.values()))
-        try:
-            row = self.cursor.fetchone()
-        except KeyError:
-            # The kernel is missing, so the session just got deleted.
-            row = None
+        rows = self._store.find(**kwargs)
+        row = rows[0] if rows else None
 
         if row is None:
             q = []
@@ -197,15 +215,16 @@ class SessionManager(LoggingConfigurable):
             sets.append("%s=?" % column)
         query = "UPDATE session SET %s WHERE session_id=?" % (', '.join(sets))
         self.cursor.execute(query, list(kwargs.values()) + [session_id])
+        self._store.update(session_id, **kwargs)
 
     def row_to_model(self, row):
         """Takes sqlite database session row and turns it into a dictionary"""
         if row['kernel_id'] not in self.kernel_manager:
-            # The kernel was killed or died without deleting the session.
+            # The kernel was removed without notifying us, e.g. by a kernel
+            # manager overriding remove_kernel.
             # We can't use delete_session here because that tries to find
             # and shut down the kernel.
-            self.cursor.execute("DELETE FROM session WHERE session_id=?", 
-                                (row['session_id'],))
+            self._delete_row(row['session_id'])
             raise KeyError
 
         model = {
@@ -223,11 +242,8 @@ class SessionManager(LoggingConfigurable):
     def list_sessions(self):
         """Returns a list of dictionaries containing all the information from
         the session database"""
-        c = self.cursor.execute("SELECT * FROM session")
         result = []
-        # We need to use fetchall() here, because row_to_model can delete rows,
-        # which messes up the cursor if we're iterating over rows.
-        for row in c.fetchall():
+        for row in self._store:
             try:
                 result.append(self.row_to_model(row))
             except KeyError:
@@ -239,4 +255,4 @@ class SessionManager(LoggingConfigurable):
         """Deletes the row in the session database with given session_id"""
         session = self.get_session(session_id=session_id)
         yield gen.maybe_future(self.kernel_manager.shutdown_kernel(session['kernel']['id']))
-        self.cursor.execute("DELETE FROM session WHERE session_id=?", (session_id,))
+        self._delete_row(session_id)
@@ -0,0 +1,104 @@
+"""
+An in-memory store of sessions, indexed by id, path and kernel id.
+"""
+
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+
+from collections import OrderedDict
+
+
+class SessionStore(object):
+    """The rows of the sessions, by session_id, oldest first
+
+    Rows are dicts of the columns. They are also indexed by the columns
+    in `indexed`, so that finding the sessions of a path or a kernel
+    does not scan the others.
+    """
+
+    columns = ('session_id', 'path', 'name', 'type', 'kernel_id')
+    indexed = ('path', 'kernel_id')
+
+    def __init__(self):
+        # session_id: row
+        self._rows = OrderedDict()
+        # column: {value: {session_id: None}}, ordered as the rows
+        self._indexes = dict((column, {}) for column in self.indexed)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, session_id):
+        return session_id in self._rows
+
+    def __iter__(self):
+        """The rows, oldest first"""
+        return iter(list(self._rows.values()))
+
+    def _index(self, row):
+        for column, index in self._indexes.items():
+            index.setdefault(row[column], OrderedDict())[row['session_id']] = None
+
+    def _unindex(self, row):
+        for column, index in self._indexes.items():
+            ids = index.get(row[column])
+            if ids is not None:
+                ids.pop(row['session_id'], None)
+                if not ids:
+                    del index[row[column]]
+
+    def add(self, row):
+        """Add a row, replacing the row with the same session_id"""
+        row = dict((column, row.get(column)) for column in self.columns)
+        self.remove(row['session_id'])
+        self._rows[row['session_id']] = row
+        self._index(row)
+        return row
+
+    def update(self, session_id, **kwargs):
+        """Change the columns of a row
+
+        Raises KeyError if there is no such row.
+        """
+        row = self._rows[session_id]
+        if kwargs.get('session_id', session_id) != session_id:
+            # changing the key moves the row to the end
+            row = dict(row, **kwargs)
+            self.remove(session_id)
+            return self.add(row)
+        self._unindex(row)
+        row.update(kwargs)
+        self._index(row)
+        return row
+
+    def remove(self, session_id):
+        """Remove a row, if there is one. Returns it, or None."""
+        row = self._rows.pop(session_id, None)
+        if row is not None:
+            self._unindex(row)
+        return row
+
+    def find(self, **kwargs):
+        """The rows matching all the given values of columns, oldest first"""
+        for column in kwargs:
+            if column not in self.columns:
+                raise TypeError("No such column: %r" % column)
+        if 'session_id' in kwargs:
+            row = self._rows.get(kwargs['session_id'])
+            candidates = [] if row is None else [row]
+        else:
+            # the rows of the smallest index matching the query
+            ids = None
+            for column in self.indexed:
+                if column in kwargs:
+                    found = self._indexes[column].get(kwargs[column], ())
+                    if ids is None or len(found) < len(ids):
+                        ids = found
+            if ids is None:
+                candidates = self._rows.values()
+            else:
+                candidates = [self._rows[session_id] for session_id in ids]
+        return [
+            row for row in candidates
+            if all(row[column] == value for column, value in kwargs.items())
+        ]
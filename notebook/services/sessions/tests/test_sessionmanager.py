@@ -99,6 +99,20 @@ class TestSessionManager(TestCase):
         listed = sm.list_sessions()
         self.assertEqual(listed, [])
 
+    def test_kernel_removed(self):
+        sm = self.sm
+        sessions = self.create_sessions(
+            dict(path='/path/to/1/test1.ipynb', kernel_name='python'),
+            dict(path='/path/to/2/test2.ipynb', kernel_name='python'),
+        )
+        # the sessions of a kernel are deleted as soon as it is removed
+        sm.kernel_manager.remove_kernel(sessions[0]['kernel']['id'])
+        self.assertFalse(sm.session_exists('/path/to/1/test1.ipynb'))
+        self.assertNotIn(sessions[0]['id'], sm._store)
+        self.assertTrue(sm.session_exists('/path/to/2/test2.ipynb'))
+        rows = sm.cursor.execute("SELECT session_id FROM session").fetchall()
+        self.assertEqual([row['session_id'] for row in rows], [sessions[1]['id']])
+
     def test_list_sessions(self):
         sm = self.sm
         sessions = self.create_sessions(
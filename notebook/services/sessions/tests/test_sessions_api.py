@@ -9,6 +9,9 @@ import requests
 import shutil
 import time
 
+from jupyter_client.kernelspec import NATIVE_KERNEL_NAME
+from traitlets.config import Config
+
 pjoin = os.path.join
 
 from notebook.utils import url_path_join
@@ -16,6 +19,18 @@ from notebook.tests.launchnotebook import NotebookTestBase, assert_http_error
 from nbformat.v4 import new_notebook
 from nbformat import write
 
+
+def without_samples(model):
+    """A session or kernel model without the sampled resources of the kernel,
+    which change between requests
+    """
+    model = dict(model)
+    if 'kernel' in model:
+        model['kernel'] = without_samples(model['kernel'])
+    model.pop('resources', None)
+    return model
+
+
 class SessionAPI(object):
     """Wrapper for notebook API calls."""
     def __init__(self, request):
@@ -123,12 +138,12 @@ class SessionAPITest(NotebookTestBase):
         self.assertEqual(resp.headers['Location'], self.url_prefix + 'api/sessions/{0}'.format(newsession['id']))
 
         sessions = self.sess_api.list().json()
-        self.assertEqual(sessions, [newsession])
+        self.assertEqual([without_samples(s) for s in sessions], [without_samples(newsession)])
 
         # Retrieve it
         sid = newsession['id']
         got = self.sess_api.get(sid).json()
-        self.assertEqual(got, newsession)
+        self.assertEqual(without_samples(got), without_samples(newsession))
 
     def test_create_file_session(self):
         resp = self.sess_api.create('foo/nb1.py', type='file')
@@ -167,12 +182,12 @@ class SessionAPITest(NotebookTestBase):
         self.assertEqual(resp.headers['Location'], self.url_prefix + 'api/sessions/{0}'.format(newsession['id']))
 
         sessions = self.sess_api.list().json()
-        self.assertEqual(sessions, [newsession])
+        self.assertEqual([without_samples(s) for s in sessions], [without_samples(newsession)])
 
         # Retrieve it
         sid = newsession['id']
         got = self.sess_api.get(sid).json()
-        self.assertEqual(got, newsession)
+        self.assertEqual(without_samples(got), without_samples(newsession))
 
     def test_delete(self):
         newsession = self.sess_api.create('foo/nb1.ipynb').json()
@@ -227,7 +242,7 @@ class SessionAPITest(NotebookTestBase):
         kernel_list = r.json()
         after['kernel'].pop('last_activity')
         [ k.pop('last_activity') for k in kernel_list ]
-        self.assertEqual(kernel_list, [after['kernel']])
+        self.assertEqual([without_samples(k) for k in kernel_list], [without_samples(after['kernel'])])
 
     def test_modify_kernel_id(self):
         before = self.sess_api.create('foo/nb1.ipynb').json()
@@ -253,4 +268,44 @@ class SessionAPITest(NotebookTestBase):
 
         kernel.pop('last_activity')
         [ k.pop('last_activity') for k in kernel_list ]
-        self.assertEqual(kernel_list, [kernel])
+        self.assertEqual([without_samples(k) for k in kernel_list], [without_samples(kernel)])
+
+
+class KernelPoolSessionAPITest(SessionAPITest):
+    """Run the tests from SessionAPITest with a pool of kernels"""
+    config = Config()
+    config.MappingKernelManager.kernel_pool = {NATIVE_KERNEL_NAME: 1}
+
+    def wait_for_idle_kernel(self):
+        for i in range(100):
+            status = self.request('GET', 'api/status').json()
+            if status['kernel_pool']['idle']:
+                return status['kernel_pool']
+            time.sleep(0.1)
+        self.fail("No idle kernel in the pool")
+
+    def test_claim(self):
+        stats = self.wait_for_idle_kernel()
+        self.assertEqual(self.request('GET', 'api/kernels').json(), [])
+        km = self.notebook.kernel_manager
+        kernel_id = self.sess_api.create('foo/nb1.ipynb',
+            kernel_name=NATIVE_KERNEL_NAME).json()['kernel']['id']
+        status = self.request('GET', 'api/status').json()
+        self.assertEqual(status['kernel_pool']['hits'], stats['hits'] + 1)
+        self.assertEqual(status['kernels'], 1)
+        # the kernel restarts in the directory of the session
+        kernel = km.get_kernel(kernel_id)
+        self.assertEqual(kernel._launch_args['cwd'], pjoin(self.notebook_dir, 'foo'))
+        # the pool is replenished
+        self.wait_for_idle_kernel()
+
+    def test_idle_kernels_hidden(self):
+        self.wait_for_idle_kernel()
+        km = self.notebook.kernel_manager
+        kernel_id = list(km._kernel_pool._pids)[0]
+        # the idle kernels don't exist for the API until they are claimed
+        self.assertNotIn(kernel_id, km)
+        for method in ('GET', 'DELETE'):
+            r = self.request(method, 'api/kernels/%s' % kernel_id)
+            self.assertEqual(r.status_code, 404)
+        self.assertIn(kernel_id, km._kernel_pool)
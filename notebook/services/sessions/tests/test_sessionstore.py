@@ -0,0 +1,45 @@
+"""Tests for the store of sessions."""
+
+from unittest import TestCase
+
+from ..sessionstore import SessionStore
+
+
+class TestSessionStore(TestCase):
+
+    def setUp(self):
+        self.store = SessionStore()
+        for i in range(1000):
+            self.store.add(dict(session_id='s%i' % i, path='p%i' % i,
+                                type='notebook', kernel_id='k%i' % (i // 2)))
+
+    def ids(self, rows):
+        return [row['session_id'] for row in rows]
+
+    def test_find(self):
+        store = self.store
+        self.assertEqual(len(store), 1000)
+        self.assertEqual(self.ids(store.find(session_id='s10')), ['s10'])
+        self.assertEqual(self.ids(store.find(path='p10')), ['s10'])
+        self.assertEqual(self.ids(store.find(kernel_id='k5')), ['s10', 's11'])
+        self.assertEqual(self.ids(store.find(kernel_id='k5', path='p11')), ['s11'])
+        self.assertEqual(store.find(path='p10', type='file'), [])
+        self.assertEqual(store.find(path='nope'), [])
+        self.assertEqual(len(store.find(type='notebook')), 1000)
+        with self.assertRaises(TypeError):
+            store.find(bad='p10')
+
+    def test_update_remove(self):
+        store = self.store
+        store.update('s10', path='renamed', kernel_id='k0')
+        self.assertEqual(store.find(path='p10'), [])
+        self.assertEqual(self.ids(store.find(path='renamed')), ['s10'])
+        self.assertEqual(self.ids(store.find(kernel_id='k0')), ['s0', 's1', 's10'])
+        self.assertEqual(self.ids(store.find(kernel_id='k5')), ['s11'])
+        self.assertEqual(store.remove('s0')['path'], 'p0')
+        self.assertIsNone(store.remove('s0'))
+        self.assertNotIn('s0', store)
+        self.assertEqual(self.ids(store.find(kernel_id='k0')), ['s1', 's10'])
+        self.assertEqual(self.ids(store)[:2], ['s1', 's2'])
+        with self.assertRaises(KeyError):
+            store.update('s0', path='p0')
@@ -1,13 +1,21 @@
 """Test serialize/deserialize messages with buffers"""
 
+import json
 import os
 
 import nose.tools as nt
 
+from jupyter_client.jsonutil import date_default
 from jupyter_client.session import Session
 from ..base.zmqhandlers import (
     serialize_binary_message,
     deserialize_binary_message,
+    deserialize_header,
+    serialize_raw_message,
+    serialize_msg_to_ws_v1,
+    deserialize_msg_from_ws_v1,
+    KERNEL_WS_PROTOCOL_V1,
+    RawMessage,
 )
 
 def test_serialize_binary():
@@ -24,3 +32,98 @@ def test_deserialize_binary():
     bmsg = serialize_binary_message(msg)
     msg2 = deserialize_binary_message(bmsg)
     nt.assert_equal(msg2, msg)
+
+def _raw_message(s, buffers=None):
+    msg = s.msg('stream', content={'name': 'stdout', 'text': u'h\xe9llo'},
+                parent=s.msg_header('execute_request'))
+    msg_list = s.serialize(msg)
+    if buffers:
+        msg_list.extend(buffers)
+    idents, msg_list = s.feed_identities(msg_list)
+    return msg_list
+
+def test_raw_message():
+    s = Session(key=b'secret')
+    msg_list = _raw_message(s)
+    raw = deserialize_header(s, msg_list)
+    nt.assert_is_instance(raw, RawMessage)
+    nt.assert_equal(raw['msg_type'], 'stream')
+    nt.assert_equal(raw['content']['text'], u'h\xe9llo')
+    payload, binary = serialize_raw_message(raw, channel='iopub')
+    nt.assert_false(binary)
+    expected = Session(key=b'secret').deserialize(list(msg_list))
+    expected['channel'] = 'iopub'
+    expected = json.loads(json.dumps(expected, default=date_default))
+    nt.assert_equal(json.loads(payload.decode('utf8')), expected)
+
+def test_raw_message_signature():
+    s = Session(key=b'secret')
+    msg_list = _raw_message(s)
+    deserialize_header(s, msg_list)
+    with nt.assert_raises(ValueError):
+        # duplicate
+        deserialize_header(s, msg_list)
+    msg_list = _raw_message(Session(key=b'other'))
+    with nt.assert_raises(ValueError):
+        deserialize_header(s, msg_list)
+
+def test_raw_message_signature_first():
+    s = Session(key=b'secret')
+    msg_list = _raw_message(s)
+    # the header of an unsigned message isn't parsed
+    msg_list[1] = b'not json'
+    with nt.assert_raises(ValueError) as cm:
+        deserialize_header(s, msg_list)
+    nt.assert_in('Invalid Signature', str(cm.exception))
+
+def test_raw_message_fallback():
+    s = Session()
+    msg_list = _raw_message(s)
+    header = json.loads(msg_list[1].decode('utf8'))
+    header['version'] = '4.1'
+    msg_list[1] = json.dumps(header).encode('utf8')
+    msg_list[0] = s.sign(msg_list[1:5])
+    nt.assert_is_none(deserialize_header(s, msg_list))
+    # the signature is left for Session.deserialize to record
+    nt.assert_not_in(msg_list[0], s.digest_history)
+
+def test_raw_message_binary():
+    s = Session()
+    buffers = [os.urandom(3) for i in range(2)]
+    raw = deserialize_header(s, _raw_message(s, buffers))
+    payload, binary = serialize_raw_message(raw)
+    nt.assert_true(binary)
+    msg = deserialize_binary_message(payload)
+    nt.assert_equal([bytes(b) for b in msg['buffers']], buffers)
+    nt.assert_equal(msg['content']['text'], u'h\xe9llo')
+
+def test_deserialize_binary_zero_copy():
+    s = Session()
+    msg = s.msg('data_pub', content={'a': 'b'})
+    msg['buffers'] = [memoryview(os.urandom(2))]
+    msg2 = deserialize_binary_message(serialize_binary_message(msg))
+    nt.assert_is_instance(msg2['buffers'][0], memoryview)
+    nt.assert_equal(msg2['buffers'][0].tobytes(), msg['buffers'][0].tobytes())
+
+def test_ws_v1():
+    msg_list = [b'{"msg_id": "a"}', b'{}', b'{}', b'{"b": 1}', os.urandom(5)]
+    ws_msg = serialize_msg_to_ws_v1(msg_list, u'shell')
+    nt.assert_is_instance(ws_msg, bytes)
+    channel, msg_list2 = deserialize_msg_from_ws_v1(ws_msg)
+    nt.assert_equal(channel, u'shell')
+    nt.assert_true(all(isinstance(part, memoryview) for part in msg_list2))
+    nt.assert_equal([part.tobytes() for part in msg_list2], msg_list)
+
+def test_raw_message_ws_v1():
+    s = Session()
+    buffers = [os.urandom(3)]
+    msg_list = _raw_message(s, buffers)
+    raw = deserialize_header(s, msg_list)
+    payload, binary = serialize_raw_message(raw, 'iopub', subprotocol=KERNEL_WS_PROTOCOL_V1)
+    nt.assert_true(binary)
+    channel, msg_list2 = deserialize_msg_from_ws_v1(payload)
+    nt.assert_equal(channel, 'iopub')
+    nt.assert_equal([part.tobytes() for part in msg_list2], msg_list[1:])
+    # cached for each subprotocol
+    nt.assert_is(serialize_raw_message(raw, 'iopub', subprotocol=KERNEL_WS_PROTOCOL_V1)[0], payload)
+    nt.assert_false(serialize_raw_message(raw, 'iopub')[0] is payload)